@@ -9,25 +9,14 @@
 # MZP image files extraction utility
 # For more information, see Specifications/mzp_format.md
 
-import struct
 import sys
 import logging
 import argparse
 from pathlib import Path
-from struct import unpack
-from mzx.decomp_mzx0 import mzx0_decompress
+from struct import unpack_from
+from mzx.decomp_mzx0 import mzx0_decompress_buffer
 from _extract_mzp_tiles import MzpFile
-
-
-class ArchiveEntry:
-    def __init__(self, sector_offset, offset, sector_size_upper_boundary, size, number_of_entries):
-        self.sector_offset = sector_offset
-        self.offset = offset
-        self.sector_size_upper_boundary = sector_size_upper_boundary
-        self.size = size
-        self.real_size = (sector_size_upper_boundary - 1) // 0x20 * 0x10000 + size
-        data_start_offset = 6 + 2 + number_of_entries * 8
-        self.real_offset = data_start_offset + self.sector_offset * 0x800 + self.offset
+from lib.mrgd import MrgArchive
 
 
 #############################################################################
@@ -69,40 +58,32 @@ def extract_verb(args, file: Path):
     if args.ignore_extracted and file.with_suffix('.png').exists():
         return
 
-    with file.open('rb') as input_file:
-        header = input_file.read(6)
-        if header != b'mrgd00':
-            return
+    try:
+        mzp_archive = MrgArchive(file, hed_path=False, nam_path=False)
+    except ValueError:
+        return
 
+    with mzp_archive:
         logging.info('Extracting from ' + file.name)
-        logging.debug('header: {0}'.format(header.decode('ASCII')))
-
-        number_of_entries, = struct.unpack('<H', input_file.read(2))
-        logging.debug('found {0} entries'.format(number_of_entries))
-        if not number_of_entries:
+        logging.debug('header: mrgd00')
+        logging.debug('found {0} entries'.format(mzp_archive.record_count))
+        if not mzp_archive.entries:
             return
 
-        entries_descriptors = []
-        for i in range(number_of_entries):
-            sector_offset, offset, sector_size_upper_boundary, size = struct.unpack('<HHHH', input_file.read(8))
-            entries_descriptors.append(
-                ArchiveEntry(sector_offset, offset, sector_size_upper_boundary, size, number_of_entries))
-
         if args.bin:
-            extract_bin(file, input_file, entries_descriptors, args.notmzx)
+            extract_bin(file, mzp_archive, args.notmzx)
         else:
-            MzpFile(file, input_file, entries_descriptors)
+            MzpFile(file, mzp_archive.data, list(mzp_archive.entries))
 
 
-def extract_bin(file: Path, input_file, entries_descriptors, not_mzx):
+def extract_bin(file: Path, mzp_archive, not_mzx):
     output_dir = file.with_name(file.name + '-unpacked').with_suffix('')
 
     if not output_dir.is_dir():
         output_dir.mkdir()
 
-    for index, entry in enumerate(entries_descriptors):
-        input_file.seek(entry.real_offset)
-        data = input_file.read(entry.real_size)
+    for index, entry in enumerate(mzp_archive.entries):
+        data = mzp_archive.read(entry)
 
         # Desc
         if index == 0:
@@ -116,10 +97,8 @@ def extract_bin(file: Path, input_file, entries_descriptors, not_mzx):
             write_file(data, mzx_file_name)
         else:
             extract_file_name = output_dir.joinpath(file_name + '.ucp')
-            input_file.seek(entry.real_offset)
-            sig, size = unpack('<LL', input_file.read(0x8))
-            status, extract_data = mzx0_decompress(input_file, entry.real_size - 8, size)
-            write_file(extract_data, extract_file_name)
+            sig, size = unpack_from('<LL', data)
+            write_file(mzx0_decompress_buffer(data[8:], size), extract_file_name)
 
 
 def write_file(data, output_file_name):
@@ -25,9 +25,9 @@ import sys
 import zlib
 import logging
 from pathlib import Path
-from struct import unpack, pack
+from struct import unpack, unpack_from, pack
 from subprocess import call
-from mzx.decomp_mzx0 import mzx0_decompress
+from mzx.decomp_mzx0 import mzx0_decompress_buffer
 from lib.hep import hep_extract
 
 logger = logging.getLogger('MZP')
@@ -142,12 +142,21 @@ def is_indexed_bitmap(bmp_info):
 
 class MzpFile:
     def __init__(self, file: Path, data, entries_descriptors,
-                 plt_convert, extend):
+                 plt_convert, extend, interactive=True):
         self.file = file
         self.data = data
         self.entries_descriptors = entries_descriptors
         self.palette_convert = plt_convert
         self.extend = extend
+        self.interactive = interactive
+
+    def fail(self, message):
+        # console runs pause and exit as before, batch callers (interactive=False) get a ValueError per file
+        if not self.interactive:
+            raise ValueError(message)
+        logger.error(message)
+        call(["cmd", "/c", "pause"])
+        sys.exit(1)
 
     def extract_tiles(self):
         self.paletteblob = b''
@@ -176,9 +185,7 @@ class MzpFile:
         self.img_width = self.width - self.tile_x_count * self.tile_crop * 2
         self.img_height = self.height - self.tile_y_count * self.tile_crop * 2
         if self.bmp_type not in [0x01, 0x03, 0x08, 0x0B, 0x0C]:
-            logger.error("Unknown type 0x{:02X}".format(self.bmp_type))
-            call(["cmd", "/c", "pause"])
-            sys.exit(1)
+            self.fail("Unknown type 0x{:02X}".format(self.bmp_type))
 
         # 有索引
         if is_indexed_bitmap(self.bmp_type):
@@ -189,9 +196,7 @@ class MzpFile:
                 self.bitmap_bpp = 4
                 self.palette_count = 0x10  # 16 colors
             else:
-                logger.error("Unknown depth 0x{:02X}".format(self.bmp_depth))
-                call(["cmd", "/c", "pause"])
-                sys.exit(1)
+                self.fail("Unknown depth 0x{:02X}".format(self.bmp_depth))
 
             # extract palette
             if self.bmp_depth in [0x00, 0x10]:
@@ -238,9 +243,7 @@ class MzpFile:
                                 self.palettepng += (r + g + b)
                                 self.transpng += a
             else:
-                logger.error("Unsupported palette type 0x{:02X}".format(self.bmp_depth))
-                call(["cmd", "/c", "pause"])
-                sys.exit(1)
+                self.fail("Unsupported palette type 0x{:02X}".format(self.bmp_depth))
 
             # 4bpp补全索引至8bpp
             for i in range(self.palette_count, 0x100):
@@ -251,32 +254,22 @@ class MzpFile:
             if self.bmp_depth == 0x14:
                 self.bitmap_bpp = 24
             else:
-                logger.error("Unknown depth 0x{:02X}".format(self.bmp_depth))
-                call(["cmd", "/c", "pause"])
-                sys.exit(1)
+                self.fail("Unknown depth 0x{:02X}".format(self.bmp_depth))
         elif self.bmp_type == 0x0B:
             if self.bmp_depth == 0x14:
                 self.bitmap_bpp = 32
             else:
-                logger.error("Unknown depth 0x{:02X}".format(self.bmp_depth))
-                call(["cmd", "/c", "pause"])
-                sys.exit(1)
+                self.fail("Unknown depth 0x{:02X}".format(self.bmp_depth))
         elif self.bmp_type == 0x0C:
             self.hep_info = {"transparency":[], "unknown":[]}
             if self.bmp_depth == 0x11:
                 self.bitmap_bpp = 32
             else:
-                logger.error("Unknown depth 0x{:02X}".format(self.bmp_depth))
-                call(["cmd", "/c", "pause"])
-                sys.exit(1)
+                self.fail("Unknown depth 0x{:02X}".format(self.bmp_depth))
         elif self.bmp_type == 0x03:  # 'PEH' 8bpp + palette
-            logger.error("Unsupported type 0x{:02X} (PEH)".format(self.bmp_type))
-            call(["cmd", "/c", "pause"])
-            sys.exit(1)
+            self.fail("Unsupported type 0x{:02X} (PEH)".format(self.bmp_type))
         else:
-            logger.error("Unknown bmp type 0x{:02X} & depth 0x{:02X} pair".format(self.bmp_type, self.bmp_depth))
-            call(["cmd", "/c", "pause"])
-            sys.exit(1)
+            self.fail("Unknown bmp type 0x{:02X} & depth 0x{:02X} pair".format(self.bmp_type, self.bmp_depth))
 
         # Experimental, base https://github.com/loicfrance/mahoyo_tools/issues/7#issuecomment-2746356020
         # Tile transparency byte:
@@ -320,11 +313,12 @@ class MzpFile:
             # !Note: few mzp files have tile X*Y count > entries num, strangely
             raise IndexError(f"This mzp Tiles-num out of tile entries-num: {len(self.entries_descriptors)}.")
         entry = self.entries_descriptors[index if index < len(self.entries_descriptors) else (index-len(self.entries_descriptors))]
-        self.data.seek(entry.real_offset)
-        sig, size = unpack('<4sL', self.data.read(0x8))
+        # decode straight from the archive mapping, no copy of the compressed tile
+        tile_view = memoryview(self.data)[entry.real_offset:entry.real_offset + entry.real_size]
+        sig, size = unpack_from('<4sL', tile_view)
         assert sig == b'MZX0', f"Unkonwn signature: {sig}, usually won't happen this error."
-        status, dec_buf = mzx0_decompress(self.data, entry.real_size - 8, size)
-        dec_buf = dec_buf.read()
+        dec_buf = bytes(mzx0_decompress_buffer(tile_view[8:], size))
+        tile_view.release()
         # 4bpp index bitmap for 0x01 bmp type
         if self.bitmap_bpp == 4:
             tile_data = b''
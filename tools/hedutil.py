@@ -1,518 +1,842 @@
-#!/usr/bin/env python
-#
-# allpac.hed/.nam/.mrg extraction & creation utility
-# For more information, see EXTR hed.md, REIN hed.md and specs/hed_format.md
-"""hedutil version 1.1, Copyright (C) 2014 Nanashi3.
-
-hedutil comes with ABSOLUTELY NO WARRANTY.
-
-Script to unpack or repack a .hed/.nam/.mrg triple
-"""
-
-import os
-import errno
-import sys
-import argparse
-from sys import stderr
-from struct import unpack, unpack_from, pack
-import re
-import glob
-import yaml
-from pathlib import Path
-from collections import OrderedDict
-from base64 import b64encode
-
-
-class CustomException(Exception):
-    pass
-
-
-class CustHelpAction(argparse._HelpAction):
-    def __call__(self, parser, namespace, values, option_string=None):
-        parser.print_help()
-        for subparser_action in parser._actions:
-            if isinstance(subparser_action, argparse._SubParsersAction):
-                for choice, subparser in subparser_action.choices.items():
-                    print("\n\n== {} ==".format(choice))
-                    print(subparser.format_help())
-        parser.exit()
-
-
-def ordereddict_constructor(loader, node):
-    try:
-        omap = loader.construct_yaml_omap(node)
-        return OrderedDict(*omap)
-    except yaml.constructor.ConstructorError:
-        return loader.construct_yaml_seq(node)
-
-
-# def represent_ordereddict(dumper, data):
-#    value = []
-#
-#    for item_key, item_value in data.items():
-#        node_key = dumper.represent_data(item_key)
-#        node_value = dumper.represent_data(item_value)
-#
-#        value.append((node_key, node_value))
-#
-#    return yaml.nodes.MappingNode(u'tag:yaml.org,2002:map', value)
-
-def represent_ordereddict(dumper, data):
-    # TODO: Again, adjust for preferred flow style, and other stylistic details
-    # NOTE: For block style this uses the compact omap notation, but for flow style
-    # it does not.
-    values = []
-    node = yaml.SequenceNode(u'tag:yaml.org,2002:seq', values, flow_style=True)
-    if dumper.alias_key is not None:
-        dumper.represented_objects[dumper.alias_key] = node
-    for key, value in data.items():
-        key_item = dumper.represent_data(key)
-        value_item = dumper.represent_data(value)
-        node_item = yaml.MappingNode(u'tag:yaml.org,2002:map', [(key_item, value_item)],
-                                     flow_style=False)
-        values.append(node_item)
-    return node
-
-
-LINE_WIDTH = 88
-
-
-def write_line(strline):
-    print(strline * LINE_WIDTH, file=stderr)
-
-
-class HedEntry:
-    """Describes one file in the mrg archive"""
-
-    def __init__(self, block, name=''):
-        self.name = name
-        if len(block) == 8:
-            ofs_low, ofs_high, size_sect, size_low = unpack('<HHHH', block)
-            self.offset = 0x800 * (ofs_low | ((ofs_high & 0xF000) << 4))
-            self.rounded_size = self.size = 0x800 * size_sect
-            if size_low == 0:
-                self.size = self.rounded_size
-            else:
-                self.size = size_low | ((0x800 * (size_sect - 1)) & 0xFFFF0000)
-
-        elif len(block) == 4:
-            ofs_low, ofssz_high = unpack('<HH', block)
-            self.offset = 0x800 * (ofs_low | ((ofssz_high & 0xF000) << 4))
-            self.rounded_size = self.size = 0x800 * (ofssz_high & 0x0FFF)
-
-        else:
-            raise ValueError(
-                'HedEntry constructor expects either a 4-byte or 8-byte binary block, source file may be incomplete')
-
-    def to_block(self, blocksize):
-        if blocksize == 8:
-            ofs_aligned = self.offset // 0x800
-            ofs_low = ofs_aligned & 0xFFFF
-            ofs_high = (ofs_aligned & 0xF0000) >> 4
-            size_low = self.size & 0xFFFF
-            if size_low == 0:
-                size_sect = self.size // 0x800
-            else:
-                size_sect = self.size // 0x800 + 1
-            return pack('<HHHH', ofs_low, ofs_high, size_sect, size_low)
-
-        elif blocksize == 4:
-            # ofssz_high = self.size // 0x800
-            ofs_aligned = self.offset // 0x800
-            ofs_low = ofs_aligned & 0xFFFF
-            ofssz_high = (ofs_aligned & 0xF0000) >> 4
-            return pack('<HH', ofs_low, ofssz_high)
-
-
-def writefile_in_directory_with_collisions(dirpath, ent, mrgfile, collision_suffix):
-    if (ent.name is None) or (len(ent.name) == 0):
-        newname = collision_suffix
-        path = dirpath.joinpath(newname)
-    else:
-        newname = None
-        path = dirpath.joinpath(ent.name)
-
-        if path.exists():
-            root, ext = os.path.splitext(ent.name)
-            newname = root + '-' + collision_suffix + ext
-            path = dirpath.joinpath(newname)
-
-    path.with_suffix('.at9')
-
-    mrgfile.seek(ent.offset)
-    with open(path, 'wb') as f:
-        f.write(mrgfile.read(ent.size))
-
-    return newname  # None or string
-
-
-def get_entry_index_by_name(entries_list, name):
-    for idx in range(len(entries_list)):
-        if entries_list[idx]['name'] == name:
-            return idx
-    return -1
-
-
-def write_entry_with_padding(infile, entry, outfile):
-    outfile.seek(entry.offset)
-    remaining = entry.size
-    while remaining > 32768:
-        outfile.write(infile.read(32768))
-        remaining -= 32768
-    if remaining > 0:
-        outfile.write(infile.read(remaining))
-    complement = entry.size & 0x7FF
-    if complement > 0:
-        while complement & 0xF != 0:
-            outfile.write(b'\x00')
-            complement += 1
-        while complement & 0x7FF != 0:
-            outfile.write(b'\x0C' + 15 * b'\x00')
-            complement += 0x10
-
-
-class NamUtil:
-    """
-    Utils for .NAM file
-    Copyright (c) 2016 Hintay <hintay@me.com>
-    """
-
-    def __init__(self, in_nam):
-        self.data = open(in_nam, 'rb')
-        self.base_stem = in_nam
-        self.encoding = 'Shift_JIS'
-        self.indexed = False
-        self.nam_length = None
-        self.nam_total = None
-        self.nam_index = None
-        self.nam_size = os.path.getsize(in_nam)
-        self.get_info()
-
-    def get_info(self):
-        self.check_indexed()
-        if not self.indexed:
-            self.check_nam_length()
-            return
-            # return [self.indexed, self.nam_length, self.nam_total]
-        self.check_nam_total()
-        self.make_nam_index()
-        # return [self.indexed, self.nam_length, self.nam_total]
-
-    def check_indexed(self):
-        if self.data.read(0x7) == b'MRG.NAM':
-            self.indexed = True
-            self.nam_index = OrderedDict()
-
-    def check_nam_length(self):
-        self.nam_length = 0x8 if self.base_stem.name.find('voice') >= 0 else 0x20
-
-    def check_nam_total(self):
-        self.data.seek(0x10)
-        self.nam_total, = unpack("<I", self.data.read(0x4))
-
-    def make_nam_index(self):
-        self.data.seek(0x20)
-        for i in range(self.nam_total):
-            self.nam_index[i], = unpack("<I", self.data.read(0x4))
-        self.nam_index[self.nam_total] = self.nam_size
-
-    def read_0_string(self, bstr):
-        try:
-            return bstr[0:bstr.index(b'\x00')].decode(self.encoding)
-        except ValueError:
-            return bstr.decode(self.encoding)
-
-    def get_name_with_index(self, count):
-        length = self.nam_index[count + 1] - self.nam_index[count] - 4
-        self.data.seek(self.nam_index[count])
-        in_count, = unpack("<I", self.data.read(4))
-        if in_count == count:
-            return self.data.read(length)
-        else:
-            print('ERR: can not get name from index {0}, the in-header index is {1}', count, in_count)
-
-    def get_name(self, count):
-        if self.indexed:
-            name = self.get_name_with_index(count)
-        else:
-            self.data.seek(self.nam_length * count)
-            name = self.data.read(self.nam_length)
-        return self.read_0_string(name)
-
-
-#############################################################################
-
-def parse_args():
-    parser = argparse.ArgumentParser(description=__doc__, add_help=False)
-    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
-
-    parser_unpack = subparsers.add_parser('unpack', help='unpack hed/nam/mrg and optionally create a filelist')
-    parser_unpack.add_argument('-f', '--filelist',
-                               default=None, dest='filelist',
-                               help='Output filelist path (default: none -- only unpack files)')
-    parser_unpack.add_argument('input', metavar='input.hed', help='Input .hed file')
-
-    parser_replace = subparsers.add_parser('replace',
-                                           help='replace an archive entry in-place and modify an existing filelist. You may omit -n/-i when providing a wildcard expression to --source-file')
-    parser_replace.add_argument('-f', '--filelist',
-                                required=True, dest='filelist', type=argparse.FileType('r'),
-                                help='Subject filelist path, modified in-place [REQUIRED]')
-    parser_replace.add_argument('-s', '--source-file',
-                                required=True, dest='source', metavar='sourcepath',
-                                help='File path to inserted file [REQUIRED]')
-    replace_group = parser_replace.add_mutually_exclusive_group()
-    replace_group.add_argument('-i', '--index',
-                               default=None, dest='index', type=int,
-                               help='Refer to replaced entry by index')
-    replace_group.add_argument('-n', '--name',
-                               default=None, dest='name',
-                               help='Refer to replaced entry by name')
-    parser_replace.add_argument('subject', metavar='existing.hed',
-                                help='Subject .hed file, modified in-place. Same basename is used for .nam/.mrg')
-
-    parser_repack = subparsers.add_parser('repack', help='generate a hed/nam/mrg triple from an existing filelist')
-    parser_repack.add_argument('-f', '--filelist',
-                               required=True, dest='filelist', type=argparse.FileType('r'),
-                               help='Input filelist path [REQUIRED]')
-    parser_repack.add_argument('output', metavar='output.hed',
-                               help='Output .hed file. Same basename is used for .nam/.mrg')
-
-    parser.add_argument('-h', '--help',
-                        action=CustHelpAction, default=argparse.SUPPRESS,
-                        help='show this help message and exit')
-
-    return parser, parser.parse_args()
-
-
-#############################################################################
-# unpack verb #
-###############
-def unpack_verb(args):
-    in_hed = Path(args.input)
-    in_nam = in_hed.with_suffix('.nam')
-    in_mrg = in_hed.with_suffix('.mrg')
-    hedfile = namfile = mrgfile = None
-    outputdir = in_hed.with_name(in_hed.stem + '-unpacked')
-
-    try:
-        if str.upper(in_hed.suffix) != '.HED':
-            raise CustomException("'{}' must be a .hed file".format(args.input))
-        hedfile = open(in_hed, 'rb')
-        if in_nam.is_file():
-            namfile = NamUtil(in_nam)
-        mrgfile = open(in_mrg, 'rb')
-        outputdir.mkdir(parents=True)
-    except Exception as exc:
-        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.input, type(exc).__name__, str(exc)),
-              file=stderr)
-        sys.exit(1)
-
-    foo, first_entry_high = unpack('<HH', hedfile.read(0x04))
-    entry_length = 8 if (first_entry_high & 0x0FFF) == 0 else 4
-    record_count = in_hed.stat().st_size // entry_length
-    write_line('-')
-    print("| Archive count: {0} entries".format(record_count), file=stderr)
-    write_line('-')
-    hedfile.seek(0)
-    indexed_fmt = '{0:04d}' if record_count < 10000 else '{0:06d}'
-
-    yamlobj = OrderedDict()
-    yamlobj['original name'] = args.input
-    yamlobj['storage directory'] = outputdir
-    yamlobj['hed record length'] = entry_length
-    yamlobj['has nam filelist'] = namfile is not None
-    yamlobj['entries'] = []
-    for i in range(record_count):
-        blob = hedfile.read(entry_length)
-        first_word, = unpack_from('<L', blob)
-        if first_word == 0xFFFFFFFF:
-            continue
-        namfilename = None if namfile is None else namfile.get_name(i)
-        entry = HedEntry(blob, name=namfilename)
-        print("|- {0} - {1} b".format(entry.name, entry.size), file=stderr)
-        newfilename = writefile_in_directory_with_collisions(outputdir, entry, mrgfile,
-                                                             collision_suffix=indexed_fmt.format(i))
-        yamlobj['entries'].append({'name': namfilename, 'path': newfilename if newfilename is not None else entry.name})
-
-    write_line('=')
-    if args.filelist is not None:
-        with open(in_hed.with_name(args.filelist), 'wt', newline='') as yamlfile:
-            yaml.dump(yamlobj, yamlfile)
-        print('Filelist: {}'.format(args.filelist), file=stderr)
-    print('Output Directory: {}'.format(outputdir), file=stderr)
-
-
-#############################################################################
-# replace verb #
-################
-def replace_verb(args):
-    in_hed = Path(args.subject)
-    in_mrg = in_hed.with_suffix('.mrg')
-    hedfile = mrgfile = None
-
-    try:
-        if str.upper(in_hed.suffix) != '.HED':
-            raise CustomException("'{}' must be a .hed file".format(args.input))
-        hedfile = open(in_hed, 'r+b')
-        mrgfile = open(in_mrg, 'r+b')
-    except Exception as exc:
-        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.subject, type(exc).__name__, str(exc)),
-              file=stderr)
-        sys.exit(1)
-
-    yamlobj = None
-    try:
-        yamlobj = yaml.load(args.filelist)
-    except yaml.YAMLError as exc:
-        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.filelist.name, type(exc).__name__, str(exc)),
-              file=stderr)
-        sys.exit(1)
-
-    print('Loaded Filelist: {0} >> {1}'.format(yamlobj['original name'], yamlobj['storage directory']), file=stderr)
-
-    sourcepaths = []
-    if re.search('[*]|[?]', args.source) is not None:
-        sourcepaths = [x for x in glob.iglob(args.source) if os.path.isfile(x)]
-        if len(sourcepaths) == 0:
-            print("ERR: failed to process \"{0}\" - --source expression {1} does not match any file".format(
-                args.filelist.name, args.source), file=stderr)
-            sys.exit(1)
-    else:
-        if os.path.isdir(args.source):
-            sourcepaths = [x for x in glob.iglob(os.path.join(args.source, '*')) if os.path.isfile(x)]
-            if len(sourcepaths) == 0:
-                print("ERR: failed to process \"{0}\" - no file match in --source {1} directory".format(
-                    args.filelist.name, args.source), file=stderr)
-            sys.exit(1)
-        elif os.path.isfile(args.source):
-            sourcepaths = [args.source]
-            if (args.index is None) and (args.name is None):
-                args.name = os.path.basename(args.source)
-
-    if len(sourcepaths) == 0:
-        print("ERR: failed to process \"{0}\" - --source {1} does not match any file".format(args.filelist.name,
-                                                                                             args.source), file=stderr)
-        sys.exit(1)
-    elif len(sourcepaths) == 1:
-        special_first = True
-    else:
-        special_first = False
-        if (args.index is not None) or (args.name is not None):
-            print("WRN: ignoring --index/--name for --source [wildcard]. It is not needed", file=stderr)
-            args.index = args.name = None
-
-    nsuccess = nfailed = 0
-
-    for spath in sourcepaths:
-        if special_first == True:
-            ent_index = args.index
-            ent_name = args.name
-            is_first = False
-        else:
-            ent_index = None
-            ent_name = os.path.basename(spath)
-        result, newyaml = replace_entry(yamlobj, {'filelist': args.filelist.name, 'path': spath, 'index': ent_index,
-                                                  'name': ent_name, 'hedfile': hedfile, 'mrgfile': mrgfile})
-        if result == 0: nsuccess += 1
-        if result != 0: nfailed += 1
-
-    print("Success = {0}\nFailed = {1}".format(nsuccess, nfailed))
-
-    try:
-        # reopen with truncation
-        with open(args.filelist.name, 'wt', newline='') as yamlfile:
-            yaml.dump(yamlobj, yamlfile)
-        print('Filelist: {}'.format(args.filelist.name), file=stderr)
-    except Exception as exc:
-        print("ERR: [{1}] failed to write filelist into \"{0}\" - {2}".format(args.filelist.name, type(exc).__name__,
-                                                                              str(exc)), file=stderr)
-        failsafe = 'failsafe.yml'
-        try:
-            print(">> Attempting to save filelist as \"{}\" in current directory".format(failsafe), file=stderr)
-            with open(failsafe, 'wt', newline='') as yamlfile:
-                yaml.dump(yamlobj, yamlfile)
-        except Exception as exc:
-            print("ERR: could not save to \"{}\" either. Dumping as base64 in console...".format(failsafe), file=stderr)
-            print(b64encode(yaml.dump(yamlobj).encode('utf-8')))
-        print(">> Failsafe save OK, please manually rename it as {}.".format(args.filelist.name), file=stderr)
-        sys.exit(2)
-
-    sys.exit(0)
-
-
-def replace_entry(yamlobj, opts):
-    entry_length = yamlobj['hed record length']
-    search_by_name = opts['name'] is not None
-    if not search_by_name:
-        if (opts['index'] < 0) or (opts['index'] >= len(yamlobj['entries'])):
-            print("ERR: failed to process \"{0}\" - replace by --index '{1}' out of bounds [0, {2}]".format(
-                opts['filelist'], opts['index'], len(yamlobj['entries']) - 1), file=stderr)
-            return 2
-    else:
-        if not yamlobj['has nam filelist']:
-            print(
-                "ERR: failed to process \"{0}\" - replace by --name '{1}' while no .nam is used for "
-                "this .hed. Use --index instead".format(
-                    opts['filelist'], opts['name']), file=stderr)
-            return 2
-
-        opts['index'] = get_entry_index_by_name(yamlobj['entries'], opts['name'])
-        if opts['index'] < 0:
-            print(
-                "ERR: failed to process \"{0}\" - replace by --name '{1}' entry not found. Check if file case matches".format(
-                    opts['filelist'], opts['name']), file=stderr)
-            return 2
-
-    opts['hedfile'].seek(opts['index'] * entry_length)
-    entry = HedEntry(opts['hedfile'].read(entry_length))
-    print('Replacing: idx={0} {1} - orgOfs-Sz:{2:08X}-{3}b'.format(opts['index'],
-                                                                   yamlobj['entries'][opts['index']]['path'],
-                                                                   entry.offset, entry.size), file=stderr)
-
-    # if replaced entry has larger size, allocate new space
-    entry.size = os.path.getsize(opts['path'])
-    if os.path.getsize(opts['path']) > entry.rounded_size:
-        opts['mrgfile'].seek(0, 2)
-        entry.offset = opts['mrgfile'].tell()  # should be on 0x800 boundary
-        print('- newOfs-Sz:{0:08X}-{1}b'.format(entry.offset, entry.size), file=stderr)
-    size_low = entry.size & 0xFFFF
-    size_sect = entry.size // 0x800
-    entry.rounded_size = 0x800 * size_sect if size_low == 0 else 0x800 * (size_sect + 1)
-    write_entry_with_padding(open(opts['path'], 'rb'), entry, opts['mrgfile'])
-
-    opts['hedfile'].seek(opts['index'] * entry_length)
-    opts['hedfile'].write(entry.to_block(entry_length))
-
-    yamlobj['entries'][opts['index']]['path'] = opts['path']
-    return [0, yamlobj]
-
-
-#############################################################################
-# repack verb #
-###############
-
-def repack_verb(args):
-    # TODO
-    raise CustomException("Sorry, this option is not implemented yet")
-
-
-############
-# __main__ #
-############
-
-if __name__ == '__main__':
-
-    yaml.add_constructor(u'tag:yaml.org,2002:seq', ordereddict_constructor)
-    yaml.add_representer(OrderedDict, represent_ordereddict)
-
-    parser, args = parse_args()
-    if args.subcommand == "unpack":
-        unpack_verb(args)
-    elif args.subcommand == "replace":
-        replace_verb(args)
-    elif args.subcommand == "repack":
-        repack_verb(args)
-    else:
-        parser.print_usage()
-        sys.exit(20)
-    sys.exit(0)
+#!/usr/bin/env python
+#
+# allpac.hed/.nam/.mrg extraction & creation utility
+# For more information, see EXTR hed.md, REIN hed.md and specs/hed_format.md
+"""hedutil version 1.1, Copyright (C) 2014 Nanashi3.
+
+hedutil comes with ABSOLUTELY NO WARRANTY.
+
+Script to unpack or repack a .hed/.nam/.mrg triple
+"""
+
+import os
+import errno
+import sys
+import argparse
+from sys import stderr
+from struct import unpack, unpack_from, pack
+import re
+import glob
+from array import array
+from bisect import bisect_left, insort
+import yaml
+from pathlib import Path
+from collections import OrderedDict, namedtuple
+from base64 import b64encode
+from io import BytesIO
+from mzx.decomp_mzx0 import mzx0_decompress_buffer
+from mzx.comp_mzx0 import mzx0_compress_fit
+from lib.mrgd import MrgArchive, calculate_entry_desc, add_entry_padding, copy_file_data
+from lib.nam import NamTable, NAM_MAGIC, NAM_HEADER_SIZE, first_indexes
+from filename_utils import unique_name
+
+
+class CustomException(Exception):
+    pass
+
+
+class CustHelpAction(argparse._HelpAction):
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.print_help()
+        for subparser_action in parser._actions:
+            if isinstance(subparser_action, argparse._SubParsersAction):
+                for choice, subparser in subparser_action.choices.items():
+                    print("\n\n== {} ==".format(choice))
+                    print(subparser.format_help())
+        parser.exit()
+
+
+def ordereddict_constructor(loader, node):
+    try:
+        omap = loader.construct_yaml_omap(node)
+        return OrderedDict(*omap)
+    except yaml.constructor.ConstructorError:
+        return loader.construct_yaml_seq(node)
+
+
+# def represent_ordereddict(dumper, data):
+#    value = []
+#
+#    for item_key, item_value in data.items():
+#        node_key = dumper.represent_data(item_key)
+#        node_value = dumper.represent_data(item_value)
+#
+#        value.append((node_key, node_value))
+#
+#    return yaml.nodes.MappingNode(u'tag:yaml.org,2002:map', value)
+
+def represent_ordereddict(dumper, data):
+    # TODO: Again, adjust for preferred flow style, and other stylistic details
+    # NOTE: For block style this uses the compact omap notation, but for flow style
+    # it does not.
+    values = []
+    node = yaml.SequenceNode(u'tag:yaml.org,2002:seq', values, flow_style=True)
+    if dumper.alias_key is not None:
+        dumper.represented_objects[dumper.alias_key] = node
+    for key, value in data.items():
+        key_item = dumper.represent_data(key)
+        value_item = dumper.represent_data(value)
+        node_item = yaml.MappingNode(u'tag:yaml.org,2002:map', [(key_item, value_item)],
+                                     flow_style=False)
+        values.append(node_item)
+    return node
+
+
+LINE_WIDTH = 88
+
+
+def write_line(strline):
+    print(strline * LINE_WIDTH, file=stderr)
+
+
+class HedEntry:
+    """Describes one file in the mrg archive"""
+
+    def __init__(self, block, name=''):
+        self.name = name
+        if len(block) == 8:
+            ofs_low, ofs_high, size_sect, size_low = unpack('<HHHH', block)
+            self.offset = 0x800 * (ofs_low | ((ofs_high & 0xF000) << 4))
+            self.rounded_size = self.size = 0x800 * size_sect
+            if size_low == 0:
+                self.size = self.rounded_size
+            else:
+                self.size = size_low | ((0x800 * (size_sect - 1)) & 0xFFFF0000)
+
+        elif len(block) == 4:
+            ofs_low, ofssz_high = unpack('<HH', block)
+            self.offset = 0x800 * (ofs_low | ((ofssz_high & 0xF000) << 4))
+            self.rounded_size = self.size = 0x800 * (ofssz_high & 0x0FFF)
+
+        else:
+            raise ValueError(
+                'HedEntry constructor expects either a 4-byte or 8-byte binary block, source file may be incomplete')
+
+    def to_block(self, blocksize):
+        if blocksize == 8:
+            ofs_aligned = self.offset // 0x800
+            ofs_low = ofs_aligned & 0xFFFF
+            ofs_high = (ofs_aligned & 0xF0000) >> 4
+            size_low = self.size & 0xFFFF
+            # sectors actually used, rounding up a size that is already sector aligned would claim one more
+            size_sect = (self.size + 0x7FF) // 0x800
+            return pack('<HHHH', ofs_low, ofs_high, size_sect, size_low)
+
+        elif blocksize == 4:
+            # voice entries are stored whole sectors, the size shares the high word
+            ofs_aligned = self.offset // 0x800
+            ofs_low = ofs_aligned & 0xFFFF
+            ofssz_high = ((ofs_aligned & 0xF0000) >> 4) | (((self.size + 0x7FF) // 0x800) & 0x0FFF)
+            return pack('<HH', ofs_low, ofssz_high)
+
+
+def read_hed_entries(hed_data, entry_length):
+    """(record index, HedEntry) of a whole .hed, 0xFF padding records and the end marker skipped"""
+    entries = []
+    for i in range(len(hed_data) // entry_length):
+        block = hed_data[i * entry_length:(i + 1) * entry_length]
+        if block[:4] == b'\xFF\xFF\xFF\xFF':
+            continue
+        entries.append((i, HedEntry(block)))
+    return entries
+
+
+class FreeSectorMap:
+    """
+    Free 0x800 sectors of a .mrg, derived from its .hed table.
+    Sectors are reference counted, so releasing an entry never frees sectors another entry still uses.
+    """
+
+    def __init__(self, hed_entries, mrg_size):
+        self.end = (mrg_size + 0x7FF) // 0x800
+        self.refs = array('H', [0]) * self.end
+        for i, entry in hed_entries:
+            start, count = entry.offset // 0x800, entry.rounded_size // 0x800
+            if start + count > self.end:
+                self.refs.extend([0] * (start + count - self.end))
+                self.end = start + count
+            for sector in range(start, start + count):
+                self.refs[sector] += 1
+        # sorted (start, count) runs of unreferenced sectors
+        self.holes = []
+        sector = 0
+        while sector < self.end:
+            if self.refs[sector]:
+                sector += 1
+                continue
+            start = sector
+            while sector < self.end and not self.refs[sector]:
+                sector += 1
+            self.holes.append((start, sector - start))
+
+    @property
+    def free_sectors(self):
+        return sum(count for start, count in self.holes)
+
+    def allocate(self, count):
+        """Start sector of `count` sectors: the smallest hole that fits, else the end of the archive."""
+        best = None
+        for i, (start, size) in enumerate(self.holes):
+            if size >= count and (best is None or size < self.holes[best][1]):
+                best = i
+        if best is not None:
+            start, size = self.holes[best]
+            if size == count:
+                del self.holes[best]
+            else:
+                self.holes[best] = (start + count, size - count)
+        elif self.holes and sum(self.holes[-1]) == self.end:
+            # grow the trailing hole past the end
+            start, size = self.holes.pop()
+        else:
+            start = self.end
+        if start + count > self.end:
+            self.refs.extend([0] * (start + count - self.end))
+            self.end = start + count
+        for sector in range(start, start + count):
+            self.refs[sector] += 1
+        return start
+
+    def release(self, start, count):
+        """Drop one reference on `count` sectors from `start`, sectors nobody uses anymore become a hole."""
+        freed = []
+        for sector in range(start, start + count):
+            if not self.refs[sector]:
+                continue
+            self.refs[sector] -= 1
+            if self.refs[sector] == 0:
+                if freed and sum(freed[-1]) == sector:
+                    freed[-1] = (freed[-1][0], freed[-1][1] + 1)
+                else:
+                    freed.append((sector, 1))
+        for hole in freed:
+            insort(self.holes, hole)
+            i = bisect_left(self.holes, hole)
+            # merge with the neighbours
+            if i + 1 < len(self.holes) and sum(self.holes[i]) == self.holes[i + 1][0]:
+                self.holes[i] = (self.holes[i][0], self.holes[i][1] + self.holes[i + 1][1])
+                del self.holes[i + 1]
+            if i > 0 and sum(self.holes[i - 1]) == self.holes[i][0]:
+                self.holes[i - 1] = (self.holes[i - 1][0], self.holes[i - 1][1] + self.holes[i][1])
+                del self.holes[i]
+
+
+def entry_output_name(name, taken_names, collision_suffix):
+    # name an entry is saved under when it differs from its .nam name, None otherwise
+    if (name is None) or (len(name) == 0):
+        return unique_name(collision_suffix, taken_names)
+    newname = unique_name(name, taken_names, collision_suffix)
+    return newname if newname != name else None
+
+
+def write_entry_with_padding(infile, entry, outfile):
+    outfile.seek(entry.offset)
+    remaining = entry.size
+    while remaining > 32768:
+        outfile.write(infile.read(32768))
+        remaining -= 32768
+    if remaining > 0:
+        outfile.write(infile.read(remaining))
+    complement = entry.size & 0x7FF
+    if complement > 0:
+        while complement & 0xF != 0:
+            outfile.write(b'\x00')
+            complement += 1
+        while complement & 0x7FF != 0:
+            outfile.write(b'\x0C' + 15 * b'\x00')
+            complement += 0x10
+
+
+def refit_mzx_source(srcfile, budget, xorff):
+    """Re-encode an MZX source with optimal parsing so it fits in `budget` bytes.
+    Returns the new data, or None when the source is not MZX or does not fit"""
+    data = srcfile.read()
+    prefix = b'LV\x03\x00\x00\t\x00' if data[:7] == b'LV\x03\x00\x00\t\x00' else b''
+    if data[len(prefix):len(prefix) + 4] != b'MZX0':
+        return None
+    dec_size, = unpack_from('<L', data, len(prefix) + 4)
+    decoded = mzx0_decompress_buffer(memoryview(data)[len(prefix) + 8:], dec_size, xorff)
+    fits, stream = mzx0_compress_fit(decoded, budget - len(prefix), xorff)
+    print('- refit MZX: {0}b => {1}b, budget {2}b [{3}]'.format(
+        len(data), len(prefix) + len(stream), budget, 'FITS' if fits else 'TOO LARGE'), file=stderr)
+    return prefix + stream if fits else None
+
+
+class NamUtil:
+    """
+    Utils for .NAM file
+    Copyright (c) 2016 Hintay <hintay@me.com>
+    """
+
+    def __init__(self, in_nam):
+        self.base_stem = in_nam
+        self.encoding = 'Shift_JIS'
+        self.nam_size = os.path.getsize(in_nam)
+        with open(in_nam, 'rb') as f:
+            data = f.read()
+        # the whole file is parsed at once, names are only decoded when asked for
+        self.indexed = data[:len(NAM_MAGIC)] == NAM_MAGIC
+        self.nam_length = None if self.indexed else (0x8 if self.base_stem.name.find('voice') >= 0 else 0x20)
+        self.names = NamTable(data, self.nam_length, self.encoding)
+        self.nam_total = len(self.names) if self.indexed else None
+
+    def get_name(self, count):
+        return self.names[count] if count < len(self.names) else ''
+
+
+#############################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, add_help=False)
+    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
+
+    parser_unpack = subparsers.add_parser('unpack', help='unpack hed/nam/mrg and optionally create a filelist')
+    parser_unpack.add_argument('-f', '--filelist',
+                               default=None, dest='filelist',
+                               help='Output filelist path (default: none -- only unpack files)')
+    parser_unpack.add_argument('-j', '--jobs',
+                               default=0, type=int,
+                               help='Writer threads, 1 writes sequentially (default: 0 -- a few per CPU)')
+    parser_unpack.add_argument('input', metavar='input.hed', help='Input .hed file')
+
+    parser_replace = subparsers.add_parser('replace',
+                                           help='replace an archive entry in-place and modify an existing filelist. You may omit -n/-i when providing a wildcard expression to --source-file')
+    parser_replace.add_argument('-f', '--filelist',
+                                required=True, dest='filelist', type=argparse.FileType('r'),
+                                help='Subject filelist path, modified in-place [REQUIRED]')
+    parser_replace.add_argument('-s', '--source-file',
+                                required=True, dest='source', metavar='sourcepath',
+                                help='File path to inserted file [REQUIRED]')
+    replace_group = parser_replace.add_mutually_exclusive_group()
+    replace_group.add_argument('-i', '--index',
+                               default=None, dest='index', type=int,
+                               help='Refer to replaced entry by index')
+    replace_group.add_argument('-n', '--name',
+                               default=None, dest='name',
+                               help='Refer to replaced entry by name')
+    parser_replace.add_argument('-z', '--fit-mzx',
+                                default=None, dest='fit_xor', type=int, choices=[0, 1],
+                                help='Re-encode an oversized MZX source with(1) or without(0) xorff so it stays '
+                                     'in the original sectors')
+    parser_replace.add_argument('subject', metavar='existing.hed',
+                                help='Subject .hed file, modified in-place. Same basename is used for .nam/.mrg')
+
+    parser_compact = subparsers.add_parser('compact',
+                                           help='rewrite the .mrg without the holes left by replace, .hed updated at the end')
+    parser_compact.add_argument('subject', metavar='existing.hed',
+                                help='Subject .hed file, modified in-place. Same basename is used for .mrg')
+
+    parser_repack = subparsers.add_parser('repack', help='generate a hed/nam/mrg triple from an existing filelist')
+    parser_repack.add_argument('-f', '--filelist',
+                               required=True, dest='filelist', type=argparse.FileType('r', encoding='utf-8'),
+                               help='Input filelist path, hedutil YAML or mrg_tool filename_xxx.list [REQUIRED]')
+    parser_repack.add_argument('output', metavar='output.hed',
+                               help='Output .hed file. Same basename is used for .nam/.mrg')
+
+    parser.add_argument('-h', '--help',
+                        action=CustHelpAction, default=argparse.SUPPRESS,
+                        help='show this help message and exit')
+
+    return parser, parser.parse_args()
+
+
+#############################################################################
+# unpack verb #
+###############
+def unpack_verb(args):
+    in_hed = Path(args.input)
+    in_nam = in_hed.with_suffix('.nam')
+    in_mrg = in_hed.with_suffix('.mrg')
+    namfile = mrg_archive = None
+    outputdir = in_hed.with_name(in_hed.stem + '-unpacked')
+
+    try:
+        if str.upper(in_hed.suffix) != '.HED':
+            raise CustomException("'{}' must be a .hed file".format(args.input))
+        if not in_hed.is_file():
+            raise CustomException("'{}' does not exist".format(args.input))
+        if in_nam.is_file():
+            namfile = NamUtil(in_nam)
+        mrg_archive = MrgArchive(in_mrg, in_hed, nam_path=False)
+        outputdir.mkdir(parents=True)
+    except Exception as exc:
+        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.input, type(exc).__name__, str(exc)),
+              file=stderr)
+        sys.exit(1)
+
+    entry_length = mrg_archive.entry_length
+    # entries only, without the 0xFF padding records at the end of the .hed
+    entries_count = len(mrg_archive.entries)
+    write_line('-')
+    print("| Archive count: {0} entries".format(entries_count), file=stderr)
+    write_line('-')
+    indexed_fmt = '{0:04d}' if entries_count < 10000 else '{0:06d}'
+
+    yamlobj = OrderedDict()
+    yamlobj['original name'] = args.input
+    yamlobj['storage directory'] = outputdir
+    yamlobj['hed record length'] = entry_length
+    yamlobj['has nam filelist'] = namfile is not None
+    if namfile is not None:
+        # kept for repack, which writes the .nam back in the same flavour
+        yamlobj['nam indexed'] = namfile.indexed
+        yamlobj['nam record length'] = namfile.nam_length
+    yamlobj['entries'] = []
+    # names are resolved in index order against the ones used so far, then a thread pool writes the data
+    taken_names = set()
+    paths = {}
+    for entry in mrg_archive.entries:
+        i = entry.index
+        namfilename = None if namfile is None else namfile.get_name(i)
+        print("|- {0} - {1} b".format(namfilename, entry.real_size), file=stderr)
+        newfilename = entry_output_name(namfilename, taken_names, indexed_fmt.format(i))
+        paths[i] = newfilename if newfilename is not None else namfilename
+        yamlobj['entries'].append({'name': namfilename, 'path': paths[i]})
+    for _ in mrg_archive.write_entries(outputdir, paths, args.jobs):
+        pass
+    mrg_archive.close()
+
+    write_line('=')
+    if args.filelist is not None:
+        with open(in_hed.with_name(args.filelist), 'wt', newline='') as yamlfile:
+            yaml.dump(yamlobj, yamlfile)
+        print('Filelist: {}'.format(args.filelist), file=stderr)
+    print('Output Directory: {}'.format(outputdir), file=stderr)
+
+
+#############################################################################
+# replace verb #
+################
+def replace_verb(args):
+    in_hed = Path(args.subject)
+    in_mrg = in_hed.with_suffix('.mrg')
+    hedfile = mrgfile = None
+
+    try:
+        if str.upper(in_hed.suffix) != '.HED':
+            raise CustomException("'{}' must be a .hed file".format(args.input))
+        hedfile = open(in_hed, 'r+b')
+        mrgfile = open(in_mrg, 'r+b')
+    except Exception as exc:
+        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.subject, type(exc).__name__, str(exc)),
+              file=stderr)
+        sys.exit(1)
+
+    yamlobj = None
+    try:
+        yamlobj = yaml.load(args.filelist, Loader=yaml.Loader)
+    except yaml.YAMLError as exc:
+        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.filelist.name, type(exc).__name__, str(exc)),
+              file=stderr)
+        sys.exit(1)
+
+    print('Loaded Filelist: {0} >> {1}'.format(yamlobj['original name'], yamlobj['storage directory']), file=stderr)
+
+    sourcepaths = []
+    if re.search('[*]|[?]', args.source) is not None:
+        sourcepaths = [x for x in glob.iglob(args.source) if os.path.isfile(x)]
+        if len(sourcepaths) == 0:
+            print("ERR: failed to process \"{0}\" - --source expression {1} does not match any file".format(
+                args.filelist.name, args.source), file=stderr)
+            sys.exit(1)
+    else:
+        if os.path.isdir(args.source):
+            sourcepaths = [x for x in glob.iglob(os.path.join(args.source, '*')) if os.path.isfile(x)]
+            if len(sourcepaths) == 0:
+                print("ERR: failed to process \"{0}\" - no file match in --source {1} directory".format(
+                    args.filelist.name, args.source), file=stderr)
+                sys.exit(1)
+        elif os.path.isfile(args.source):
+            sourcepaths = [args.source]
+            if (args.index is None) and (args.name is None):
+                args.name = os.path.basename(args.source)
+
+    if len(sourcepaths) == 0:
+        print("ERR: failed to process \"{0}\" - --source {1} does not match any file".format(args.filelist.name,
+                                                                                             args.source), file=stderr)
+        sys.exit(1)
+    elif len(sourcepaths) == 1:
+        special_first = True
+    else:
+        special_first = False
+        if (args.index is not None) or (args.name is not None):
+            print("WRN: ignoring --index/--name for --source [wildcard]. It is not needed", file=stderr)
+            args.index = args.name = None
+
+    # plan every replacement first: lookups use one name map, placements an in-memory .hed and free sector map
+    hed_data = bytearray(hedfile.read())
+    original_hed = bytes(hed_data)
+    mrg_size = os.path.getsize(in_mrg)
+    free_map = FreeSectorMap(read_hed_entries(hed_data, yamlobj['hed record length']), mrg_size)
+    name_index = first_indexes(entry['name'] for entry in yamlobj['entries'])
+
+    plans = OrderedDict()
+    nfailed = 0
+    for spath in sourcepaths:
+        if special_first == True:
+            ent_index = args.index
+            ent_name = args.name
+        else:
+            ent_index = None
+            ent_name = os.path.basename(spath)
+        plan = plan_replace(yamlobj, {'filelist': args.filelist.name, 'path': spath, 'index': ent_index,
+                                      'name': ent_name, 'fit_xor': args.fit_xor},
+                            name_index, hed_data, free_map)
+        if plan is None:
+            nfailed += 1
+        else:
+            # the same entry replaced twice, the last source wins
+            plans.pop(plan.index, None)
+            plans[plan.index] = plan
+
+    if nfailed:
+        print("Success = 0\nFailed = {0}".format(nfailed))
+        print("ERR: nothing was replaced, fix the failed entries and run again", file=stderr)
+        sys.exit(1)
+
+    # one sweep in offset order, live sectors overwritten in place are kept to roll back on failure
+    backup = []
+    try:
+        for plan in sorted(plans.values(), key=lambda plan: plan.entry.offset):
+            if plan.entry.offset < mrg_size:
+                mrgfile.seek(plan.entry.offset)
+                backup.append((plan.entry.offset,
+                               mrgfile.read(min(plan.entry.offset + plan.entry.rounded_size, mrg_size) - plan.entry.offset)))
+            with (BytesIO(plan.data) if plan.data is not None else open(plan.path, 'rb')) as source:
+                write_entry_with_padding(source, plan.entry, mrgfile)
+        mrgfile.flush()
+        hedfile.seek(0)
+        hedfile.write(hed_data)
+        hedfile.flush()
+    except Exception as exc:
+        print("ERR: [{1}] failed to write \"{0}\" - {2}".format(in_mrg, type(exc).__name__, str(exc)), file=stderr)
+        for offset, data in backup:
+            mrgfile.seek(offset)
+            mrgfile.write(data)
+        mrgfile.truncate(mrg_size)
+        hedfile.seek(0)
+        hedfile.write(original_hed)
+        print(">> Rolled back {0} and {1}, nothing was replaced".format(in_mrg.name, in_hed.name), file=stderr)
+        sys.exit(1)
+    mrgfile.close()
+    hedfile.close()
+
+    for plan in plans.values():
+        yamlobj['entries'][plan.index]['path'] = plan.path
+    print("Success = {0}\nFailed = {1}".format(len(sourcepaths), nfailed))
+    print("Free space left in {0}: {1} sectors, run `compact` to reclaim it".format(
+        in_mrg.name, free_map.free_sectors), file=stderr)
+
+    try:
+        # reopen with truncation
+        with open(args.filelist.name, 'wt', newline='') as yamlfile:
+            yaml.dump(yamlobj, yamlfile)
+        print('Filelist: {}'.format(args.filelist.name), file=stderr)
+    except Exception as exc:
+        print("ERR: [{1}] failed to write filelist into \"{0}\" - {2}".format(args.filelist.name, type(exc).__name__,
+                                                                              str(exc)), file=stderr)
+        failsafe = 'failsafe.yml'
+        try:
+            print(">> Attempting to save filelist as \"{}\" in current directory".format(failsafe), file=stderr)
+            with open(failsafe, 'wt', newline='') as yamlfile:
+                yaml.dump(yamlobj, yamlfile)
+        except Exception as exc:
+            print("ERR: could not save to \"{}\" either. Dumping as base64 in console...".format(failsafe), file=stderr)
+            print(b64encode(yaml.dump(yamlobj).encode('utf-8')))
+        print(">> Failsafe save OK, please manually rename it as {}.".format(args.filelist.name), file=stderr)
+        sys.exit(2)
+
+    sys.exit(0)
+
+
+ReplacePlan = namedtuple('ReplacePlan', ['index', 'path', 'entry', 'data'])
+
+
+def plan_replace(yamlobj, opts, name_index, hed_data, free_map):
+    """
+    Place one source in the archive without writing it: the new record is patched into `hed_data`
+    and its sectors taken from `free_map`. Returns a ReplacePlan (data is set for a refit MZX), None on error.
+    """
+    entry_length = yamlobj['hed record length']
+    search_by_name = opts['name'] is not None
+    if not search_by_name:
+        if (opts['index'] < 0) or (opts['index'] >= len(yamlobj['entries'])):
+            print("ERR: failed to process \"{0}\" - replace by --index '{1}' out of bounds [0, {2}]".format(
+                opts['filelist'], opts['index'], len(yamlobj['entries']) - 1), file=stderr)
+            return None
+    else:
+        if not yamlobj['has nam filelist']:
+            print(
+                "ERR: failed to process \"{0}\" - replace by --name '{1}' while no .nam is used for "
+                "this .hed. Use --index instead".format(
+                    opts['filelist'], opts['name']), file=stderr)
+            return None
+
+        opts['index'] = name_index.get(opts['name'], -1)
+        if opts['index'] < 0:
+            print(
+                "ERR: failed to process \"{0}\" - replace by --name '{1}' entry not found. Check if file case matches".format(
+                    opts['filelist'], opts['name']), file=stderr)
+            return None
+
+    index = opts['index']
+    entry = HedEntry(bytes(hed_data[index * entry_length:(index + 1) * entry_length]))
+    print('Replacing: idx={0} {1} - orgOfs-Sz:{2:08X}-{3}b'.format(index, yamlobj['entries'][index]['path'],
+                                                                   entry.offset, entry.size), file=stderr)
+
+    # if replaced entry has larger size, try to re-encode it in place, otherwise allocate new space
+    data = None
+    entry.size = os.path.getsize(opts['path'])
+    if entry.size > entry.rounded_size and opts.get('fit_xor') is not None:
+        with open(opts['path'], 'rb') as source:
+            data = refit_mzx_source(source, entry.rounded_size, opts['fit_xor'] == 1)
+        if data is not None:
+            entry.size = len(data)
+    old_start, old_count = entry.offset // 0x800, entry.rounded_size // 0x800
+    new_count = (entry.size + 0x7FF) // 0x800
+    # sectors other records still point at (repack --dedupe) are never overwritten, the entry moves instead
+    shared = any(free_map.refs[sector] > 1 for sector in range(old_start, min(old_start + old_count, free_map.end)))
+    if entry.size > entry.rounded_size or shared:
+        free_map.release(old_start, old_count)
+        entry.offset = 0x800 * free_map.allocate(new_count)
+        print('- newOfs-Sz:{0:08X}-{1}b'.format(entry.offset, entry.size), file=stderr)
+    elif new_count < old_count:
+        free_map.release(old_start + new_count, old_count - new_count)
+    entry.rounded_size = 0x800 * new_count
+
+    hed_data[index * entry_length:(index + 1) * entry_length] = entry.to_block(entry_length)
+    return ReplacePlan(index, opts['path'], entry, data)
+
+
+#############################################################################
+# compact verb #
+################
+
+def patch_block_offset(block, offset):
+    # only the offset bits change, size and unused bits of the record are kept as they are
+    ofs_aligned = offset // 0x800
+    ofs_low, ofs_high = unpack_from('<HH', block)
+    return pack('<HH', ofs_aligned & 0xFFFF, (ofs_high & 0x0FFF) | ((ofs_aligned & 0xF0000) >> 4)) + block[4:]
+
+
+def compact_verb(args):
+    in_hed = Path(args.subject)
+    in_mrg = in_hed.with_suffix('.mrg')
+    tmp_hed = in_hed.with_name(in_hed.name + '.compact')
+    tmp_mrg = in_mrg.with_name(in_mrg.name + '.compact')
+
+    try:
+        if str.upper(in_hed.suffix) != '.HED':
+            raise CustomException("'{}' must be a .hed file".format(args.subject))
+        with MrgArchive(in_mrg, in_hed, nam_path=False) as mrg_archive:
+            entry_length = mrg_archive.entry_length
+        hed_data = bytearray(in_hed.read_bytes())
+    except Exception as exc:
+        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.subject, type(exc).__name__, str(exc)),
+              file=stderr)
+        sys.exit(1)
+
+    entries = read_hed_entries(hed_data, entry_length)
+    old_size = os.path.getsize(in_mrg)
+    # one sequential pass in archive order, entries sharing their data keep sharing it
+    new_offsets = {}
+    with open(tmp_mrg, 'wb', buffering=0) as mrgfile:
+        for i, entry in sorted(entries, key=lambda item: (item[1].offset, -item[1].size)):
+            if entry.offset in new_offsets:
+                continue
+            new_offsets[entry.offset] = mrgfile.tell()
+            copy_file_data(mrgfile, in_mrg, entry.size, entry.offset)
+            mrgfile.write(add_entry_padding(False, entry.size)[1])
+        new_size = mrgfile.tell()
+
+    for i, entry in entries:
+        block = hed_data[i * entry_length:(i + 1) * entry_length]
+        hed_data[i * entry_length:(i + 1) * entry_length] = patch_block_offset(block, new_offsets[entry.offset])
+    with open(tmp_hed, 'wb') as hedfile:
+        hedfile.write(hed_data)
+    os.replace(tmp_mrg, in_mrg)
+    os.replace(tmp_hed, in_hed)
+
+    write_line('=')
+    print('Compacted {0}: {1} b => {2} b ({3} entries)'.format(in_mrg.name, old_size, new_size, len(entries)),
+          file=stderr)
+
+
+#############################################################################
+# repack verb #
+###############
+
+def detect_nam_format(nam_path, count):
+    """(indexed, record length) of an existing .nam holding `count` names"""
+    with open(nam_path, 'rb') as f:
+        if f.read(len(NAM_MAGIC)) == NAM_MAGIC:
+            return True, None
+    nam_size = os.path.getsize(nam_path)
+    for nam_length in (0x20, 0x10, 0x8):
+        if nam_size in (nam_length * count, nam_length * (count + 1)):
+            return False, nam_length
+    return False, 0x8 if nam_path.name.find('voice') >= 0 else 0x20
+
+
+def build_nam(names, indexed, nam_length, header=None):
+    """
+    Serialize names as a .nam: fixed width records (0x20 ones end with CRLF, voice ones are only NUL padded)
+    or an indexed MRG.NAM, whose header is taken from the original file when given.
+    """
+    names = [(name or '').encode('cp932') for name in names]
+    if not indexed:
+        if nam_length == 0x20:
+            records = [name.ljust(0x1E, b'\x00') + b'\r\n' for name in names]
+        else:
+            records = [name.ljust(nam_length, b'\x00') for name in names]
+        for name, record in zip(names, records):
+            if len(record) != nam_length:
+                raise CustomException("name '{0}' does not fit in a {1} bytes .nam record".format(
+                    name.decode('cp932'), nam_length))
+        return b''.join(records)
+
+    header = bytearray(header[:NAM_HEADER_SIZE] if header else NAM_MAGIC.ljust(NAM_HEADER_SIZE, b'\x00'))
+    header[0x10:0x14] = pack('<I', len(names))
+    records = []
+    offset = NAM_HEADER_SIZE + 4 * len(names)
+    index_table = []
+    for i, name in enumerate(names):
+        record = pack('<I', i) + name + b'\x00'
+        record += b'\x00' * (-len(record) % 4)
+        index_table.append(pack('<I', offset))
+        records.append(record)
+        offset += len(record)
+    return bytes(header) + b''.join(index_table) + b''.join(records)
+
+
+def load_repack_filelist(filelist):
+    """
+    Read a hedutil YAML filelist, or a mrg_tool filename_<name>.list (files beside it, names from the original
+    <name>.nam when there is one, from the list otherwise).
+    Returns the YAML-like dict with 'sources' resolved to file paths.
+    """
+    text = filelist.read()
+    list_path = Path(filelist.name)
+    if not list_path.stem.startswith('filename_'):
+        yamlobj = yaml.load(text, Loader=yaml.Loader)
+        storage_dir = Path(yamlobj['storage directory'])
+        # unpacked entries live in the storage directory, replaced ones keep the path given to `replace`
+        yamlobj['sources'] = [storage_dir.joinpath(entry['path']) if storage_dir.joinpath(entry['path']).is_file()
+                              else Path(entry['path']) for entry in yamlobj['entries']]
+        return yamlobj
+
+    mrg_name = list_path.stem[len('filename_'):]
+    paths = [line.rstrip('\r') for line in text.split('\n') if line.rstrip('\r')]
+    original_hed = list_path.parent.parent.joinpath(mrg_name + '.hed')
+    yamlobj = {'original name': str(original_hed),
+               'storage directory': list_path.parent,
+               'hed record length': 4 if mrg_name.startswith('voice') else 8}
+    # list lines are the unpacked file names (sniffed suffix, collision renames), .nam names come from the original
+    original_nam = original_hed.with_suffix('.nam')
+    if original_nam.is_file():
+        indexed, nam_length = detect_nam_format(original_nam, len(paths))
+        nam_names = list(NamTable(original_nam.read_bytes(), None if indexed else nam_length))
+        names = [nam_names[i] if i < len(nam_names) else path for i, path in enumerate(paths)]
+        yamlobj.update({'has nam filelist': True, 'nam indexed': indexed, 'nam record length': nam_length})
+    else:
+        # without a .nam, mrg_tool names the entries <name>_fileNNNN
+        names = paths
+        yamlobj['has nam filelist'] = not all(re.match(re.escape(mrg_name) + r'_file\d+\.', name) for name in names)
+    yamlobj['entries'] = [{'name': name if yamlobj['has nam filelist'] else None, 'path': path}
+                          for name, path in zip(names, paths)]
+    yamlobj['sources'] = [list_path.parent.joinpath(path) for path in paths]
+    return yamlobj
+
+
+def repack_verb(args):
+    out_hed = Path(args.output)
+    out_nam = out_hed.with_suffix('.nam')
+    out_mrg = out_hed.with_suffix('.mrg')
+
+    try:
+        if str.upper(out_hed.suffix) != '.HED':
+            raise CustomException("'{}' must be a .hed file".format(args.output))
+        yamlobj = load_repack_filelist(args.filelist)
+        for source in yamlobj['sources']:
+            if not source.is_file():
+                raise CustomException("entry file '{}' does not exist".format(source))
+    except Exception as exc:
+        print("ERR: [{1}] failed to process \"{0}\" - {2}".format(args.filelist.name, type(exc).__name__, str(exc)),
+              file=stderr)
+        sys.exit(1)
+
+    entry_length = yamlobj['hed record length']
+    entries = yamlobj['entries']
+    print('Loaded Filelist: {0} >> {1}'.format(yamlobj['original name'], out_hed), file=stderr)
+    write_line('-')
+    print("| Archive count: {0} entries".format(len(entries)), file=stderr)
+    write_line('-')
+
+    # single pass: payloads are streamed into the .mrg, .hed records and names are collected on the way
+    hed_records = []
+    with open(out_mrg, 'wb', buffering=0) as mrgfile:
+        offset = 0
+        for entry, source in zip(entries, yamlobj['sources']):
+            size = source.stat().st_size
+            pad_len, pad_data = add_entry_padding(False, size)
+            if entry_length == 4:
+                hed_records.append(pack('<HH', *calculate_entry_desc(offset, size + pad_len, False, True)))
+            else:
+                hed_records.append(pack('<HHHH', *calculate_entry_desc(offset, size, False)))
+            copy_file_data(mrgfile, source, size)
+            mrgfile.write(pad_data)
+            offset += size + pad_len
+            print("|- {0} - {1} b".format(entry['name'] or source.name, size), file=stderr)
+
+    # sixteen 0xFF bytes mark the end of the .hed
+    with open(out_hed, 'wb') as hedfile:
+        hedfile.write(b''.join(hed_records) + b'\xFF' * 0x10)
+
+    if yamlobj['has nam filelist']:
+        original_nam = Path(yamlobj['original name']).with_suffix('.nam')
+        if 'nam indexed' in yamlobj:
+            indexed, nam_length = yamlobj['nam indexed'], yamlobj['nam record length']
+        elif original_nam.is_file():
+            indexed, nam_length = detect_nam_format(original_nam, len(entries))
+        else:
+            indexed, nam_length = False, 0x8 if entry_length == 4 else 0x20
+        header = None
+        if indexed and original_nam.is_file():
+            with open(original_nam, 'rb') as f:
+                header = f.read(NAM_HEADER_SIZE)
+        try:
+            nam_data = build_nam([entry['name'] for entry in entries], indexed, nam_length, header)
+        except (CustomException, UnicodeEncodeError) as exc:
+            print("ERR: [{1}] failed to write \"{0}\" - {2}".format(out_nam, type(exc).__name__, str(exc)),
+                  file=stderr)
+            sys.exit(1)
+        with open(out_nam, 'wb') as namfile:
+            namfile.write(nam_data)
+
+    write_line('=')
+    print('Output: {0}'.format(', '.join(str(path) for path in (out_hed, out_nam, out_mrg)
+                                         if path != out_nam or yamlobj['has nam filelist'])), file=stderr)
+
+
+############
+# __main__ #
+############
+
+if __name__ == '__main__':
+
+    yaml.add_constructor(u'tag:yaml.org,2002:seq', ordereddict_constructor)
+    yaml.add_representer(OrderedDict, represent_ordereddict)
+
+    parser, args = parse_args()
+    if args.subcommand == "unpack":
+        unpack_verb(args)
+    elif args.subcommand == "replace":
+        replace_verb(args)
+    elif args.subcommand == "compact":
+        compact_verb(args)
+    elif args.subcommand == "repack":
+        repack_verb(args)
+    else:
+        parser.print_usage()
+        sys.exit(20)
+    sys.exit(0)
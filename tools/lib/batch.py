@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+'''Batch processing lib, run one function over many files in a process pool'''
+
+import os
+import time
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+BatchItem = namedtuple('BatchItem', ['item', 'result', 'error'])
+
+
+def _error(exc):
+    return "[{0}] {1}".format(type(exc).__name__, str(exc))
+
+
+def _call(func, item, args):
+    try:
+        return func(item, *args), None
+    except Exception as exc:
+        return None, _error(exc)
+
+
+def _batch_item(item, future):
+    # future is the exception itself when the pool was already broken at submit time
+    if isinstance(future, BrokenProcessPool):
+        return BatchItem(item, None, _error(future))
+    try:
+        return BatchItem(item, *future.result())
+    except BrokenProcessPool as exc:
+        return BatchItem(item, None, _error(exc))
+
+
+def run_batch(func, items, jobs=1, args=()):
+    """
+    Call func(item, *args) for every item, with `jobs` worker processes (0 means one per CPU).
+    Yields BatchItem in input order whatever order the workers finish in, so output stays deterministic.
+    At most 4 calls per worker are submitted ahead of the one being yielded.
+    A raised exception does not stop the batch, it is returned as the item error string. A worker that dies
+    (killed, out of memory) breaks the pool: its item and every item not done yet get the BrokenProcessPool error.
+    func must be a module level function so it can be sent to the workers.
+    """
+    items = list(items)
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(items) < 2:
+        for item in items:
+            yield BatchItem(item, *_call(func, item, args))
+        return
+    jobs = min(jobs, len(items))
+    depth = jobs * 4
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for item in items:
+            if len(pending) >= depth:
+                yield _batch_item(*pending.popleft())
+            try:
+                pending.append((item, pool.submit(_call, func, item, args)))
+            except BrokenProcessPool as exc:
+                pending.append((item, exc))
+        while pending:
+            yield _batch_item(*pending.popleft())
+
+
+def run_threaded(func, items, jobs=0, depth=0, args=()):
+    """
+    Thread pool counterpart of run_batch for I/O bound calls (file writes and hashing release the GIL).
+    `items` is consumed lazily and at most `depth` calls (4 per thread by default) are in flight,
+    so a reader feeding it stays a bounded distance ahead of the writers.
+    Yields func(item, *args) results in input order; an exception is raised again here, in order.
+    """
+    jobs = jobs or min(32, (os.cpu_count() or 1) + 4)
+    if jobs == 1:
+        for item in items:
+            yield func(item, *args)
+        return
+    depth = depth or jobs * 4
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = deque()
+        for item in items:
+            if len(pending) >= depth:
+                yield pending.popleft().result()
+            pending.append(pool.submit(func, item, *args))
+        while pending:
+            yield pending.popleft().result()
+
+
+class BatchReport:
+    """Count successes, failures and processed bytes of a batch, for the final summary line."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.successful = 0
+        self.errors = []
+        self.total_bytes = 0
+
+    def add(self, item, error=None, size=0):
+        if error is None:
+            self.successful += 1
+        else:
+            self.errors.append((item, error))
+        self.total_bytes += size
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def summary(self, unit='files'):
+        elapsed = max(time.perf_counter() - self.start, 1e-6)
+        return "{0} {1}, {2} SUCCESS, {3} FAILURE, {4:.2f} MB in {5:.2f}s ({6:.2f} MB/s)".format(
+            self.successful + self.failed, unit, self.successful, self.failed,
+            self.total_bytes / 0x100000, elapsed, self.total_bytes / 0x100000 / elapsed)
@@ -1,102 +1,397 @@
-#!/usr/bin/env python
-# -*- coding:utf-8 -*-
-#
-# Author: ddn_y, root-none, Lisen
-'''mrgd00 lib'''
-
-DEFAULT_SECTOR_SIZE = 0x800
-
-"""Describes one file in the mrg archive
-Entry info struct{
-    Without .hed: (Same as MZP)
-    uint16 sector_offset; (usually one sector 0x800 bytes)
-    uint16 byte_offset;  (within sector)
-    uint16 size_sectors;  (sector count upper boundary)
-    uint16 size_low;
-
-    With .hed:
-    uint16 offset_low;
-    uint16 offset_high;
-    uint16 size_sectors;  (upper boundary)
-    uint16 size_low;
-}"""
-class ArchiveInfo:
-    def __init__(self, offset1, offset2,
-                 size_sector_upper_boundary, size,
-                 data_start_offset, with_hed):
-        # set file data real offset
-        if with_hed:
-            self.offset_low = offset1
-            self.offset_high = offset2
-            self.real_offset = DEFAULT_SECTOR_SIZE * (((self.offset_high & 0xF000) << 4) | self.offset_low)
-        else:
-            self.sector_offset = offset1
-            self.byte_offset = offset2
-            self.real_offset = self.sector_offset * DEFAULT_SECTOR_SIZE + self.byte_offset
-        self.real_offset += data_start_offset
-
-        # set file data real size
-        self.size_sectors = size_sector_upper_boundary
-        self.size_low = size
-
-        if not with_hed and\
-            self.size_low<((self.size_sectors-1)*DEFAULT_SECTOR_SIZE)\
-                and (self.size_low+self.byte_offset)>((self.size_sectors-1)*DEFAULT_SECTOR_SIZE):
-            # fix sector count for single mrg
-            self.size_sectors -= 1
-
-        if with_hed and self.size_low == 0:
-            self.real_size = self.size_sectors * DEFAULT_SECTOR_SIZE
-        else:
-            self.real_size = ((DEFAULT_SECTOR_SIZE * (self.size_sectors - 1)) & 0xFFFF0000) | self.size_low
-
-
-"""Voice Entry info struct{
-    uint16 offset_low;
-    uint16 offset_high and size;
-}"""
-class VoiceInfo:
-    def __init__(self, offset_low, offset_size_high):
-        self.offset_low = offset_low
-        self.offset_size_high = offset_size_high
-        self.real_offset = DEFAULT_SECTOR_SIZE * (((offset_size_high & 0xF000) << 4) | offset_low)
-        self.real_size = DEFAULT_SECTOR_SIZE * (offset_size_high & 0x0FFF)
-        # self.real_size = DEFAULT_SECTOR_SIZE * (((offset_size_high & 0x0F00)<<8)|(offset_size_high & 0x00FF))
-
-
-# Author: Lisen, root-none, base hedutil.HedEntry.to_block
-def calculate_entry_desc(current_offset, data_size, is_combine, is_voice=None):
-    sector_size = DEFAULT_SECTOR_SIZE
-    if is_combine:
-        sector_offset = current_offset // sector_size
-        byte_offset = current_offset % sector_size
-        size_sectors = (data_size + sector_size - 1) // sector_size
-        if byte_offset + data_size > sector_size * size_sectors:
-            size_sectors += 1
-        return sector_offset, byte_offset, size_sectors, data_size&0xFFFF
-    else:
-        offset_aligned = current_offset // sector_size
-        offset_low = offset_aligned & 0xFFFF
-        offset_high = (offset_aligned & 0xF0000) >> 4
-        if is_voice:
-            size_sectors = data_size // sector_size
-            assert data_size%sector_size == 0
-            offset_size_high = offset_high | (size_sectors & 0x0FFF)
-            return offset_low, offset_size_high
-        size_low = data_size & 0xFFFF
-        if (size_low == 0) or (data_size % sector_size == 0):
-            size_sectors = data_size // sector_size
-        else:
-            size_sectors = data_size // sector_size + 1
-        return offset_low, offset_high, size_sectors, size_low
-
-
-# Author: Hintay, root-none, base hedutil.write_entry_with_padding
-def add_entry_padding(is_combine, data_size):
-    if is_combine:
-        pad_len = 8 - data_size % 8
-        pad_data = b'\xFF'*pad_len
-    else:
-        pad_len = (DEFAULT_SECTOR_SIZE - data_size % DEFAULT_SECTOR_SIZE) if data_size % DEFAULT_SECTOR_SIZE else 0
-        pad_data = b'\x00'*(pad_len%0x10) + (b'\x0c'+b'\x00'*0xF)*(pad_len//0x10)
-    return pad_len, pad_data
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# Author: ddn_y, root-none, Lisen
+'''mrgd00 lib'''
+
+import io
+import os
+import sys
+import mmap
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+from lib.batch import run_threaded
+
+DEFAULT_SECTOR_SIZE = 0x800
+COPY_CHUNK = 0x100000  # block size of the user space copy fallback
+
+"""Describes one file in the mrg archive
+Entry info struct{
+    Without .hed: (Same as MZP)
+    uint16 sector_offset; (usually one sector 0x800 bytes)
+    uint16 byte_offset;  (within sector)
+    uint16 size_sectors;  (sector count upper boundary)
+    uint16 size_low;
+
+    With .hed:
+    uint16 offset_low;
+    uint16 offset_high;
+    uint16 size_sectors;  (upper boundary)
+    uint16 size_low;
+}"""
+class ArchiveInfo:
+    def __init__(self, offset1, offset2,
+                 size_sector_upper_boundary, size,
+                 data_start_offset, with_hed):
+        # set file data real offset
+        if with_hed:
+            self.offset_low = offset1
+            self.offset_high = offset2
+            self.real_offset = DEFAULT_SECTOR_SIZE * (((self.offset_high & 0xF000) << 4) | self.offset_low)
+        else:
+            self.sector_offset = offset1
+            self.byte_offset = offset2
+            self.real_offset = self.sector_offset * DEFAULT_SECTOR_SIZE + self.byte_offset
+        self.real_offset += data_start_offset
+
+        # set file data real size
+        self.size_sectors = size_sector_upper_boundary
+        self.size_low = size
+
+        if not with_hed and\
+            self.size_low<((self.size_sectors-1)*DEFAULT_SECTOR_SIZE)\
+                and (self.size_low+self.byte_offset)>((self.size_sectors-1)*DEFAULT_SECTOR_SIZE):
+            # fix sector count for single mrg
+            self.size_sectors -= 1
+
+        if with_hed and self.size_low == 0:
+            self.real_size = self.size_sectors * DEFAULT_SECTOR_SIZE
+        else:
+            self.real_size = ((DEFAULT_SECTOR_SIZE * (self.size_sectors - 1)) & 0xFFFF0000) | self.size_low
+
+
+"""Voice Entry info struct{
+    uint16 offset_low;
+    uint16 offset_high and size;
+}"""
+class VoiceInfo:
+    def __init__(self, offset_low, offset_size_high):
+        self.offset_low = offset_low
+        self.offset_size_high = offset_size_high
+        self.real_offset = DEFAULT_SECTOR_SIZE * (((offset_size_high & 0xF000) << 4) | offset_low)
+        self.real_size = DEFAULT_SECTOR_SIZE * (offset_size_high & 0x0FFF)
+        # self.real_size = DEFAULT_SECTOR_SIZE * (((offset_size_high & 0x0F00)<<8)|(offset_size_high & 0x00FF))
+
+
+# Author: Lisen, root-none, base hedutil.HedEntry.to_block
+def calculate_entry_desc(current_offset, data_size, is_combine, is_voice=None):
+    sector_size = DEFAULT_SECTOR_SIZE
+    if is_combine:
+        sector_offset = current_offset // sector_size
+        byte_offset = current_offset % sector_size
+        size_sectors = (data_size + sector_size - 1) // sector_size
+        if byte_offset + data_size > sector_size * size_sectors:
+            size_sectors += 1
+        return sector_offset, byte_offset, size_sectors, data_size&0xFFFF
+    else:
+        offset_aligned = current_offset // sector_size
+        offset_low = offset_aligned & 0xFFFF
+        offset_high = (offset_aligned & 0xF0000) >> 4
+        if is_voice:
+            size_sectors = data_size // sector_size
+            assert data_size%sector_size == 0
+            offset_size_high = offset_high | (size_sectors & 0x0FFF)
+            return offset_low, offset_size_high
+        size_low = data_size & 0xFFFF
+        if (size_low == 0) or (data_size % sector_size == 0):
+            size_sectors = data_size // sector_size
+        else:
+            size_sectors = data_size // sector_size + 1
+        return offset_low, offset_high, size_sectors, size_low
+
+
+# Author: Hintay, root-none, base hedutil.write_entry_with_padding
+def add_entry_padding(is_combine, data_size):
+    if is_combine:
+        pad_len = 8 - data_size % 8
+        pad_data = b'\xFF'*pad_len
+    else:
+        pad_len = (DEFAULT_SECTOR_SIZE - data_size % DEFAULT_SECTOR_SIZE) if data_size % DEFAULT_SECTOR_SIZE else 0
+        pad_data = b'\x00'*(pad_len%0x10) + (b'\x0c'+b'\x00'*0xF)*(pad_len//0x10)
+    return pad_len, pad_data
+
+
+def copy_file_data(dst, src_path, size, offset=0):
+    """
+    Copy `size` bytes at `offset` of src_path to the current position of dst, an unbuffered ('wb', buffering=0) file.
+    The kernel copies them (copy_file_range, then sendfile) when the platform and file system allow it,
+    otherwise they go through COPY_CHUNK blocks, so memory use does not depend on the file size.
+    """
+    pos = dst.tell()
+    done = 0
+    with open(src_path, 'rb', buffering=0) as src:
+        try:
+            while done < size:
+                if hasattr(os, 'copy_file_range'):
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), size - done, offset + done, pos + done)
+                elif hasattr(os, 'sendfile'):
+                    dst.seek(pos + done)
+                    copied = os.sendfile(dst.fileno(), src.fileno(), offset + done, size - done)
+                else:
+                    break
+                if not copied:
+                    break
+                done += copied
+        except OSError:
+            pass  # e.g. cross device or unsupported file system, finish below
+        src.seek(offset + done)
+        dst.seek(pos + done)
+        while done < size:
+            block = src.read(min(COPY_CHUNK, size - done))
+            if not block:
+                break
+            dst.write(block)
+            done += len(block)
+    assert done == size, f"{src_path} is shorter than expected ({done} of {size} bytes copied)"
+    return done
+
+
+MrgEntry = namedtuple('MrgEntry', ['index', 'real_offset', 'real_size', 'size_sectors'])
+ArchiveProblem = namedtuple('ArchiveProblem', ['index', 'offset', 'check', 'detail'])
+
+
+def _map_file(path):
+    # read-only mapping, an empty file cannot be mapped
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def decode_entry_table(table, entry_length, data_start_offset, with_hed):
+    """
+    Decode a whole .hed or mrgd00 entry table at once, same rules as ArchiveInfo/VoiceInfo.
+    Records starting with 0xFFFFFFFF (.hed padding) are skipped, MrgEntry.index keeps the record index.
+    """
+    words = array('H')
+    words.frombytes(table[:len(table) - len(table) % entry_length])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    entries = []
+    sector = DEFAULT_SECTOR_SIZE
+    if entry_length == 4:
+        for i, (offset_low, offset_size_high) in enumerate(zip(words[0::2], words[1::2])):
+            if offset_low == 0xFFFF and offset_size_high == 0xFFFF:
+                continue
+            size_sectors = offset_size_high & 0x0FFF
+            entries.append(MrgEntry(i, sector * (((offset_size_high & 0xF000) << 4) | offset_low),
+                                    sector * size_sectors, size_sectors))
+        return entries
+    for i, (offset1, offset2, size_sectors, size_low) in enumerate(
+            zip(words[0::4], words[1::4], words[2::4], words[3::4])):
+        if offset1 == 0xFFFF and offset2 == 0xFFFF:
+            continue
+        if with_hed:
+            real_offset = sector * (((offset2 & 0xF000) << 4) | offset1)
+        else:
+            real_offset = offset1 * sector + offset2
+            if size_low < (size_sectors - 1) * sector < size_low + offset2:
+                # fix sector count for single mrg
+                size_sectors -= 1
+        if with_hed and size_low == 0:
+            real_size = size_sectors * sector
+        else:
+            real_size = ((sector * (size_sectors - 1)) & 0xFFFF0000) | size_low
+        entries.append(MrgEntry(i, real_offset + data_start_offset, real_size, size_sectors))
+    return entries
+
+
+class MrgEntryFile(io.RawIOBase):
+    """Seekable read-only file object over one archive entry, reads come straight from the mapping."""
+
+    def __init__(self, view):
+        super().__init__()
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += len(self.view)
+        if pos < 0:
+            raise ValueError("negative seek position {}".format(pos))
+        self.pos = pos
+        return pos
+
+    def readinto(self, b):
+        data = self.view[self.pos:self.pos + len(b)]
+        size = len(data)
+        b[:size] = data
+        self.pos += size
+        return size
+
+
+class MrgArchive:
+    """
+    Memory-mapped .mrg archive, split (.hed beside it) or single (mrgd00 header, also .mzp).
+    The entry table is decoded once, entry data is handed out as memoryview slices of the mapping.
+    hed_path/nam_path default to the files with the same basename when they exist, False disables them.
+    `data` (bytes-like, e.g. an entry of another archive) stands in for the .mrg file, mrg_path only names it
+    and no .hed/.nam is looked for unless given.
+    """
+
+    def __init__(self, mrg_path, hed_path=None, nam_path=None, data=None):
+        self.path = Path(mrg_path)
+        if hed_path is None:
+            hed_path = self.path.with_suffix('.hed') if data is None else False
+        if nam_path is None:
+            nam_path = self.path.with_suffix('.nam') if data is None else False
+        self.hed_path = Path(hed_path) if hed_path and Path(hed_path).is_file() else None
+        self.nam_path = Path(nam_path) if nam_path and Path(nam_path).is_file() else None
+
+        self.owns_data = data is None  # a given buffer is left open by close()
+        self.data = _map_file(self.path) if data is None else data
+        self.view = memoryview(self.data)
+        self.nam = _map_file(self.nam_path) if self.nam_path else None
+        self.names = None
+        self.has_hed = self.hed_path is not None
+        if self.has_hed:
+            # with .hed, the mrg does not contain its magic and entries num
+            table = self.hed_path.read_bytes()
+            first_entry_high = int.from_bytes(table[2:4], 'little')
+            self.entry_length = 8 if (first_entry_high & 0x0FFF) == 0 else 4
+            self.data_start_offset = 0
+        else:
+            if bytes(self.view[:6]) != b'mrgd00':
+                raise ValueError(f"Unknown header: {bytes(self.view[:6])}. {self.path.name} might not mrgd00 format!")
+            entries_num = int.from_bytes(self.view[6:8], 'little')
+            self.entry_length = 8
+            self.data_start_offset = 8 + entries_num * self.entry_length
+            table = self.view[8:self.data_start_offset]
+        self.record_count = len(table) // self.entry_length
+        self.entries = decode_entry_table(table, self.entry_length, self.data_start_offset, self.has_hed)
+        self.by_index = {entry.index: entry for entry in self.entries}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def set_names(self, names):
+        """Attach entry names by record index (a lib.nam.NamTable of self.nam) for lookups by name."""
+        self.names = names
+
+    def entry(self, key):
+        """MrgEntry by record index, by name or the entry itself."""
+        if isinstance(key, MrgEntry):
+            return key
+        if isinstance(key, str):
+            if self.names is None:
+                raise KeyError(f"{self.path.name} has no entry names, look up {key} by index")
+            return self.by_index[self.names.index(key)]
+        return self.by_index[key]
+
+    def read(self, key) -> memoryview:
+        """Zero-copy slice of the entry data."""
+        entry = self.entry(key)
+        return self.view[entry.real_offset:entry.real_offset + entry.real_size]
+
+    def open(self, key) -> MrgEntryFile:
+        return MrgEntryFile(self.read(key))
+
+    def write_entries(self, output_path, names, jobs=0, hash_func=None):
+        """
+        Save every entry as output_path/names[entry index], write-behind: entries are walked in offset order
+        while a thread pool (lib.batch.run_threaded) does the writes.
+        When a name repeats, only the last entry by index is written, the one sequential writes would leave.
+        Yields (entry, name, result) in offset order once written, result is (hash_func(data), mtime_ns)
+        with hash_func, None otherwise.
+        """
+        last_writer = {os.path.normcase(names[entry.index]): entry.index for entry in self.entries}
+        ordered = [entry for entry in sorted(self.entries, key=lambda e: e.real_offset)
+                     if last_writer[os.path.normcase(names[entry.index])] == entry.index]
+
+        def write(entry):
+            path = output_path.joinpath(names[entry.index])
+            data = self.read(entry)
+            with open(path, 'wb') as f:
+                f.write(data)
+            result = (hash_func(data), path.stat().st_mtime_ns) if hash_func else None
+            return entry, names[entry.index], result
+
+        yield from run_threaded(write, ordered, jobs)
+
+    def close(self):
+        self.view.release()
+        for mapped in (self.data if self.owns_data else None, self.nam):
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    pass  # entry slices still alive, released with them
+
+
+def verify_entries(archive, check_padding=True):
+    """
+    Check the entry table of a MrgArchive against its data, the entries themselves are not read.
+    range: entry inside the data part; sectors: size_sectors matches the size rebuilt from it and size_low
+    (as decode_entry_table does); overlap: no entry starts inside another one, entries sharing the same range
+    (`repack --dedupe`) are fine; padding: the fill add_entry_padding writes follows each entry.
+    Entries are walked in offset order, so the archive is read front to back only once.
+    Returns (problems, shared, unreferenced): ArchiveProblem list in offset order, entries sharing the range
+    of an earlier one, bytes not covered by an entry or its padding.
+    """
+    sector = DEFAULT_SECTOR_SIZE
+    data_size = len(archive.view)
+    if isinstance(archive.data, mmap.mmap) and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        archive.data.madvise(mmap.MADV_SEQUENTIAL)
+    problems = []
+    shared = unreferenced = 0
+    last = None  # entry reaching the furthest so far
+    last_end = covered = archive.data_start_offset  # covered also counts the padding
+    for entry in sorted(archive.entries, key=lambda e: (e.real_offset, e.real_size)):
+        offset, size = entry.real_offset, entry.real_size
+        end = offset + size
+        if last is not None and (offset, size) == (last.real_offset, last.real_size):
+            shared += 1
+            continue
+        if offset < archive.data_start_offset or end > data_size:
+            problems.append(ArchiveProblem(entry.index, offset, 'range', '{0:#x}-{1:#x} outside the data part '
+                                           '{2:#x}-{3:#x}'.format(offset, end, archive.data_start_offset, data_size)))
+            continue
+
+        if archive.entry_length == 8:
+            needed = spanned = (size + sector - 1) // sector
+            if not archive.has_hed:
+                # a mrgd00 entry may count the sector its byte offset starts in
+                spanned = ((offset - archive.data_start_offset) % sector + size + sector - 1) // sector
+            if not needed <= entry.size_sectors <= spanned:
+                expected = needed if needed == spanned else '{0}-{1}'.format(needed, spanned)
+                problems.append(ArchiveProblem(entry.index, offset, 'sectors', 'size_sectors {0} for {1} bytes, '
+                                               'expected {2}'.format(entry.size_sectors, size, expected)))
+        if offset < last_end:
+            problems.append(ArchiveProblem(entry.index, offset, 'overlap', 'starts inside entry {0} '
+                                           '({1:#x}-{2:#x})'.format(last.index, last.real_offset, last_end)))
+
+        pad_len = 0
+        if check_padding:
+            pad_len, pad_data = add_entry_padding(not archive.has_hed, size)
+            if bytes(archive.view[end:end + pad_len]) != pad_data:
+                fill = '0xFF' if not archive.has_hed else '0x00/0x0c'
+                problems.append(ArchiveProblem(entry.index, offset, 'padding', '{0} bytes after {1:#x} are not '
+                                               '{2} fill'.format(pad_len, end, fill)))
+        unreferenced += max(offset - covered, 0)
+        covered = max(covered, end + pad_len)
+        if end > last_end:
+            last, last_end = entry, end
+    unreferenced += max(data_size - covered, 0)
+    return problems, shared, unreferenced
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# Author: Hintay, root-none, base hedutil.NamUtil and mrg_tool.extract_filenames
+'''.nam lib, parse entry names of a .hed/.mrg in one pass'''
+
+import re
+import sys
+from array import array
+
+NAM_MAGIC = b'MRG.NAM'
+NAM_HEADER_SIZE = 0x20
+
+"""NAM struct, one of{
+    Fixed width: (voice*, 0x8 or 0x10 bytes)
+        n times { char name[length]; }  // NUL padded
+    Lines: (allpac etc, usually 0x20 bytes)
+        n times { char name[]; '\n' }  // NUL padded, ends with '\r\n'
+    Indexed:
+        char magic[7];  // MRG.NAM
+        char unknown[9];
+        uint32 names_count;  // at 0x10
+        char unknown[12];
+        uint32 offsets[names_count];  // at 0x20
+        names_count times {
+            uint32 index;
+            char name[];  // up to next offset, NUL padded
+        }
+}"""
+
+
+class NamTable:
+    """
+    Entry names of a .nam, read in one pass: the data is kept as given (bytes, mmap or memoryview, not
+    copied) and only record boundaries are stored (offset arrays), a name is sliced and decoded when asked for.
+    `record_length` selects fixed width records, without it non-indexed data is split in lines.
+    """
+
+    def __init__(self, data, record_length=None, encoding='cp932'):
+        self.data = data
+        self.encoding = encoding
+        self.indexed = bytes(data[:len(NAM_MAGIC)]) == NAM_MAGIC
+        self.record_length = None if self.indexed else record_length
+        self.starts = self.ends = None
+        self.name_index = None
+        if self.indexed:
+            count = int.from_bytes(self.data[0x10:0x14], 'little')
+            self.starts = array('I')
+            self.starts.frombytes(self.data[NAM_HEADER_SIZE:NAM_HEADER_SIZE + 4 * count])
+            if sys.byteorder == 'big':
+                self.starts.byteswap()
+            self.ends = self.starts[1:]
+            self.ends.append(len(self.data))
+            self.count = count
+        elif record_length:
+            self.count = len(self.data) // record_length
+        else:
+            # data after the last line break is one more record
+            self.ends = array('I', (m.start() for m in re.finditer(b'\n', data)))
+            self.starts = array('I', [0])
+            self.starts.extend(end + 1 for end in self.ends)
+            self.ends.append(len(data))
+            self.count = len(self.starts)
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, i):
+        """Record bytes of name `i`, without the line break or the index field."""
+        if not 0 <= i < self.count:
+            raise IndexError("name index {} out of range".format(i))
+        if self.record_length:
+            return bytes(self.data[i * self.record_length:(i + 1) * self.record_length])
+        start, end = self.starts[i], self.ends[i]
+        if not self.indexed:
+            return bytes(self.data[start:end])
+        self._check_index(i, start)
+        return bytes(self.data[start + 4:end])
+
+    def _check_index(self, i, start):
+        in_count = int.from_bytes(self.data[start:start + 4], 'little')
+        if in_count != i:
+            raise ValueError(f"Error: can't get name from index {i}, the in-header index is {in_count}")
+
+    def records(self):
+        """Every record at once, cheaper than calling raw() in a loop."""
+        if self.indexed:
+            records = []
+            for i, (start, end) in enumerate(zip(self.starts, self.ends)):
+                self._check_index(i, start)
+                records.append(bytes(self.data[start + 4:end]))
+            return records
+        if self.record_length:
+            length = self.record_length
+            return [bytes(self.data[start:start + length]) for start in range(0, self.count * length, length)]
+        return re.split(b'\n', self.data)
+
+    def decode(self, name_bytes):
+        name_bytes = name_bytes.rstrip(b'\r')
+        if b'\x00' in name_bytes:
+            name_bytes = name_bytes[:name_bytes.index(b'\x00')]
+        return name_bytes.decode(self.encoding)
+
+    def __getitem__(self, i):
+        return self.decode(self.raw(i))
+
+    def __iter__(self):
+        return map(self.decode, self.records())
+
+    def index(self, name):
+        """Record index of a decoded name, the first one for duplicated names. KeyError when absent."""
+        if self.name_index is None:
+            # reverse lookup built on the first call
+            self.name_index = first_indexes(self)
+        return self.name_index[name]
+
+
+def first_indexes(names):
+    """Map each name to the index of its first occurrence."""
+    name_index = {}
+    for i, name in enumerate(names):
+        name_index.setdefault(name, i)
+    return name_index
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+'''Sector delta patch lib, carry only the changed sectors of a rebuilt .mrg plus its new .hed/.nam'''
+
+import os
+import hashlib
+from collections import namedtuple
+from pathlib import Path
+from struct import Struct
+
+from lib.mrgd import DEFAULT_SECTOR_SIZE, COPY_CHUNK, copy_file_data
+
+PATCH_MAGIC = b'MRGPATCH'
+PATCH_VERSION = 2
+SIDE_SUFFIXES = ('.hed', '.nam')  # files replaced as a whole, beside the .mrg
+
+"""Patch struct{
+    char magic[8];  // MRGPATCH
+    uint32 version;
+    uint32 sector_size;  // granularity of the runs, 0x800
+    uint64 source_size;  // original .mrg size
+    char source_hash[16];  // blake2b of the whole original, see source_digest()
+    uint64 target_size;  // rebuilt .mrg size, the target is truncated to it
+    uint32 hed_size;  // 0 when the .hed is left as is (unchanged or missing in the rebuilt set)
+    uint32 nam_size;  // same for the .nam
+    uint32 runs_count;
+    char hed[hed_size];
+    char nam[nam_size];
+    runs_count times { uint64 offset; uint64 size; }
+    { run data, in the order of the runs }
+}"""
+PATCH_HEADER = Struct('<8sIIQ16sQIII')
+PATCH_RUN = Struct('<QQ')
+
+PatchInfo = namedtuple('PatchInfo', ['runs', 'run_bytes', 'source_size', 'target_size'])
+
+
+def changed_runs(original_path, rebuilt_path, sector_size=DEFAULT_SECTOR_SIZE):
+    """
+    (offset, size) of the sector runs of rebuilt_path that differ from original_path or lie past its end.
+    Both files are read once side by side in COPY_CHUNK blocks, equal blocks are skipped whole.
+    """
+    runs = []
+    run_start = None
+    offset = 0
+    with open(original_path, 'rb') as original, open(rebuilt_path, 'rb') as rebuilt:
+        for new in iter(lambda: rebuilt.read(COPY_CHUNK), b''):
+            old = original.read(COPY_CHUNK)
+            if new == old:
+                if run_start is not None:
+                    runs.append((run_start, offset - run_start))
+                    run_start = None
+            else:
+                for pos in range(0, len(new), sector_size):
+                    sector = new[pos:pos + sector_size]
+                    # a shorter rebuild only compares its last partial sector, the rest is truncated
+                    if sector != old[pos:pos + len(sector)]:
+                        if run_start is None:
+                            run_start = offset + pos
+                    elif run_start is not None:
+                        runs.append((run_start, offset + pos - run_start))
+                        run_start = None
+            offset += len(new)
+    if run_start is not None:
+        runs.append((run_start, offset - run_start))
+    return runs
+
+
+def source_digest(mrg_path):
+    """
+    Checksum of what a patch expects to find: the .hed/.nam beside mrg_path and the whole .mrg.
+    Any other archive of the same size is told apart, not only one differing in the sectors the runs overwrite.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    mrg_path = Path(mrg_path)
+    for suffix in SIDE_SUFFIXES:
+        side_path = mrg_path.with_suffix(suffix)
+        side_data = side_path.read_bytes() if side_path.is_file() else b''
+        digest.update(len(side_data).to_bytes(8, 'little'))
+        digest.update(side_data)
+    with open(mrg_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_CHUNK), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def create_patch(original_path, rebuilt_path, patch_path, sector_size=DEFAULT_SECTOR_SIZE) -> PatchInfo:
+    """Write the patch turning original_path (.mrg, with its .hed/.nam) into rebuilt_path."""
+    original_path, rebuilt_path = Path(original_path), Path(rebuilt_path)
+    source_size = original_path.stat().st_size
+    target_size = rebuilt_path.stat().st_size
+    runs = changed_runs(original_path, rebuilt_path, sector_size)
+    sides = []
+    for suffix in SIDE_SUFFIXES:
+        side_path = rebuilt_path.with_suffix(suffix)
+        side_data = side_path.read_bytes() if side_path.is_file() else b''
+        original_side = original_path.with_suffix(suffix)
+        if original_side.is_file() and original_side.read_bytes() == side_data:
+            side_data = b''
+        sides.append(side_data)
+
+    with open(patch_path, 'wb', buffering=0) as f:
+        f.write(PATCH_HEADER.pack(PATCH_MAGIC, PATCH_VERSION, sector_size, source_size,
+                                  source_digest(original_path), target_size,
+                                  len(sides[0]), len(sides[1]), len(runs)))
+        for side_data in sides:
+            f.write(side_data)
+        f.write(b''.join(PATCH_RUN.pack(offset, size) for offset, size in runs))
+        for offset, size in runs:
+            copy_file_data(f, rebuilt_path, size, offset)
+    return PatchInfo(len(runs), sum(size for _, size in runs), source_size, target_size)
+
+
+def _write_at(f, data, offset):
+    # positional write where the platform has it, the file position is not used then
+    if hasattr(os, 'pwrite'):
+        done = 0
+        while done < len(data):
+            done += os.pwrite(f.fileno(), data[done:], offset + done)
+    else:
+        f.seek(offset)
+        f.write(data)
+
+
+def apply_patch(patch_path, target_path) -> PatchInfo:
+    """
+    Patch target_path (.mrg, with its .hed/.nam) in place with positional writes of the runs.
+    The target is checked against the source size and checksum first, a ValueError leaves it untouched.
+    """
+    target_path = Path(target_path)
+    with open(patch_path, 'rb') as patch:
+        header = patch.read(PATCH_HEADER.size)
+        if len(header) < PATCH_HEADER.size or header[:len(PATCH_MAGIC)] != PATCH_MAGIC:
+            raise ValueError(f"{Path(patch_path).name} is not a mrg patch")
+        magic, version, sector_size, source_size, source_hash, target_size, hed_size, nam_size, runs_count = \
+            PATCH_HEADER.unpack(header)
+        if version != PATCH_VERSION:
+            raise ValueError(f"{Path(patch_path).name} is a version {version} patch, expected {PATCH_VERSION}")
+        sides = [patch.read(hed_size), patch.read(nam_size)]
+        table = patch.read(runs_count * PATCH_RUN.size)
+        runs = list(PATCH_RUN.iter_unpack(table))
+        if len(sides[0]) < hed_size or len(sides[1]) < nam_size or len(runs) < runs_count or \
+                os.fstat(patch.fileno()).st_size < patch.tell() + sum(size for _, size in runs):
+            raise ValueError(f"{Path(patch_path).name} is truncated")
+        if target_path.stat().st_size != source_size:
+            raise ValueError(f"{target_path.name} is {target_path.stat().st_size} bytes, the patch expects {source_size}")
+        if source_digest(target_path) != source_hash:
+            raise ValueError(f"{target_path.name} is not the archive this patch was created from")
+
+        with open(target_path, 'r+b', buffering=0) as f:
+            for offset, size in runs:
+                remaining = size
+                while remaining > 0:
+                    block = patch.read(min(COPY_CHUNK, remaining))
+                    if not block:
+                        raise ValueError(f"{Path(patch_path).name} is truncated")
+                    _write_at(f, block, offset + size - remaining)
+                    remaining -= len(block)
+            f.truncate(target_size)
+    for suffix, side_data in zip(SIDE_SUFFIXES, sides):
+        if side_data:
+            target_path.with_suffix(suffix).write_bytes(side_data)
+    return PatchInfo(len(runs), sum(size for _, size in runs), source_size, target_size)
@@ -15,6 +15,7 @@ from struct import unpack, pack
 import glob
 import re
 from mzx.comp_mzx0 import mzx0_compress
+from lib.batch import run_batch, BatchReport
 
 
 class CustomException(Exception):
@@ -31,15 +32,12 @@ def makedir(dirname):
             raise
 
 
-def process_directory(sourcedirpath, args, mask='*.txt'):
-    successful = failed = 0
-    for filepath in glob.iglob(os.path.join(sourcedirpath, mask)):
-        s = process_path(filepath, args)
-        if s != "OK":
-            failed += 1
-        else:
-            successful += 1
-    return [successful, failed]
+def process_directory(sourcedirpath, args, report, mask='*.txt'):
+    filepaths = sorted(glob.iglob(os.path.join(sourcedirpath, mask)))
+    for filepath, s, error in run_batch(process_path, filepaths, getattr(args, 'jobs', 1), (args,)):
+        if error:
+            print("ERR: failed to process \"{0}\" - {1}".format(filepath, error), file=stderr)
+        report.add(filepath, error or (None if s == "OK" else s))
 
 
 def process_path(sourcepath, args):
@@ -110,7 +108,6 @@ def process_path(sourcepath, args):
         return "OK"
     except CustomException as exc:
         print("[FAILED]")
-        nfailed += 1
         print("ERR: [{1}] failed to process \"{0}\" - {2}".format(sourcepath, type(exc).__name__, str(exc)),
               file=stderr)
         if outpath is not None and os.path.isfile(outpath):
@@ -141,6 +138,9 @@ if __name__ == '__main__':
     parser.add_argument('-t', '--temp-dir',
                         default=None, dest='tempdir',
                         help='Temporary directory (default: 35precompscript)')
+    parser.add_argument('-j', '--jobs',
+                        default=1, type=int,
+                        help='Worker processes for input folders, 0 for one per CPU (default: 1)')
     args = parser.parse_args()
     if args.outputdir is None:
         args.outputdir = "40buildedscript"
@@ -156,21 +156,13 @@ if __name__ == '__main__':
                                                                                             str(exc)), file=stderr)
         sys.exit(1)
 
-    npassed = nfailed = 0
+    report = BatchReport()
 
     for inpath in args.inputs:
         if os.path.isdir(inpath):
-            successful, failed = process_directory(inpath, args)
+            process_directory(inpath, args, report)
         else:
             s = process_path(inpath, args)
-            if s != "OK":
-                successful = 0
-                failed = 1
-            else:
-                successful = 1
-                failed = 0
-
-        npassed += successful
-        nfailed += failed
+            report.add(inpath, None if s == "OK" else s)
 
-    print("Passed = {0}\nFailed = {1}".format(npassed, nfailed))
+    print("Passed = {0}\nFailed = {1}".format(report.successful, report.failed))
@@ -1,349 +1,836 @@
-#!/usr/bin/env python
-# -*- coding:utf-8 -*-
-#
-# Author: ddn_y(denyu), root-none, Lisen(SpriteLisen)
-# Base on Hintay <hintay@me.com>, Nanashi3 and Quibi etc. work
-#
-# MRG(header mrgd00) files extraction & creation utility
-# For more information, see Specifications/hed_format.md
-"""
-mrg_tool —— rewrite base on hedutil and unpack_allsrc.
-
-Script to unpack or repack a .hed/.nam/.mrg triple
-
-mrg_tool comes with ABSOLUTELY NO WARRANTY.
-"""
-
-import argparse
-import struct
-import os
-import sys
-import io
-from pathlib import Path
-
-from lib.mrgd import ArchiveInfo, VoiceInfo
-from lib.mrgd import calculate_entry_desc, add_entry_padding
-import filename_utils
-
-MODE = ''  # specific game mode for diffrent processing
-
-"""MRG struct{
-    (optional) char magic[6];  // mrgd00
-    (optional) uint16 entries_num;  // number of archive entry descriptors
-    hed struct{
-        entries_num times uint64 Entry Descriptor data
-    }
-    { File Data }
-}
-"""
-
-
-class CustHelpAction(argparse._HelpAction):  # show subcommand help
-    def __call__(self, parser, namespace, values, option_string=None):
-        parser.print_help()
-        for subparser_action in parser._actions:
-            if isinstance(subparser_action, argparse._SubParsersAction):
-                for choice, subparser in subparser_action.choices.items():
-                    print("\n\n== {} ==".format(choice))
-                    print(subparser.format_help())
-        parser.exit()
-
-
-def split_nam_data(nam_data, nam_file_name):
-    if nam_file_name.find('voice') >= 0:
-        if MODE == 'fateSN':
-            # Fate Stay Night Realta Nua
-            nam_length = 0x8
-        elif MODE == 'aiyokuEus':
-            # Aiyoku no Eustia
-            nam_length = 0x10
-        else:
-            raise Exception('Unknown nam-length pattern mode for voice pac')
-        names_count = len(nam_data) // nam_length
-        nam_bufs = [nam_data[(i*nam_length): (i*nam_length+nam_length)] for i in range(names_count)]
-    else:
-        nam_bufs = nam_data.split(b'\x0A')
-    return nam_bufs
-
-
-# Author: root-none, rewrite base hedutil.NamUtil
-def extract_filenames(nam_filename, nam_data, fix=False):
-    namelist = []
-    if nam_data[:0x7] == b'MRG.NAM':
-        names_count, = struct.unpack('<I', nam_data[0x10:0x14])
-        nam_index = {}
-        for i in range(names_count):
-            nam_index[i], = struct.unpack("<I", nam_data[(0x20+i*4): (0x20+i*4+4)])
-        nam_index[names_count] = len(nam_data)  # make sure have the end
-        for i in range(names_count):
-            start_offset, next_offset = nam_index[i], nam_index[i + 1]
-            length = next_offset - start_offset - 4
-            in_count, = struct.unpack("<I", nam_data[start_offset: (start_offset+4)])
-            if in_count != i:
-                raise Exception(f"Error: can't get name from index {i}, the in-header index is {in_count}")
-            name_bytes = nam_data[(start_offset+4): (start_offset+4+length)]
-            if name_bytes.find(b'\x00')>=0:
-                name_bytes = name_bytes[:name_bytes.index(b'\x00')]
-            file_name = name_bytes.decode('cp932')
-            namelist.append(file_name)
-    else:
-        nam_bufs_list = split_nam_data(nam_data, nam_filename)
-        for i,name_bytes in enumerate(nam_bufs_list):
-            file_name = filename_utils.fix_file_name(i, MODE) if fix else ""
-            name_bytes = name_bytes.rstrip(b'\x0d').replace(b'\x01', b'')
-            if name_bytes.find(b'\x00')>=0:
-                tail_part = name_bytes[name_bytes.index(b'\x00'):].replace(b'\x00',b'')
-                name_bytes = name_bytes[:name_bytes.index(b'\x00')]
-                if tail_part:
-                    name_bytes += (b"#"+tail_part)
-            if name_bytes==b"":
-                if i+1!=len(nam_bufs_list):
-                    print(f"Debug: have empty name bytes(index:{i}) in nam file")
-                continue  # last one might be padding
-            try:
-                file_name += name_bytes.decode('cp932')
-            except UnicodeDecodeError:
-                file_name += f"error_name_{name_bytes.hex()}"
-            namelist.append(file_name)
-    return namelist
-
-
-def unpack(args):
-    # read input file
-    mrg_path = Path(args.input)
-    mrg_name = mrg_path.stem.lower()  # mrg name
-    hed_path = mrg_path.with_suffix('.hed')
-    nam_path = mrg_path.with_suffix('.nam')
-    assert mrg_path.exists(), f"{mrg_name}.mrg not found. Please pass the path to the folder it is located in."
-
-    # set output dir
-    output_path = mrg_path.with_name(mrg_name + '_unpack')
-    try:
-        output_path.mkdir(parents=True)
-    except FileExistsError:
-        print(f"Output directory \'{output_path.resolve()}\' already exists. You should delete it first.")
-        return
-    
-    # set game mode if specific
-    if args.mode:
-        global MODE
-        MODE = args.mode 
-
-    # read filenames in .nam file(if exists)
-    filename_list = []
-    if nam_path.exists():
-        print(f"Find \'{mrg_name}.nam\' file.")
-        with open(nam_path, 'rb') as f:
-            nam_data = f.read()
-        filename_list += extract_filenames(nam_path.name,nam_data)
-
-    # read mrg file hed part
-    mrg_file = open(mrg_path, 'rb')
-    has_hed = hed_path.exists()
-    if has_hed:  # if hed file exists, use it first
-        print(f"Find \'{mrg_name}.hed\' file.")
-        hed_file = open(hed_path, 'rb')
-        _low, first_entry_high = struct.unpack('<HH', hed_file.read(0x04))
-        entry_length = 8 if (first_entry_high & 0x0FFF)==0 else 4
-        entries_num = hed_path.stat().st_size // entry_length - 2  # last 2 'entry' is usually 0xFF padding
-        # if mrg with hed file, it will not contain its magic and entry-num header
-        file_data_start_offset = 0
-        hed_file.seek(0)
-        entry_data_file = hed_file
-    else:
-        mrg_header = mrg_file.read(6)  # magic
-        if mrg_header != b'mrgd00':
-            print(f'Unknown header: {mrg_header}. This file might not mrgd00 format!')
-            sys.exit(1)
-        print('header: {0}'.format(mrg_header.decode('ASCII')))
-        entries_num, = struct.unpack('<H', mrg_file.read(2))  # files info count in mrg
-        entry_length = 8  # single mrg usually not contain voice
-        file_data_start_offset = (6 + 2 + entries_num * entry_length)
-        entry_data_file = mrg_file
-    print(f"MRG {mrg_name} Archive count: {entries_num} entries")
-    
-    entries_desc = []
-    indexed_fmt = '{0:04d}' if entries_num < 10000 else '{0:06d}'
-    # read data in mrg file
-    for i in range(entries_num):
-        # read entry
-        if not has_hed:
-            entry_data_file.seek(8+i*entry_length, 0)
-        data_block = entry_data_file.read(entry_length)
-        first_word, = struct.unpack_from('<L', data_block)
-        if first_word == 0xFFFFFFFF:
-            continue
-        if len(data_block) == 8:
-            offset1, offset2, sector_size_upper_boundary, size_low = struct.unpack('<HHHH', data_block)
-            entry_info = ArchiveInfo(offset1, offset2, sector_size_upper_boundary,
-                                    size_low, file_data_start_offset, has_hed)
-        elif len(data_block) == 4:
-            offset_low, offset_size_high = struct.unpack('<HH', data_block)
-            entry_info = VoiceInfo(offset_low, offset_size_high)
-        else:
-            raise ValueError(
-                'Hed Entry constructor expects either a 4-byte or 8-byte binary block, source file may be incomplete')
-        entries_desc.append(entry_info)  # for debug
-
-        # seek data
-        mrg_file.seek(entry_info.real_offset, 0)
-        file_data = mrg_file.read(entry_info.real_size)
-
-        # debug padding part
-        # can also check and verify output file true size in here
-        if has_hed:
-            sec_data_size = entry_info.real_size if mrg_name.startswith('voice') else entry_info.size_sectors*0x800
-            pad_num = sec_data_size - entry_info.real_size
-            page_pad_num = pad_num%0x10
-            sec_pad_num = pad_num//0x10
-            next_bts = mrg_file.read(page_pad_num)
-            if next_bts!=b'\x00'*page_pad_num:
-                pass # breakpoint
-            next_bts = mrg_file.read(sec_pad_num*0x10)
-            if next_bts!=(b'\x0c'+b'\x00'*0xF)*sec_pad_num:
-                pass # breakpoint
-        else:
-            dbg_num = 8-entry_info.real_size%8
-            next_bts = mrg_file.read(dbg_num)
-            if next_bts!=b'\xFF'*dbg_num:
-                pass # breakpoint
-
-        # generate file name
-        if mrg_name.lower()=='allscr' and i==0:
-            # TODO: besides script, other game allscr may have unknown/specific files at the beginning
-            if MODE in ['fateSN', 'fateHA', 'mahoyo']:
-                # Fate Stay Night Realta Nua and Fate Hollow Ataraxia
-                # and Mahoutsukai no Yoru
-                filename_list = ['scr.nam', 'scr_adr.mrg', 'unknown']
-                filename_list += extract_filenames('allscr.nam', file_data, True)
-            else:
-                filename_list = ['scr_adr.mrg']
-        if len(filename_list)>i:
-            file_name = filename_list[i]
-            file_name = filename_utils.add_suffix(file_name, file_data, output_path, indexed_fmt.format(i))
-            filename_list[i] = file_name
-        else:
-            file_name = f'{mrg_name}_file' + indexed_fmt.format(i)
-            file_name = filename_utils.add_suffix(file_name, file_data)
-            filename_list.append(file_name)
-        if '.nam' in file_name: print(f"Find \'{mrg_name}.nam\' file.")
-
-        # save file
-        print(f"save file: {file_name}", end='')
-        with open(output_path.joinpath(file_name), 'wb') as f:
-            f.write(file_data)
-        print(' succeed.')
-
-    # export filename.list
-    with open(output_path.joinpath(f'filename_{mrg_name}.list'), 'w', encoding="utf-8") as f:
-        f.write('\n'.join(filename_list))
-
-    mrg_file.close()
-    print(f'Output Directory: {output_path}')
-
-
-def repack(args):
-    # repack files path
-    files_path = Path(args.source_path)
-    has_hed = not args.combine
-    assert files_path.exists(), f'{files_path} does not found. Please pass the path to the folder contains repack files.'
-
-    # set output path
-    mrg_output_path = Path(args.output) if args.output else files_path.parent.joinpath(f"{files_path.stem.replace('_unpack','')}.mrg")
-    mrg_name = mrg_output_path.stem
-
-    # read filename list
-    file_list_path = files_path.joinpath(f'filename_{mrg_name}.list')
-    assert file_list_path.exists(), f'{file_list_path.name} does not found in {files_path}. Please make sure the path to the folder contains filename list.'
-    with open(file_list_path, 'r', encoding="utf-8") as f:
-        filename_list = [line.rstrip('\n') for line in f.readlines()]
-    print('Loaded Filelist')
-    
-    # pack files
-    hed_buf = b''
-    temp_buf = io.BytesIO()    
-    for file_name in filename_list:
-        assert files_path.joinpath(file_name).exists(), f"Cannot find {file_name} in {files_path}."
-        with open(files_path.joinpath(file_name), 'rb') as f:
-            pack_data = f.read()
-        data_offset, data_size = temp_buf.tell(), len(pack_data)
-        # add padding
-        pad_len, pad_data = add_entry_padding(args.combine, len(pack_data))
-        if has_hed:
-            if mrg_name.startswith('voice'):
-                offset_low, offset_size_high = calculate_entry_desc(data_offset, data_size+pad_len,
-                                                                    False, True)
-                entry_buf = struct.pack('<HH', offset_low, offset_size_high)
-            else:
-                offset_low, offset_high, size_sectors, size_low = calculate_entry_desc(
-                                                                    data_offset, data_size, False)
-                entry_buf = struct.pack('<HHHH', offset_low, offset_high, size_sectors, size_low)
-            pack_data += pad_data
-        else:
-            sector_offset, byte_offset, size_sectors, size_low = calculate_entry_desc(
-                                                                    data_offset, data_size, True)
-            entry_buf = struct.pack('<HHHH', sector_offset, byte_offset, size_sectors, size_low)
-            pack_data += pad_data
-
-        temp_buf.write(pack_data)
-        hed_buf += entry_buf
-        print(f"find and pack file: {file_name}")
-    
-    pack_buf = temp_buf.getvalue()
-    if has_hed:
-        # save hed file
-        hed_buf += b'\xFF' * 0x10
-        hed_output_path = mrg_output_path.with_name(f'new_{mrg_output_path.stem}.hed')
-        with hed_output_path.open('wb') as f:
-            f.write(hed_buf)
-        print(f'save as {hed_output_path.absolute()}')
-    else:
-        # add magic and entries num for single mrg
-        pack_buf = b'\x6D\x72\x67\x64\x30\x30' + struct.pack('<H', len(filename_list)) + hed_buf + pack_buf
-    
-    # save mrg file
-    mrg_output_path = mrg_output_path.with_name(f'new_{mrg_output_path.name}')
-    with mrg_output_path.open('wb') as f:
-        f.write(pack_buf)
-    print(f'save as {mrg_output_path.absolute()}')
-
-
-def parse_args():
-    parser = argparse.ArgumentParser(description=__doc__, add_help=False)
-    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
-
-    # unpack
-    parser_unpack = subparsers.add_parser('unpack', help='unpack mrg and create a filelist')
-    parser_unpack.add_argument('input', metavar='input.mrg', help='Input .mrg file')
-    parser_unpack.add_argument('-m', '--mode', metavar='game_mode',
-                               help='Set game mode to specify different unpack action.')
-
-    # repack
-    parser_repack = subparsers.add_parser('repack', help='generate a new .mrg base an existing MRG filelist')
-    parser_repack.add_argument('-s', '--source_files',
-                               required=True, dest='source_path',
-                               help='Files path to repack, that also contain filename_xxx.list [REQUIRED]')
-    parser_repack.add_argument('-c', '--combine', action="store_true",
-                               default=False, help='Decide whether to generate .hed file. Default False')
-    parser_repack.add_argument('output', metavar='output.mrg',
-                               help='Output .mrg file. Same basename is used for .hed/.nam when needed')
-
-    # help
-    parser.add_argument('-h', '--help',
-                        action=CustHelpAction, default=argparse.SUPPRESS,
-                        help='show this help message and exit')
-
-    return parser, parser.parse_args()
-
-
-if __name__ == "__main__":
-    os.chdir(os.path.dirname(__file__))
-    parser, args = parse_args()
-    if args.subcommand == "unpack":
-        unpack(args)
-    elif args.subcommand == "repack":
-        repack(args)
-    else:
-        parser.print_usage()
-        sys.exit(20)
-    sys.exit(0)
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# Author: ddn_y(denyu), root-none, Lisen(SpriteLisen)
+# Base on Hintay <hintay@me.com>, Nanashi3 and Quibi etc. work
+#
+# MRG(header mrgd00) files extraction & creation utility
+# For more information, see Specifications/hed_format.md
+"""
+mrg_tool —— rewrite base on hedutil and unpack_allsrc.
+
+Script to unpack or repack a .hed/.nam/.mrg triple
+
+mrg_tool comes with ABSOLUTELY NO WARRANTY.
+"""
+
+import argparse
+import struct
+import os
+import sys
+import json
+import hashlib
+import fnmatch
+import mmap
+from collections import namedtuple
+from pathlib import Path
+
+from lib.mrgd import MrgArchive
+from lib.nam import NamTable, NAM_MAGIC
+from lib.mrgd import calculate_entry_desc, add_entry_padding, copy_file_data, verify_entries, COPY_CHUNK
+from lib.batch import run_threaded, run_batch, BatchReport
+from lib.patch import create_patch, apply_patch
+from mzx.decomp_mzx0 import mzx_decompress_data
+import filename_utils
+from prep_scr import decode_scr_buffer, save_decoded_scr
+from _extract_mzp_tiles import MzpFile
+from mzx_tool import xor_arg
+
+MODE = ''  # specific game mode for diffrent processing
+
+"""MRG struct{
+    (optional) char magic[6];  // mrgd00
+    (optional) uint16 entries_num;  // number of archive entry descriptors
+    hed struct{
+        entries_num times uint64 Entry Descriptor data
+    }
+    { File Data }
+}
+"""
+
+
+class CustHelpAction(argparse._HelpAction):  # show subcommand help
+    def __call__(self, parser, namespace, values, option_string=None):
+        parser.print_help()
+        for subparser_action in parser._actions:
+            if isinstance(subparser_action, argparse._SubParsersAction):
+                for choice, subparser in subparser_action.choices.items():
+                    print("\n\n== {} ==".format(choice))
+                    print(subparser.format_help())
+        parser.exit()
+
+
+def nam_record_length(nam_file_name):
+    # voice names are fixed width records, the others are lines
+    if nam_file_name.find('voice') >= 0:
+        if MODE == 'fateSN':
+            # Fate Stay Night Realta Nua
+            return 0x8
+        elif MODE == 'aiyokuEus':
+            # Aiyoku no Eustia
+            return 0x10
+        else:
+            raise Exception('Unknown nam-length pattern mode for voice pac')
+    return None
+
+
+# Author: root-none, rewrite base hedutil.NamUtil
+def extract_filenames(nam_filename, nam_data, fix=False):
+    if bytes(nam_data[:len(NAM_MAGIC)]) == NAM_MAGIC:
+        return list(NamTable(nam_data))
+    namelist = []
+    nam_bufs_list = NamTable(nam_data, nam_record_length(nam_filename)).records()
+    for i,name_bytes in enumerate(nam_bufs_list):
+        file_name = filename_utils.fix_file_name(i, MODE) if fix else ""
+        name_bytes, _, tail_part = name_bytes.rstrip(b'\x0d').replace(b'\x01', b'').partition(b'\x00')
+        tail_part = tail_part.replace(b'\x00',b'')
+        if tail_part:
+            name_bytes += (b"#"+tail_part)
+        if name_bytes==b"":
+            if i+1!=len(nam_bufs_list):
+                print(f"Debug: have empty name bytes(index:{i}) in nam file", file=sys.stderr)
+            continue  # last one might be padding
+        try:
+            file_name += name_bytes.decode('cp932')
+        except UnicodeDecodeError:
+            file_name += f"error_name_{name_bytes.hex()}"
+        namelist.append(file_name)
+    return namelist
+
+
+def load_entry_names(mrg_archive, mrg_name):
+    # filenames by record index, from .nam or from the first entry of allscr
+    filename_list = []
+    if mrg_archive.nam is not None:
+        filename_list += extract_filenames(mrg_archive.nam_path.name, mrg_archive.nam)
+    if mrg_name.lower()=='allscr' and 0 in mrg_archive.by_index:
+        # TODO: besides script, other game allscr may have unknown/specific files at the beginning
+        if MODE in ['fateSN', 'fateHA', 'mahoyo']:
+            # Fate Stay Night Realta Nua and Fate Hollow Ataraxia
+            # and Mahoutsukai no Yoru
+            filename_list = ['scr.nam', 'scr_adr.mrg', 'unknown']
+            filename_list += extract_filenames('allscr.nam', mrg_archive.read(0), True)
+        else:
+            filename_list = ['scr_adr.mrg']
+    return filename_list
+
+
+def parse_index_ranges(ranges):
+    # '3', '10-20' or '1,5,7-9' to a set of record indexes
+    indexes = set()
+    for part in ranges.split(','):
+        start, _, end = part.strip().partition('-')
+        indexes.update(range(int(start), int(end or start) + 1))
+    return indexes
+
+
+def select_entries(mrg_archive, mrg_name, name_globs=None, index_ranges=None, types=None):
+    """
+    Yield (entry, file name, data) of the entries matching every given selector:
+    name glob, index ranges, or file type as sniffed by filename_utils.add_suffix.
+    Data is a memoryview of the mapped archive, only selected entries are read.
+    """
+    filename_list = load_entry_names(mrg_archive, mrg_name)
+    indexes = parse_index_ranges(index_ranges) if index_ranges else None
+    types = {t.lower().lstrip('.') for t in types} if types else None
+    indexed_fmt = '{0:04d}' if len(mrg_archive.entries) < 10000 else '{0:06d}'
+    for entry in mrg_archive.entries:
+        i = entry.index
+        if indexes is not None and i not in indexes:
+            continue
+        file_name = filename_list[i] if len(filename_list)>i else f'{mrg_name}_file' + indexed_fmt.format(i)
+        data = mrg_archive.read(entry)
+        if name_globs and not any(fnmatch.fnmatch(file_name.lower(), g.lower()) for g in name_globs):
+            # unnamed entries can still match on their sniffed suffix
+            file_name = filename_utils.add_suffix(file_name, data)
+            if not any(fnmatch.fnmatch(file_name.lower(), g.lower()) for g in name_globs):
+                continue
+        file_name = filename_utils.add_suffix(file_name, data)
+        if types is not None and file_name[file_name.rfind('.')+1:].lower() not in types:
+            continue
+        yield entry, file_name, data
+
+
+def open_archive(args, input_path=None):
+    mrg_path = Path(input_path or args.input)
+    assert mrg_path.exists(), f"{mrg_path.name} not found. Please pass the path to the folder it is located in."
+    if args.mode:
+        global MODE
+        MODE = args.mode
+    try:
+        return mrg_path, MrgArchive(mrg_path)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+
+def extract(args):
+    mrg_path, mrg_archive = open_archive(args)
+    mrg_name = mrg_path.stem.lower()
+    output_path = Path(args.output) if args.output else mrg_path.with_name(mrg_name + '_extract')
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    written = set()
+    for entry, file_name, data in select_entries(mrg_archive, mrg_name, args.names, args.index, args.types):
+        if file_name in written:
+            # same name twice in the archive, keep both
+            name_part, ext = file_name[:file_name.rfind('.')], file_name[file_name.rfind('.')+1:]
+            file_name = f"{name_part}-{entry.index:04d}.{ext}"
+        written.add(file_name)
+        print(f"save file: {file_name}", end='')
+        with open(output_path.joinpath(file_name), 'wb') as f:
+            f.write(data)
+        print(' succeed.')
+    mrg_archive.close()
+    print(f'{len(written)} entries extracted. Output Directory: {output_path}')
+
+
+def cat(args):
+    mrg_path, mrg_archive = open_archive(args)
+    out = sys.stdout.buffer
+    count = 0
+    for entry, file_name, data in select_entries(mrg_archive, mrg_path.stem.lower(), args.names, args.index, args.types):
+        out.write(data)
+        count += 1
+    out.flush()
+    mrg_archive.close()
+    print(f'{count} entries written to stdout.', file=sys.stderr)
+
+
+def list_entries(args):
+    # only the entry table and names are read, plus the entry heads (and inner tables of mrgd00 entries) with --sniff
+    mrg_path, mrg_archive = open_archive(args)
+    mrg_name = mrg_path.stem.lower()
+    filename_list = load_entry_names(mrg_archive, mrg_name)
+    rows = []
+    for entry in mrg_archive.entries:
+        file_name = filename_list[entry.index] if len(filename_list)>entry.index else ''
+        if args.sniff:
+            sniffed = filename_utils.add_suffix('entry', mrg_archive.read(entry))
+            file_type = sniffed[sniffed.rfind('.')+1:]
+        else:
+            file_type = file_name[file_name.rfind('.')+1:].lower() if '.' in file_name else ''
+        rows.append({'index': entry.index, 'name': file_name, 'offset': entry.real_offset,
+                     'size': entry.real_size, 'sectors': entry.size_sectors, 'type': file_type})
+    mrg_archive.close()
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=1))
+        return
+    print(f"{'index':>6} {'offset':>10} {'size':>10} {'sectors':>7} {'type':<9} name")
+    for row in rows:
+        print(f"{row['index']:>6} {row['offset']:>#10x} {row['size']:>10} {row['sectors']:>7} {row['type']:<9} {row['name']}")
+    print(f"{len(rows)} entries in {mrg_path.name}", file=sys.stderr)
+
+
+def verify(args):
+    # entry table and padding checks, only the table and the bytes after each entry are read
+    mrg_path, mrg_archive = open_archive(args)
+    mrg_name = mrg_path.stem.lower()
+    filename_list = load_entry_names(mrg_archive, mrg_name)
+    # voice archives are not padded, their records count whole sectors
+    problems, shared, unreferenced = verify_entries(mrg_archive, not mrg_name.startswith('voice'))
+    entries_num = len(mrg_archive)
+    mrg_archive.close()
+
+    rows = [{'index': problem.index, 'name': filename_list[problem.index] if len(filename_list)>problem.index else '',
+             'offset': problem.offset, 'check': problem.check, 'detail': problem.detail} for problem in problems]
+    if args.json:
+        print(json.dumps({'archive': mrg_path.name, 'entries': entries_num, 'shared': shared,
+                          'unreferenced': unreferenced, 'problems': rows}, ensure_ascii=False, indent=1))
+    else:
+        print(f"{'index':>6} {'offset':>10} {'check':<8} detail")
+        for row in rows:
+            print(f"{row['index']:>6} {row['offset']:>#10x} {row['check']:<8} {row['detail']} {row['name']}")
+    print(f"{mrg_path.name}: {entries_num} entries, {len(rows)} problems, {shared} shared entries, "
+          f"{unreferenced} unreferenced bytes", file=sys.stderr)
+    return 1 if rows else 0
+
+
+def keyed_entries(mrg_archive, filename_list):
+    # entries by (name, occurrence of the name), by ('', index) when the entry has no name
+    keyed = {}
+    seen = {}
+    for entry in mrg_archive.entries:
+        name = filename_list[entry.index] if len(filename_list)>entry.index else ''
+        if name:
+            seen[name] = seen.get(name, -1) + 1
+            keyed[(name, seen[name])] = entry
+        else:
+            keyed[('', entry.index)] = entry
+    return keyed
+
+
+def mzx_difference(old_data, new_data):
+    # '' when the decompressed contents are the same, None when one of the entries is not MZX
+    try:
+        old_content, _ = mzx_decompress_data(old_data)
+        new_content, _ = mzx_decompress_data(new_data)
+    except ValueError:
+        return None
+    if old_content == new_content:
+        return ''
+    size = min(len(old_content), len(new_content))
+    first = next((i for i in range(0, size, COPY_CHUNK) if old_content[i:i+COPY_CHUNK] != new_content[i:i+COPY_CHUNK]),
+                 size)
+    while first < size and old_content[first] == new_content[first]:
+        first += 1
+    return f"decompressed {len(old_content)} -> {len(new_content)} bytes, first difference at {first:#x}"
+
+
+def diff(args):
+    # sizes come from the entry tables, only entries of the same size are hashed to find content changes
+    old_path, old_archive = open_archive(args, args.old)
+    new_path, new_archive = open_archive(args, args.new)
+    old_names = load_entry_names(old_archive, old_path.stem.lower())
+    new_names = load_entry_names(new_archive, new_path.stem.lower())
+    # entries are matched by name only when both archives have names, by index otherwise
+    by_name = bool(old_names and new_names)
+    old_entries = keyed_entries(old_archive, old_names if by_name else [])
+    new_entries = keyed_entries(new_archive, new_names if by_name else [])
+
+    def entry_name(names, entry):
+        return names[entry.index] if entry is not None and len(names)>entry.index else ''
+
+    changes = []  # [status, name, old entry, new entry, detail]
+    candidates = []
+    for key, old_entry in old_entries.items():
+        new_entry = new_entries.get(key)
+        if new_entry is None:
+            changes.append(['removed', key[0], old_entry, None, ''])
+        elif old_entry.real_size != new_entry.real_size:
+            changes.append(['resized', key[0], old_entry, new_entry, ''])
+        else:
+            candidates.append(['changed', key[0], old_entry, new_entry, ''])
+    changes += [['added', key[0], None, new_entry, ''] for key, new_entry in new_entries.items()
+                if key not in old_entries]
+
+    def content_changed(change):
+        return entry_digest(old_archive.read(change[2])) != entry_digest(new_archive.read(change[3]))
+    changes += [change for change, changed in zip(candidates, run_threaded(content_changed, candidates, args.jobs))
+                if changed]
+    unchanged = len(old_entries) - sum(change[2] is not None for change in changes)
+
+    if args.deep:
+        deep_changes = [change for change in changes if change[2] is not None and change[3] is not None]
+        for change, detail in zip(deep_changes, run_threaded(
+                lambda change: mzx_difference(old_archive.read(change[2]), new_archive.read(change[3])),
+                deep_changes, args.jobs)):
+            if detail == '':
+                change[0] = 'recompressed'
+            elif detail:
+                change[4] = detail
+    changes.sort(key=lambda change: (change[2] is None, (change[2] or change[3]).index))
+    old_archive.close()
+    new_archive.close()
+
+    rows = [{'status': status, 'name': name or entry_name(old_names, old_entry) or entry_name(new_names, new_entry),
+             'old_index': old_entry.index if old_entry else None, 'new_index': new_entry.index if new_entry else None,
+             'old_size': old_entry.real_size if old_entry else None,
+             'new_size': new_entry.real_size if new_entry else None, 'detail': detail}
+            for status, name, old_entry, new_entry, detail in changes]
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=1))
+    else:
+        print(f"{'status':<12} {'old':>6} {'new':>6} {'old size':>10} {'new size':>10} name")
+        for row in rows:
+            columns = ['' if row[key] is None else row[key] for key in ('old_index', 'new_index', 'old_size', 'new_size')]
+            print(f"{row['status']:<12} {columns[0]:>6} {columns[1]:>6} {columns[2]:>10} {columns[3]:>10} "
+                  f"{row['name']}" + (f" ({row['detail']})" if row['detail'] else ''))
+    counts = {status: sum(row['status'] == status for row in rows)
+              for status in ('added', 'removed', 'resized', 'changed', 'recompressed')}
+    print(f"{old_path.name} -> {new_path.name}: {unchanged} unchanged, " +
+          ', '.join(f"{count} {status}" for status, count in counts.items() if count or status != 'recompressed'),
+          file=sys.stderr)
+    return 1 if rows else 0
+
+
+def patch(args):
+    if args.patch_command == 'create':
+        rebuilt_path = Path(args.rebuilt)
+        patch_path = Path(args.output) if args.output else rebuilt_path.with_suffix('.mrgpatch')
+        info = create_patch(args.original, rebuilt_path, patch_path)
+        print(f"{info.runs} changed sector runs, {info.run_bytes} of {info.target_size} bytes")
+        print(f"save patch: {patch_path} ({patch_path.stat().st_size} bytes)")
+        return 0
+    try:
+        info = apply_patch(args.patch, args.target)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    print(f"{info.runs} sector runs written, {info.run_bytes} bytes, {args.target} is now {info.target_size} bytes")
+    return 0
+
+
+def entry_digest(data):
+    # fast content hash kept in the unpack manifest
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_digest(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def entry_unchanged(file_path, record):
+    # same size and mtime as written by unpack, or same content after all
+    stat = file_path.stat()
+    if stat.st_size != record['size']:
+        return False
+    return stat.st_mtime_ns == record['mtime_ns'] or file_digest(file_path) == record['hash']
+
+
+def name_entries(mrg_archive, mrg_name, filename_list):
+    """
+    Name every entry in index order: sniffed suffix, collisions resolved against the names used so far.
+    filename_list is completed in place (unnamed entries are appended), returns {index: file name}.
+    Only the head of each entry is read.
+    """
+    indexed_fmt = '{0:04d}' if len(mrg_archive.entries) < 10000 else '{0:06d}'
+    taken_names = set()
+    entry_names = {}
+    for entry_info in mrg_archive.entries:
+        i = entry_info.index
+        file_data = mrg_archive.read(entry_info)  # sniffing only touches the head of it
+        if len(filename_list)>i:
+            file_name = filename_utils.add_suffix(filename_list[i], file_data)
+            file_name = filename_utils.unique_name(file_name, taken_names, indexed_fmt.format(i))
+            filename_list[i] = file_name
+        else:
+            file_name = f'{mrg_name}_file' + indexed_fmt.format(i)
+            file_name = filename_utils.unique_name(filename_utils.add_suffix(file_name, file_data), taken_names)
+            filename_list.append(file_name)
+        entry_names[i] = file_name
+    return entry_names
+
+
+def unpack(args):
+    # read input file
+    mrg_path = Path(args.input)
+    mrg_name = mrg_path.stem.lower()  # mrg name
+    hed_path = mrg_path.with_suffix('.hed')
+    nam_path = mrg_path.with_suffix('.nam')
+    assert mrg_path.exists(), f"{mrg_name}.mrg not found. Please pass the path to the folder it is located in."
+
+    # set output dir
+    output_path = mrg_path.with_name(mrg_name + '_unpack')
+    try:
+        output_path.mkdir(parents=True)
+    except FileExistsError:
+        print(f"Output directory \'{output_path.resolve()}\' already exists. You should delete it first.")
+        return
+    
+    # set game mode if specific
+    if args.mode:
+        global MODE
+        MODE = args.mode 
+
+    # map mrg file, entry table comes from .hed if it exists, otherwise from mrg head part
+    try:
+        mrg_archive = MrgArchive(mrg_path, hed_path, nam_path)
+    except ValueError as exc:
+        print(exc)
+        sys.exit(1)
+
+    # read filenames in .nam file(if exists)
+    if mrg_archive.nam is not None:
+        print(f"Find \'{mrg_name}.nam\' file.")
+    filename_list = load_entry_names(mrg_archive, mrg_name)
+    has_hed = mrg_archive.has_hed
+    if has_hed:  # if hed file exists, use it first
+        print(f"Find \'{mrg_name}.hed\' file.")
+    else:
+        print('header: {0}'.format(bytes(mrg_archive.view[:6]).decode('ASCII')))
+    print(f"MRG {mrg_name} Archive count: {len(mrg_archive)} entries")
+
+    entry_names = name_entries(mrg_archive, mrg_name, filename_list)
+    for file_name in entry_names.values():
+        if '.nam' in file_name: print(f"Find \'{mrg_name}.nam\' file.")
+
+    # save files, written behind the read by a thread pool
+    saved = {}
+    for entry_info, file_name, (digest, mtime_ns) in mrg_archive.write_entries(output_path, entry_names, args.jobs,
+                                                                               entry_digest):
+        print(f"save file: {file_name} succeed.")
+        saved[entry_info.index] = {'index': entry_info.index, 'offset': entry_info.real_offset,
+                                   'size': entry_info.real_size, 'hash': digest, 'mtime_ns': mtime_ns}
+    # same key order as a sequential unpack, an overwritten name holds its last entry
+    manifest = {}
+    for entry_info in mrg_archive.entries:
+        manifest[entry_names[entry_info.index]] = saved.get(entry_info.index)
+
+    # export filename.list
+    with open(output_path.joinpath(f'filename_{mrg_name}.list'), 'w', encoding="utf-8") as f:
+        f.write('\n'.join(filename_list))
+    # export manifest for `repack --incremental`
+    with open(output_path.joinpath(f'manifest_{mrg_name}.json'), 'w', encoding="utf-8") as f:
+        json.dump({'archive': mrg_path.name, 'archive_size': mrg_path.stat().st_size, 'entries': manifest},
+                  f, ensure_ascii=False, indent=1)
+
+    mrg_archive.close()
+    print(f'Output Directory: {output_path}')
+
+
+DeepOptions = namedtuple('DeepOptions', ['xorff', 'ext', 'unicode', 'verbose'])
+_deep_archives = {}  # archive mapped once per worker process
+DEEP_NESTING = 4  # nested mrgd00/MZX levels followed before an entry is written as is
+
+
+def mzp_to_png(name, data, output_path):
+    # MzpFile seeks and reads its data, an anonymous mapping of the entry stands in for the .mzp file
+    buffer = mmap.mmap(-1, len(data))
+    buffer.write(data)
+    buffer.seek(0)
+    mzp_archive = MrgArchive(name, data=buffer)
+    if not mzp_archive.entries:
+        mzp_archive.close()
+        return []
+    mzp_obj = MzpFile(Path(name), buffer, list(mzp_archive.entries), False, False, interactive=False)
+    mzp_obj.extract_tiles()
+    output_path.mkdir(parents=True, exist_ok=True)
+    mzp_obj.save_image(output_path)
+    mzp_archive.close()
+    return [output_path.joinpath(Path(name).with_suffix('.png').name)]
+
+
+def deep_products(name, data, output_path, options, depth=0):
+    """
+    Convert one entry in memory down to its end products under output_path, returns their paths.
+    MZX is decoded and its content converted in turn, MZP goes to PNG, scr to decoded_script/<stem>.txt and
+    decoded_text/<stem>.csv, nested mrgd00 archives to a <stem> folder entry by entry, the rest is written as is.
+    """
+    stem = name[:name.rfind('.')] if '.' in name else name
+    # MZX is decoded whatever the name says, otherwise the suffix given by unpack naming decides
+    kind = filename_utils.add_suffix('entry', data)[len('entry'):]
+    if kind != '.mzx' and '.' in name:
+        kind = name[name.rfind('.'):].lower()
+    if depth < DEEP_NESTING and kind == '.mzx':
+        content, _ = mzx_decompress_data(data, options.xorff)
+        # decompressed scripts have no magic, they get the -e suffix like with mzx_tool decompress
+        content_suffix = filename_utils.add_suffix('entry', content)[len('entry'):]
+        if content_suffix == '.bin':
+            content_suffix = '.' + options.ext
+        return deep_products(stem + content_suffix, content, output_path, options, depth + 1)
+    if kind == '.mzp':
+        return mzp_to_png(name, data, output_path)
+    if depth < DEEP_NESTING and kind == '.mrg':
+        nested = MrgArchive(name, data=data)
+        products = []
+        for entry in nested.entries:
+            entry_data = nested.read(entry)
+            entry_name = filename_utils.add_suffix(f'{stem}_file{entry.index:04d}', entry_data)
+            products += deep_products(entry_name, entry_data, output_path.joinpath(stem), options, depth + 1)
+        nested.close()
+        return products
+    if kind == '.scr':
+        out_line, out_text, _ = decode_scr_buffer(bytes(data), options.verbose)
+        save_decoded_scr(stem, out_line, out_text, output_path.joinpath('decoded_text'),
+                         output_path.joinpath('decoded_script'), options.unicode)
+        return [output_path.joinpath('decoded_script', stem + '.txt')] + \
+            ([output_path.joinpath('decoded_text', stem + '.csv')] if out_text else [])
+    output_path.mkdir(parents=True, exist_ok=True)
+    with open(output_path.joinpath(name), 'wb') as f:
+        f.write(data)
+    return [output_path.joinpath(name)]
+
+
+def deep_unpack_entry(item, mrg_path, output_path, options):
+    # worker side: map the archive once per process, then read and convert one entry
+    index, name = item
+    mrg_archive = _deep_archives.get(mrg_path)
+    if mrg_archive is None:
+        mrg_archive = _deep_archives[mrg_path] = MrgArchive(mrg_path)
+    return deep_products(name, mrg_archive.read(mrg_archive.by_index[index]), output_path, options)
+
+
+def deep_unpack(args):
+    # one read of the archive, one write of the end products: nothing in between touches the disk
+    mrg_path, mrg_archive = open_archive(args)
+    mrg_name = mrg_path.stem.lower()
+    output_path = Path(args.output) if args.output else mrg_path.with_name(mrg_name + '_deep')
+    output_path.mkdir(parents=True, exist_ok=True)
+    # entries are named as unpack names them, the same names end up in the products
+    entry_names = name_entries(mrg_archive, mrg_name, load_entry_names(mrg_archive, mrg_name))
+    sizes = {entry.index: entry.real_size for entry in mrg_archive.entries}
+    mrg_archive.close()
+
+    options = DeepOptions(args.is_xor, args.ext, args.unicode, args.verbose)
+    report = BatchReport()
+    for (index, name), products, error in run_batch(deep_unpack_entry, entry_names.items(), args.jobs,
+                                                    (mrg_path, output_path, options)):
+        report.add(name, error, sizes[index])
+        if error is not None:
+            print(f"{name}: {error}")
+            continue
+        print(f"{name} -> " + ', '.join(str(path.relative_to(output_path)) for path in products))
+    for archive in _deep_archives.values():
+        archive.close()
+    _deep_archives.clear()
+    print(report.summary('entries'))
+    print(f'Output Directory: {output_path}')
+    return 1 if report.failed else 0
+
+
+def repack(args):
+    # repack files path
+    files_path = Path(args.source_path)
+    has_hed = not args.combine
+    assert files_path.exists(), f'{files_path} does not found. Please pass the path to the folder contains repack files.'
+
+    # set output path
+    mrg_output_path = Path(args.output) if args.output else files_path.parent.joinpath(f"{files_path.stem.replace('_unpack','')}.mrg")
+    mrg_name = mrg_output_path.stem
+
+    # read filename list
+    file_list_path = files_path.joinpath(f'filename_{mrg_name}.list')
+    assert file_list_path.exists(), f'{file_list_path.name} does not found in {files_path}. Please make sure the path to the folder contains filename list.'
+    with open(file_list_path, 'r', encoding="utf-8") as f:
+        filename_list = [line.rstrip('\n') for line in f.readlines()]
+    print('Loaded Filelist')
+
+    # with --incremental, entries unchanged since unpack are copied from the original archive
+    original_path, manifest = None, {}
+    if args.incremental:
+        manifest_path = files_path.joinpath(f'manifest_{mrg_name}.json')
+        assert manifest_path.exists(), f'{manifest_path.name} does not found in {files_path}. Unpack the archive again to create it.'
+        with open(manifest_path, 'r', encoding="utf-8") as f:
+            manifest_data = json.load(f)
+        original_path = mrg_output_path
+        assert original_path.exists() and original_path.stat().st_size == manifest_data['archive_size'],\
+            f"{original_path} is not the {manifest_data['archive']} that {files_path.name} was unpacked from."
+        manifest = manifest_data['entries']
+
+    # lay out the entry table from the file sizes only, data is streamed afterwards
+    hed_entries = []
+    pack_items = []
+    data_offset = 0
+    # with --dedupe, contents are only hashed when two files have the same size
+    first_of_size = {}  # size -> (file path, offset, name) of a stored file not hashed yet
+    stored = {}  # (size, digest) -> (offset, name) of stored files
+    aliases = []
+    for file_name in filename_list:
+        file_path = files_path.joinpath(file_name)
+        assert file_path.exists(), f"Cannot find {file_name} in {files_path}."
+        data_size = file_path.stat().st_size
+        # add padding
+        pad_len, pad_data = add_entry_padding(args.combine, data_size)
+        entry_offset, first_name = data_offset, None
+        if args.dedupe:
+            if data_size not in first_of_size:
+                first_of_size[data_size] = (file_path, data_offset, file_name)
+            else:
+                pending = first_of_size[data_size]
+                if pending is not None:
+                    stored.setdefault((data_size, file_digest(pending[0])), pending[1:])
+                    first_of_size[data_size] = None
+                digest = file_digest(file_path)
+                if (data_size, digest) in stored:
+                    entry_offset, first_name = stored[(data_size, digest)]
+                    aliases.append((file_name, first_name, data_size + pad_len))
+                else:
+                    stored[(data_size, digest)] = (data_offset, file_name)
+        if has_hed:
+            if mrg_name.startswith('voice'):
+                offset_low, offset_size_high = calculate_entry_desc(entry_offset, data_size+pad_len,
+                                                                    False, True)
+                entry_buf = struct.pack('<HH', offset_low, offset_size_high)
+            else:
+                offset_low, offset_high, size_sectors, size_low = calculate_entry_desc(
+                                                                    entry_offset, data_size, False)
+                entry_buf = struct.pack('<HHHH', offset_low, offset_high, size_sectors, size_low)
+        else:
+            sector_offset, byte_offset, size_sectors, size_low = calculate_entry_desc(
+                                                                    entry_offset, data_size, True)
+            entry_buf = struct.pack('<HHHH', sector_offset, byte_offset, size_sectors, size_low)
+        hed_entries.append(entry_buf)
+        if first_name is not None:
+            # identical to a stored entry, the record points at its data
+            continue
+        record = manifest.get(file_name)
+        archive_offset = record['offset'] if record and entry_unchanged(file_path, record) else None
+        pack_items.append((file_name, file_path, data_size, pad_data, archive_offset))
+        data_offset += data_size + pad_len
+    hed_buf = b''.join(hed_entries)
+
+    if has_hed:
+        # save hed file
+        hed_buf += b'\xFF' * 0x10
+        hed_output_path = mrg_output_path.with_name(f'new_{mrg_output_path.stem}.hed')
+        with hed_output_path.open('wb') as f:
+            f.write(hed_buf)
+        print(f'save as {hed_output_path.absolute()}')
+
+    # save mrg file, payloads are copied file to file without loading them
+    mrg_output_path = mrg_output_path.with_name(f'new_{mrg_output_path.name}')
+    with open(mrg_output_path, 'wb', buffering=0) as f:
+        if not has_hed:
+            # add magic and entries num for single mrg
+            f.write(b'\x6D\x72\x67\x64\x30\x30' + struct.pack('<H', len(filename_list)) + hed_buf)
+        # unchanged entries next to each other in the original archive are copied as one range
+        run_start = run_end = None
+        run_pad = b''
+        for file_name, file_path, data_size, pad_data, archive_offset in pack_items:
+            if run_end is not None and archive_offset != run_end + len(run_pad):
+                copy_file_data(f, original_path, run_end - run_start, run_start)
+                f.write(run_pad)
+                run_start = run_end = None
+            if archive_offset is None:
+                copy_file_data(f, file_path, data_size)
+                f.write(pad_data)
+                print(f"find and pack file: {file_name}")
+                continue
+            if run_start is None:
+                run_start = archive_offset
+            run_end, run_pad = archive_offset + data_size, pad_data
+            print(f"keep file: {file_name}")
+        if run_end is not None:
+            copy_file_data(f, original_path, run_end - run_start, run_start)
+            f.write(run_pad)
+    if args.incremental:
+        kept = sum(1 for item in pack_items if item[4] is not None)
+        print(f'{len(pack_items) - kept} changed, {kept} copied from {original_path.name}')
+    if args.dedupe:
+        for file_name, first_name, size in aliases:
+            print(f"alias: {file_name} -> {first_name}")
+        print(f'{len(aliases)} duplicated entries aliased, {sum(alias[2] for alias in aliases)} bytes saved')
+    print(f'save as {mrg_output_path.absolute()}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, add_help=False)
+    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
+
+    # unpack
+    parser_unpack = subparsers.add_parser('unpack', help='unpack mrg and create a filelist')
+    parser_unpack.add_argument('input', metavar='input.mrg', help='Input .mrg file')
+    parser_unpack.add_argument('-m', '--mode', metavar='game_mode',
+                               help='Set game mode to specify different unpack action.')
+    parser_unpack.add_argument('-j', '--jobs', default=0, type=int,
+                               help='Writer threads, 1 writes sequentially (default: 0, a few per CPU)')
+
+    # extract / cat, selectors are combined
+    for name, help_text in (('extract', 'extract only the selected entries, the output directory may exist'),
+                            ('cat', 'write the selected entries to stdout')):
+        parser_select = subparsers.add_parser(name, help=help_text)
+        parser_select.add_argument('input', metavar='input.mrg', help='Input .mrg file')
+        parser_select.add_argument('-n', '--name', dest='names', action='append', metavar='glob',
+                                   help='Select by file name glob, e.g. "*.mzp" (repeatable)')
+        parser_select.add_argument('-i', '--index', metavar='ranges',
+                                   help='Select by record index, e.g. "3", "10-20" or "1,5,7-9"')
+        parser_select.add_argument('-t', '--type', dest='types', action='append', metavar='ext',
+                                   help='Select by sniffed file type, e.g. mzx, mzp, at9 (repeatable)')
+        parser_select.add_argument('-m', '--mode', metavar='game_mode',
+                                   help='Set game mode to specify different unpack action.')
+        if name == 'extract':
+            parser_select.add_argument('-o', '--output', metavar='output_dir',
+                                       help='Output directory. Default \'<mrg name>_extract\'')
+
+    # deep-unpack
+    parser_deep = subparsers.add_parser('deep-unpack',
+                                        help='unpack and convert entries in memory: mzx, mzp to png, scr to txt/csv')
+    parser_deep.add_argument('input', metavar='input.mrg', help='Input .mrg file')
+    parser_deep.add_argument('-o', '--output', metavar='output_dir',
+                             help='Output directory. Default \'<mrg name>_deep\'')
+    parser_deep.add_argument('-x', '--xor', default=None, dest='is_xor', type=xor_arg,
+                             help='Decompress mzx with(1) or without(0) xorff, or guess it per entry(auto, default)')
+    parser_deep.add_argument('-e', '--ext', default='scr',
+                             help='Extension of decompressed mzx without magic (default: scr, decoded as script)')
+    parser_deep.add_argument('-u', '--unicode', action='store_true',
+                             help='Write decoded scripts as utf-8 instead of cp932')
+    parser_deep.add_argument('-v', '--verbose', action='store_true',
+                             help='Add the matched text command to decoded_text rows')
+    parser_deep.add_argument('-j', '--jobs', default=1, type=int,
+                             help='Worker processes, 0 for one per CPU (default: 1)')
+    parser_deep.add_argument('-m', '--mode', metavar='game_mode',
+                             help='Set game mode to specify different unpack action.')
+
+    # list
+    parser_list = subparsers.add_parser('list', help='list archive entries from the entry table only')
+    parser_list.add_argument('input', metavar='input.mrg', help='Input .mrg file')
+    parser_list.add_argument('-s', '--sniff', action='store_true',
+                             help='Read the head of each entry to detect its type')
+    parser_list.add_argument('--json', action='store_true', help='Print entries as JSON')
+    parser_list.add_argument('-m', '--mode', metavar='game_mode',
+                             help='Set game mode to specify different unpack action.')
+
+    # verify
+    parser_verify = subparsers.add_parser('verify', help='check the entry table and the padding of an archive')
+    parser_verify.add_argument('input', metavar='input.mrg', help='Input .mrg file')
+    parser_verify.add_argument('--json', action='store_true', help='Print the report as JSON')
+    parser_verify.add_argument('-m', '--mode', metavar='game_mode',
+                               help='Set game mode to specify different unpack action.')
+
+    # diff
+    parser_diff = subparsers.add_parser('diff', help='compare the entries of two archives, e.g. retail and rebuild')
+    parser_diff.add_argument('old', metavar='old.mrg', help='Original .mrg file')
+    parser_diff.add_argument('new', metavar='new.mrg', help='Rebuilt .mrg file')
+    parser_diff.add_argument('-d', '--deep', action='store_true',
+                             help='Also compare decompressed contents of changed MZX entries')
+    parser_diff.add_argument('-j', '--jobs', default=0, type=int,
+                             help='Hashing threads, 1 hashes sequentially (default: 0, a few per CPU)')
+    parser_diff.add_argument('--json', action='store_true', help='Print the changed entries as JSON')
+    parser_diff.add_argument('-m', '--mode', metavar='game_mode',
+                             help='Set game mode to specify different unpack action.')
+
+    # patch
+    parser_patch = subparsers.add_parser('patch', help='create or apply a sector delta patch of a rebuilt archive')
+    patch_subparsers = parser_patch.add_subparsers(title='patch commands', dest='patch_command', required=True)
+    parser_create = patch_subparsers.add_parser('create', help='write the sectors that differ and the new .hed/.nam')
+    parser_create.add_argument('original', metavar='original.mrg', help='Original .mrg file')
+    parser_create.add_argument('rebuilt', metavar='rebuilt.mrg', help='Rebuilt .mrg file, with its .hed/.nam')
+    parser_create.add_argument('-o', '--output', metavar='output.mrgpatch',
+                               help='Patch file. Default \'<rebuilt name>.mrgpatch\'')
+    parser_apply = patch_subparsers.add_parser('apply', help='patch an original archive in place')
+    parser_apply.add_argument('patch', metavar='input.mrgpatch', help='Patch file')
+    parser_apply.add_argument('target', metavar='original.mrg', help='.mrg file to patch, with its .hed/.nam')
+
+    # repack
+    parser_repack = subparsers.add_parser('repack', help='generate a new .mrg base an existing MRG filelist')
+    parser_repack.add_argument('-s', '--source_files',
+                               required=True, dest='source_path',
+                               help='Files path to repack, that also contain filename_xxx.list [REQUIRED]')
+    parser_repack.add_argument('-c', '--combine', action="store_true",
+                               default=False, help='Decide whether to generate .hed file. Default False')
+    parser_repack.add_argument('-d', '--dedupe', action="store_true",
+                               help='Store identical files once, their entries share the same data')
+    parser_repack.add_argument('-i', '--incremental', action="store_true",
+                               help='Copy entries unchanged since unpack (see manifest_xxx.json) from output.mrg')
+    parser_repack.add_argument('output', metavar='output.mrg',
+                               help='Output .mrg file. Same basename is used for .hed/.nam when needed')
+
+    # help
+    parser.add_argument('-h', '--help',
+                        action=CustHelpAction, default=argparse.SUPPRESS,
+                        help='show this help message and exit')
+
+    return parser, parser.parse_args()
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(__file__))
+    parser, args = parse_args()
+    if args.subcommand == "unpack":
+        unpack(args)
+    elif args.subcommand == "deep-unpack":
+        sys.exit(deep_unpack(args))
+    elif args.subcommand == "list":
+        list_entries(args)
+    elif args.subcommand == "verify":
+        sys.exit(verify(args))
+    elif args.subcommand == "diff":
+        sys.exit(diff(args))
+    elif args.subcommand == "patch":
+        sys.exit(patch(args))
+    elif args.subcommand == "extract":
+        extract(args)
+    elif args.subcommand == "cat":
+        cat(args)
+    elif args.subcommand == "repack":
+        repack(args)
+    else:
+        parser.print_usage()
+        sys.exit(20)
+    sys.exit(0)
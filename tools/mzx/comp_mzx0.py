@@ -6,33 +6,352 @@
 #
 # Copyright (c) 2018 <hintay@me.com>
 
-from struct import unpack, pack
+from concurrent.futures import ProcessPoolExecutor
+from struct import pack
+from mzx.decomp_mzx0 import XORFF_TABLE
 
+# level: (hash chain depth, lazy matching)
+# level 0 only emits literal commands, like the original store-only encoder
+# a lazy level is also encoded at the level below, and never outputs more than it
+COMPRESS_LEVELS = {
+    0: (0, False),
+    1: (4, False),
+    2: (32, False),
+    3: (256, True),
+}
+DEFAULT_LEVEL = 2
 
-def mzx0_compress(f, inlen, xorff=False):
-    """Compress a block of data.
+CLEAR_BLOCK = 0x2000  # 0x1000 words between two resets of the `last` word
+MAX_RUN = 0x80  # 0x40 words per command
+MAX_DISTANCE = 0x200  # backref distance is 2 * (byte + 1)
+PARALLEL_CHUNK = CLEAR_BLOCK * 0x20  # input bytes per independently compressed chunk
+
+
+def _common_words(target, data, src, limit):
+    """Count equal leading words of `target` (an int of `limit` bytes) and data[src:src+limit]."""
+    diff = target ^ int.from_bytes(data[src:src + limit], 'little')
+    if diff == 0:
+        return limit >> 1
+    return ((diff & -diff).bit_length() - 1) >> 4
+
+
+class _Mzx0Encoder:
+    """
+    Greedy/lazy MZX0 encoder over 2-byte words.
+    Commands never cross a 0x1000-word clear boundary, so `last` is reset exactly where the decoder resets it.
+    """
+
+    def __init__(self, data, xorff, chain_depth, lazy, isolated=False):
+        self.data = data
+        self.xorff = xorff
+        self.chain_depth = chain_depth
+        self.lazy = lazy
+        self.reset_word = b'\xFF\xFF' if xorff else b'\x00\x00'
+        self.out = bytearray()
+        self.literal = bytearray()
+        # ring buffer holds decoded words, ring_map points a word to one slot that holds it
+        # an isolated encoder only looks up slots it wrote, as the ring it starts from is unknown
+        self.ring = [self.reset_word] * 64
+        self.ring_map = {} if isolated else {self.reset_word: 0}
+        self.ring_wpos = 0
+        self.ring_refs = []  # output offsets of ring lookup commands
+        self.literal_words = 0
+        # hash chain over 4-byte keys at even positions
+        self.head = {}
+        self.prev = [None] * (len(data) // 2 + 1)
+        self.inserted = 0
+
+    def insert_until(self, pos):
+        data, head, prev = self.data, self.head, self.prev
+        limit = min(pos, len(data) - 3)
+        for p in range(self.inserted, limit, 2):
+            key = data[p:p + 4]
+            prev[p >> 1] = head.get(key)
+            head[key] = p
+        self.inserted = max(self.inserted, pos)
+
+    def find_match(self, pos, limit):
+        """Longest backreference at `pos` as (words, distance in bytes)."""
+        if not self.chain_depth or pos + 4 > len(self.data):
+            return 0, 0
+        data = self.data
+        self.insert_until(pos)
+        target = int.from_bytes(data[pos:pos + limit], 'little')
+        best_len = best_dist = 0
+        cand = self.head.get(data[pos:pos + 4])
+        depth = self.chain_depth
+        while cand is not None and depth > 0 and pos - cand <= MAX_DISTANCE:
+            length = _common_words(target, data, cand, limit)
+            if length > best_len:
+                best_len, best_dist = length, pos - cand
+                if length == limit >> 1:
+                    break
+            cand = self.prev[cand >> 1]
+            depth -= 1
+        return best_len, best_dist
+
+    def flush_literal(self):
+        literal = self.literal
+        while literal:
+            run = literal[:MAX_RUN]
+            del literal[:MAX_RUN]
+            self.out.append((((len(run) >> 1) - 1) << 2) | 3)
+            self.out.extend(run.translate(XORFF_TABLE) if self.xorff else run)
+
+    def push_literal(self, word):
+        self.literal.extend(word)
+        self.literal_words += 1
+        old = self.ring[self.ring_wpos]
+        if self.ring_map.get(old) == self.ring_wpos:
+            del self.ring_map[old]
+        self.ring[self.ring_wpos] = word
+        self.ring_map[word] = self.ring_wpos
+        self.ring_wpos = (self.ring_wpos + 1) % 64
+        if len(self.literal) >= MAX_RUN:
+            self.flush_literal()
+
+    def take_cost(self, pos, block_end, match_len, next_len):
+        """Bytes to reach the end of the next match when the match at `pos` is taken now."""
+        tail = pos + match_len * 2
+        tail_words = next_len + 1 - match_len
+        if tail_words <= 0:
+            return 2
+        if tail_words > 1:
+            return 4  # backref on the rest of the next match
+        word = self.data[tail:tail + 2]
+        if tail < block_end and (word == self.data[tail - 2:tail] or word in self.ring_map):
+            return 3  # RLE or ring lookup
+        return 5  # literal word in a new run
+
+    def encode(self):
+        data = self.data
+        pos = 0
+        length = len(data)
+        for block_end in range(CLEAR_BLOCK, length + CLEAR_BLOCK, CLEAR_BLOCK):
+            block_end = min(block_end, length)
+            last = self.reset_word
+            while pos < block_end:
+                limit = min(block_end - pos, MAX_RUN)
+                word = data[pos:pos + 2]
+                if not self.chain_depth:
+                    self.push_literal(word)
+                    pos += 2
+                    continue
+
+                # candidates scored by bytes saved against literal words
+                rle_len = _common_words(int.from_bytes(data[pos:pos + limit], 'little'), last * 0x40, 0, limit)
+                match_len, match_dist = self.find_match(pos, limit)
+                ring_slot = self.ring_map.get(word)
+                best = max(2 * rle_len - 1, 2 * match_len - 2 if match_len >= 2 else 0,
+                           1 if ring_slot is not None else 0)
+
+                if best <= 0:
+                    self.push_literal(word)
+                    pos += 2
+                elif best == 2 * rle_len - 1:
+                    self.flush_literal()
+                    self.out.append(((rle_len - 1) << 2) | 0)
+                    pos += rle_len * 2
+                elif best == 2 * match_len - 2:
+                    if self.lazy and pos + 2 < block_end:
+                        next_len, _ = self.find_match(pos + 2, min(block_end - pos - 2, MAX_RUN))
+                        # defer with a literal word (in the open run or a new one) and the next match
+                        defer_cost = (2 if self.literal else 3) + 2
+                        if defer_cost < self.take_cost(pos, block_end, match_len, next_len):
+                            self.push_literal(word)
+                            pos += 2
+                            last = word
+                            continue
+                    self.flush_literal()
+                    self.out.append(((match_len - 1) << 2) | 1)
+                    self.out.append((match_dist >> 1) - 1)
+                    pos += match_len * 2
+                else:
+                    self.flush_literal()
+                    self.ring_refs.append(len(self.out))
+                    self.out.append((ring_slot << 2) | 2)
+                    pos += 2
+                last = data[pos - 2:pos]
+            self.flush_literal()
+        return self.out
+
+
+class _Mzx0OptimalEncoder(_Mzx0Encoder):
     """
+    Optimal parsing MZX0 encoder, used when output must fit a byte budget.
+    Each clear block is parsed by dynamic programming over the command costs: RLE and ring lookup
+    1 byte, backref 2 bytes, literal 1 byte per 0x40 words plus 2 bytes per word.
+    Ring contents depend on the chosen literals, so every state keeps the last 64 literal words of its path.
+    """
+
+    def __init__(self, data, xorff):
+        super().__init__(data, xorff, COMPRESS_LEVELS[max(COMPRESS_LEVELS)][0], False)
+
+    def parse_block(self, block_start, block_end):
+        data = self.data
+        words = (block_end - block_start) >> 1
+        inf = float('inf')
+        # best: cost up to word j on a command boundary, lit: cost up to word j inside an open literal run
+        best = [inf] * (words + 1)
+        choice = [None] * (words + 1)
+        best_ring = [None] * (words + 1)
+        lit = [inf] * (words + 1)
+        lit_start = [0] * (words + 1)
+        lit_ring = [None] * (words + 1)
+        best[0] = 0
+        # ring as the last 64 literal words, oldest first
+        best_ring[0] = tuple(self.ring[self.ring_wpos:] + self.ring[:self.ring_wpos])
+        last = self.reset_word
+        for j in range(words):
+            pos = block_start + j * 2
+            if lit[j] < best[j]:
+                best[j], choice[j], best_ring[j] = lit[j], ('L', lit_start[j]), lit_ring[j]
+            cost, ring = best[j], best_ring[j]
+            limit = min(block_end - pos, MAX_RUN)
+            word = data[pos:pos + 2]
+
+            # literal: open a new run or extend the current one
+            if cost + 3 < lit[j + 1]:
+                lit[j + 1], lit_start[j + 1], lit_ring[j + 1] = cost + 3, j, ring[1:] + (word,)
+            if lit[j] + 2 < lit[j + 1] and j - lit_start[j] < MAX_RUN >> 1:
+                lit[j + 1], lit_start[j + 1], lit_ring[j + 1] = lit[j] + 2, lit_start[j], lit_ring[j][1:] + (word,)
+
+            rle_len = _common_words(int.from_bytes(data[pos:pos + limit], 'little'), last * 0x40, 0, limit)
+            for length in range(1, rle_len + 1):
+                if cost + 1 < best[j + length]:
+                    best[j + length], choice[j + length], best_ring[j + length] = cost + 1, ('R', j), ring
+            if rle_len == 0 and cost + 1 < best[j + 1] and word in ring:
+                best[j + 1], choice[j + 1], best_ring[j + 1] = cost + 1, ('G', j), ring
+            match_len, match_dist = self.find_match(pos, limit)
+            for length in range(max(rle_len + 1, 2), match_len + 1):
+                if cost + 2 < best[j + length]:
+                    best[j + length], choice[j + length], best_ring[j + length] = cost + 2, ('B', j, match_dist), ring
+            last = word
+        if lit[words] < best[words]:
+            choice[words] = ('L', lit_start[words])
+
+        commands = []
+        j = words
+        while j > 0:
+            cmd = choice[j]
+            commands.append((cmd[0], cmd[1], j) + cmd[2:])
+            j = cmd[1]
+        commands.reverse()
+        return commands
+
+    def encode(self):
+        data = self.data
+        length = len(data)
+        for block_start in range(0, length, CLEAR_BLOCK):
+            block_end = min(block_start + CLEAR_BLOCK, length)
+            for cmd in self.parse_block(block_start, block_end):
+                kind, start, end = cmd[:3]
+                count = end - start
+                if kind == 'L':
+                    for i in range(block_start + start * 2, block_start + end * 2, 2):
+                        self.push_literal(data[i:i + 2])
+                    self.flush_literal()
+                elif kind == 'R':
+                    self.out.append(((count - 1) << 2) | 0)
+                elif kind == 'G':
+                    word = data[block_start + start * 2:block_start + start * 2 + 2]
+                    self.out.append((self.ring.index(word) << 2) | 2)
+                else:
+                    self.out.append(((count - 1) << 2) | 1)
+                    self.out.append((cmd[3] >> 1) - 1)
+        return self.out
+
+
+def _encode_level(data, xorff, level, isolated=False):
+    """Run the encoder of `level` over padded data, returns the encoder holding the smallest output.
+    """
+    chain_depth, lazy = COMPRESS_LEVELS[level]
+    encoder = _Mzx0Encoder(data, xorff, chain_depth, lazy, isolated)
+    encoder.encode()
+    if lazy:
+        # deferring is a local guess, check it did not lose against the level below
+        lower = _encode_level(data, xorff, level - 1, isolated)
+        if len(lower.out) < len(encoder.out):
+            return lower
+    return encoder
+
+
+def mzx0_compress_buffer(data, xorff=False, level=DEFAULT_LEVEL):
+    """Compress a bytes-like block of data into a MZX0 stream (header included).
+    """
+    inlen = len(data)
+    if level not in COMPRESS_LEVELS:
+        raise ValueError("Unknown MZX compress level {0}, expect one of {1}".format(level, list(COMPRESS_LEVELS)))
+    data = bytes(data)
+    if inlen & 1:  # pad with useless character, truncated by the header length
+        data += b'\x00'
+
     dout = bytearray(b'MZX0')
     dout.extend(pack('<L', inlen))
+    dout.extend(_encode_level(data, xorff, level).out)
+    return dout
 
-    key = 0xFFFFFFFF if xorff else 0
-    while inlen >= 0x80:
-        # 0xFF literal, write plaintext input 0x80 bytes // 0xFF = 0xFC+0x03 // (0xFC >> 2 + 1) => 0x40 times 2-byte pairs
-        dout.extend(b'\xFF')
-        for i in range(0x20):
-            dout.extend(pack('<L', unpack('<L', f.read(0x4))[0] ^ key))
-        inlen -= 0x80
-
-    key = 0xFF if xorff else 0
-    if inlen >= 0x02: # 0x02-0x7F remainder
-        dout.extend(bytes([ ((inlen >> 1) - 1) * 4 + 3 ]))
-        for i in range((inlen >> 1) * 2):
-            dout.extend(bytes([ ord(f.read(1)) ^ key ]))
-        inlen -= (inlen >> 1) * 2
-
-    if inlen == 0x01: # pad with useless character
-        dout.extend(b'\x03')
-        dout.extend(bytes([ ord(f.read(1)) ^ key ]))
-        dout.extend(b'\x00')
 
+def mzx0_compress(f, inlen, xorff=False, level=DEFAULT_LEVEL):
+    """Compress a block of data.
+    """
+    return mzx0_compress_buffer(f.read(inlen), xorff, level)
+
+
+def _compress_chunk(chunk, xorff, level):
+    encoder = _encode_level(chunk, xorff, level, isolated=True)
+    return encoder.out, encoder.ring_refs, encoder.literal_words
+
+
+def mzx0_compress_parallel(data, xorff=False, level=DEFAULT_LEVEL, jobs=None, chunk_size=PARALLEL_CHUNK):
+    """Compress a large block of data as independent chunks over a process pool (header included).
+    Chunks are cut on clear boundaries, so each one starts from a reset `last` word, and backrefs stay
+    inside a chunk. Ring lookups only use slots written by their own chunk, their slot numbers are
+    shifted by the literal words of the previous chunks when the streams are joined.
+    Slightly bigger than mzx0_compress_buffer() output, decodes the same.
+    """
+    inlen = len(data)
+    if level not in COMPRESS_LEVELS:
+        raise ValueError("Unknown MZX compress level {0}, expect one of {1}".format(level, list(COMPRESS_LEVELS)))
+    if chunk_size % CLEAR_BLOCK:
+        raise ValueError("MZX chunk size {0:#x} must be a multiple of {1:#x}".format(chunk_size, CLEAR_BLOCK))
+    if inlen <= chunk_size:
+        return mzx0_compress_buffer(data, xorff, level)
+    data = bytes(data)
+    if inlen & 1:  # pad with useless character, truncated by the header length
+        data += b'\x00'
+
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_compress_chunk, chunks, [xorff] * len(chunks), [level] * len(chunks)))
+
+    dout = bytearray(b'MZX0')
+    dout.extend(pack('<L', inlen))
+    ring_base = 0
+    for body, ring_refs, literal_words in results:
+        for ref in ring_refs:
+            body[ref] = ((((body[ref] >> 2) + ring_base) % 64) << 2) | 2
+        dout.extend(body)
+        ring_base = (ring_base + literal_words) % 64
     return dout
+
+
+def mzx0_compress_fit(data, budget, xorff=False):
+    """Compress data into at most `budget` bytes (header included), trying cheaper levels first.
+    Returns [fits, stream], stream being the smallest encoding that was tried.
+    """
+    smallest = None
+    for level in (DEFAULT_LEVEL, max(COMPRESS_LEVELS), None):
+        if level is None:
+            inlen = len(data)
+            padded = bytes(data) + (b'\x00' if inlen & 1 else b'')
+            stream = bytearray(b'MZX0')
+            stream.extend(pack('<L', inlen))
+            stream.extend(_Mzx0OptimalEncoder(padded, xorff).encode())
+        else:
+            stream = mzx0_compress_buffer(data, xorff, level)
+        if smallest is None or len(stream) < len(smallest):
+            smallest = stream
+        if len(smallest) <= budget:
+            return [True, smallest]
+    return [False, smallest]
@@ -7,58 +7,292 @@
 #
 # Copyright (c) 2018 <hintay@me.com>
 
-from io import BytesIO
+import hashlib
+import re
+from collections import namedtuple
+from io import BytesIO, RawIOBase
 
+# bytes.translate() table for the xorff key, applied to whole literal runs
+XORFF_TABLE = bytes(range(0xFF, -1, -1))
 
-def mzx0_decompress(f, inlen, exlen, xorff=False) -> [str, BytesIO]:
-    """
-    Decompress a block of data.
-    """
-    key = 0xFF
+MAX_DISTANCE = 0x200  # backreferences never reach further back than this
+MAX_COMMAND = 0x82  # input bytes of the largest command (literal of 0x40 words)
+
+PROBE_SIZE = 0x1000  # decoded bytes looked at by mzx0_detect_xorff()
+LV_PREFIX = b'LV\x03\x00\x00\t\x00'  # optional head of a .mzx, before its MZX0 header
+# heads of the formats found inside MZX: archives, nested MZX, ATRAC, images
+KNOWN_MAGICS = (b'mrgd00', b'MZX0', LV_PREFIX, b'RIFF', b'ABMP', b'\x89PNG', b'TIM2')
+# script instruction like `_MSAD(` or `SELR(`
+INSTRUCTION_TOKEN = re.compile(rb'^\s*_?[A-Z][A-Z0-9_]{1,7}\(')
+
+
+class Mzx0State:
+    """Decoder state carried between commands: ring buffer, clear counter and `last` word."""
 
-    out_data = BytesIO()  # slightly overprovision for writes past end of buffer
-    ring_buf = [b'\xFF\xFF'] * 64 if xorff else [b'\x00\x00'] * 64
-    ring_wpos = 0
+    def __init__(self, xorff=False):
+        self.xorff = xorff
+        self.reset_word = b'\xFF\xFF' if xorff else b'\x00\x00'
+        self.ring_buf = bytearray(self.reset_word * 64)
+        self.ring_wpos = 0
+        self.clear_count = 0
+        self.last = self.reset_word
 
-    clear_count = 0
-    max = f.tell() + inlen
-    last = b'\xFF\xFF' if xorff else b'\x00\x00'
 
-    while out_data.tell() < exlen:
-        if f.tell() >= max:
+def _mzx0_decode(data, ip, ip_stop, out, op, op_stop, state):
+    """
+    Run decoder commands from data[ip:] into the preallocated `out` at `op`,
+    until `op_stop` output or `ip_stop` input is reached.
+    `out` must have room for 0x80 bytes past `op_stop`. Returns the new (ip, op).
+    """
+    xorff = state.xorff
+    reset_word = state.reset_word
+    ring_buf = state.ring_buf
+    ring_wpos = state.ring_wpos
+    clear_count = state.clear_count
+    last = state.last
+
+    while op < op_stop:
+        if ip >= ip_stop:
             break
         if clear_count <= 0:
             clear_count = 0x1000
-            last = b'\xFF\xFF' if xorff else b'\x00\x00'
-        flags = ord(f.read(1))
-        # print("+ %X %X %X" % (flags, f.tell(), out_data.tell()))
+            last = reset_word
+        flags = data[ip]
+        ip += 1
+        cmd = flags & 0x03
+        count = (flags >> 2) + 1
 
-        clear_count -= 1 if (flags & 0x03) == 2 else flags // 4 + 1
+        clear_count -= 1 if cmd == 2 else count
 
-        if flags & 0x03 == 0:
-            out_data.write(last * ((flags // 4) + 1))
+        if cmd == 0:
+            # RLE of the last word
+            run = len(last) * count
+            out[op:op + run] = last * count
+            op += run
 
-        elif flags & 0x03 == 1:
-            k = 2 * (ord(f.read(1)) + 1)
-            for i in range(flags // 4 + 1):
-                out_data.seek(-k, 1)
-                last = out_data.read(2)
-                out_data.seek(0, 2)
-                out_data.write(last)
+        elif cmd == 1:
+            # backreference, 2-byte granular distance up to 0x200
+            if ip >= ip_stop:
+                # stream cut right after the command byte, the distance is missing
+                break
+            k = 2 * (data[ip] + 1)
+            ip += 1
+            run = count * 2
+            src = op - k
+            if src < 0:
+                # malformed distance, a BytesIO seek clamps to the start of output
+                for i in range(count):
+                    src = max(op - k, 0)
+                    last = bytes(out[src:min(src + 2, op)])
+                    out[op:op + len(last)] = last
+                    op += len(last)
+            else:
+                if k >= run:
+                    out[op:op + run] = out[src:src + run]
+                else:
+                    # overlapped copy repeats the last k bytes
+                    out[op:op + run] = (out[src:op] * (run // k + 1))[:run]
+                op += run
+                last = bytes(out[op - 2:op])
 
-        elif flags & 0x03 == 2:
-            last = ring_buf[flags // 4]
-            out_data.write(last)
+        elif cmd == 2:
+            # ring buffer lookup
+            pos = (flags >> 2) * 2
+            last = bytes(ring_buf[pos:pos + 2])
+            out[op:op + 2] = last
+            op += 2
 
         else:
-            for i in range(flags // 4 + 1):
-                last = ring_buf[ring_wpos] = bytes([byte ^ key for byte in f.read(2)]) if xorff else f.read(2)
-                out_data.write(last)
+            # literal run, also fills the ring buffer
+            words = data[ip:ip + count * 2]
+            ip += count * 2
+            words = words.tobytes().translate(XORFF_TABLE) if xorff else words.tobytes()
+            run = len(words)
+            out[op:op + run] = words
+            op += run
+            if run >= 2:
+                last = words[-2:]
+            # ring buffer wraps at most once for a 0x40 words run
+            run &= ~1
+            wpos = ring_wpos * 2
+            first = min(run, 0x80 - wpos)
+            ring_buf[wpos:wpos + first] = words[:first]
+            ring_buf[:run - first] = words[first:run]
+            ring_wpos = (ring_wpos + count) % 64
+
+    state.ring_wpos = ring_wpos
+    state.clear_count = clear_count
+    state.last = last
+    return ip, op
+
+
+def mzx0_decompress_buffer(data, exlen, xorff=False) -> bytearray:
+    """
+    Decompress a MZX0 datablock (without the 8-byte header) held in memory.
+    `data` can be bytes, bytearray, memoryview or mmap, output is truncated to `exlen`.
+    """
+    data = memoryview(data)
+    # preallocate output, a single command writes at most 0x40 words past exlen
+    out = bytearray(exlen + 0x80)
+    ip, op = _mzx0_decode(data, 0, len(data), out, 0, exlen, Mzx0State(xorff))
+    del out[min(op, exlen):]
+    return out
+
+
+class Mzx0Decoder:
+    """
+    Incremental MZX0 decoder over a file object positioned at the datablock.
+    Only the backreference window, the ring buffer and one input block are kept,
+    so memory does not grow with the payload size. Iterate it to get output chunks.
+    """
+
+    def __init__(self, f, inlen, exlen, xorff=False, chunk_size=0x10000):
+        self.f = f
+        self.in_remaining = inlen  # datablock bytes not read from f yet
+        self.in_read = 0
+        self.exlen = exlen
+        self.chunk_size = chunk_size
+        self.state = Mzx0State(xorff)
+        self.inbuf = memoryview(b'')
+        self.ip = 0
+        self.out_pos = 0  # decoded bytes, the last command may run past exlen
+        self.window = bytearray()  # last MAX_DISTANCE decoded bytes
+
+    @property
+    def in_pos(self):
+        """Consumed datablock bytes."""
+        return self.in_read - (len(self.inbuf) - self.ip)
+
+    @property
+    def finished(self):
+        return self.out_pos >= self.exlen or (self.in_remaining == 0 and self.ip >= len(self.inbuf))
+
+    def _fill(self):
+        if len(self.inbuf) - self.ip >= MAX_COMMAND or self.in_remaining == 0:
+            return
+        block = self.f.read(min(max(self.chunk_size, 0x1000), self.in_remaining))
+        self.in_remaining = self.in_remaining - len(block) if block else 0
+        self.in_read += len(block)
+        self.inbuf = memoryview(self.inbuf[self.ip:].tobytes() + block)
+        self.ip = 0
+
+    def read_chunk(self, size=None) -> bytes:
+        """Decode about `size` more bytes (chunk_size by default), b'' once the stream is done."""
+        size = size or self.chunk_size
+        hist = len(self.window)
+        out = bytearray(hist + size + 0x80)
+        out[:hist] = self.window
+        op = hist
+        op_stop = hist + max(min(size, self.exlen - self.out_pos), 0)
+        while op < op_stop:
+            self._fill()
+            # keep a whole command in inbuf until the datablock end is reached
+            ip_stop = len(self.inbuf) if self.in_remaining == 0 else len(self.inbuf) - MAX_COMMAND + 1
+            if self.ip >= ip_stop:
+                break
+            self.ip, op = _mzx0_decode(self.inbuf, self.ip, ip_stop, out, op, op_stop, self.state)
+
+        emit_end = hist + max(min(op - hist, self.exlen - self.out_pos), 0)
+        self.out_pos += op - hist
+        self.window = out[max(op - MAX_DISTANCE, 0):op]
+        return bytes(out[hist:emit_end])
+
+    def __iter__(self):
+        while True:
+            chunk = self.read_chunk()
+            if not chunk:
+                return
+            yield chunk
 
-                ring_wpos += 1
-                ring_wpos %= 64
-    status = "OK"
 
-    out_data.truncate(exlen)  # Resize stream to decompress size
-    out_data.seek(0)
+class Mzx0Reader(RawIOBase):
+    """Read-only raw stream of the decompressed data, backed by a Mzx0Decoder."""
+
+    def __init__(self, f, inlen, exlen, xorff=False, chunk_size=0x10000):
+        super().__init__()
+        self.decoder = Mzx0Decoder(f, inlen, exlen, xorff, chunk_size)
+        self.pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if not self.pending:
+            self.pending = self.decoder.read_chunk()
+        size = min(len(b), len(self.pending))
+        b[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def _xorff_score(sample):
+    """How much a decoded sample looks like real content, higher is better."""
+    if not sample:
+        return 0.0
+    if sample.startswith(KNOWN_MAGICS):
+        return 3.0
+    # cp932 text: share of printable characters, undecodable bytes count as garbage
+    text = sample.decode('cp932', 'replace')
+    printable = sum(1 for c in text if c.isprintable() or c in '\r\n\t') - text.count('\ufffd')
+    score = printable / len(text)
+    tokens = sample.split(b';')
+    if len(tokens) > 2:
+        score += sum(1 for token in tokens if INSTRUCTION_TOKEN.match(token)) / len(tokens)
+    # binary data is padded with 0x00 far more often than 0xFF, the wrong key swaps them
+    score += (sample.count(0) - sample.count(0xFF)) / len(sample)
+    return score
+
+
+def mzx0_detect_xorff(data, exlen, probe=PROBE_SIZE) -> bool:
+    """
+    Guess the xorff key of a datablock from its head bytes (a few KB are enough).
+    Both keys decode at most `probe` bytes, scored by magic, cp932 decodability and `;` instruction tokens.
+    Ties go to the plain key, used by images and other binary data.
+    """
+    data = memoryview(data)[:probe * 2 + MAX_COMMAND]
+    exlen = min(exlen, probe)
+    plain = _xorff_score(mzx0_decompress_buffer(data, exlen, False))
+    xored = _xorff_score(mzx0_decompress_buffer(data, exlen, True))
+    return xored > plain
+
+
+def mzx_decompress_data(data, xorff=None):
+    """
+    Decompress a whole .mzx held in memory (MZX0 header included, LV prefix aware).
+    With `xorff` None the key is guessed by mzx0_detect_xorff(). Returns (decompressed bytearray, xorff).
+    """
+    data = memoryview(data)
+    offset = len(LV_PREFIX) if data[:len(LV_PREFIX)] == LV_PREFIX else 0
+    magic, exlen = data[offset:offset + 4], int.from_bytes(data[offset + 4:offset + 8], 'little')
+    if magic != b'MZX0':
+        raise ValueError(f"This data might not be MZX, magic: {bytes(magic)}")
+    block = data[offset + 8:]
+    if xorff is None:
+        xorff = mzx0_detect_xorff(block, exlen)
+    return mzx0_decompress_buffer(block, exlen, xorff), bool(xorff)
+
+
+Mzx0Check = namedtuple('Mzx0Check', ['dec_size', 'produced', 'in_consumed', 'exhausted', 'digest'])
+
+
+def mzx0_verify(f, inlen, exlen, xorff=False, hash_name='sha1', chunk_size=0x10000) -> Mzx0Check:
+    """
+    Run the decoder over a datablock without keeping its output, only the window and one chunk live at a time.
+    `exhausted` is set when the input ran out before `exlen` bytes were produced.
+    """
+    decoder = Mzx0Decoder(f, inlen, exlen, xorff, chunk_size)
+    digest = hashlib.new(hash_name)
+    produced = 0
+    for chunk in decoder:
+        digest.update(chunk)
+        produced += len(chunk)
+    return Mzx0Check(exlen, produced, decoder.in_pos, produced < exlen, digest.hexdigest())
+
+
+def mzx0_decompress(f, inlen, exlen, xorff=False) -> [str, BytesIO]:
+    """
+    Decompress a block of data.
+    """
+    out_data = BytesIO(mzx0_decompress_buffer(f.read(inlen), exlen, xorff))
+    status = "OK"
     return [status, out_data]
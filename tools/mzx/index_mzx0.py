@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+# MZX Random Access Library
+# Checkpoint index and seekable reader over MZX0 streams.
+#
+# FOR INTERNAL USE ONLY.
+
+import io
+import os
+import hashlib
+from bisect import bisect_right
+from collections import namedtuple
+from struct import Struct, unpack
+from mzx.decomp_mzx0 import Mzx0Decoder, MAX_DISTANCE, LV_PREFIX
+
+INDEX_SUFFIX = '.idx'
+DEFAULT_INTERVAL = 0x10000
+
+"""Index sidecar struct{
+    char magic[4];  // MZXI
+    uint8 version;
+    uint8 xorff;
+    uint16 reserved;
+    uint32 interval;  // output bytes between two checkpoints
+    uint32 inlen, exlen;  // datablock and decompressed size of the indexed stream
+    uint32 count;
+    uint64 source_mtime_ns;  // mtime of the .mzx the index was built from
+    char source_hash[16];  // blake2b of its datablock, checked when the mtime differs
+    count times {
+        uint32 out_pos, in_pos;
+        uint16 ring_wpos;
+        int16 clear_count;
+        uint16 window_len;
+        char last[2];
+        char ring[0x80];
+        char window[0x200];  // last output bytes, window_len used
+    }
+}"""
+INDEX_HEADER = Struct('<4sBBHIIIIQ16s')
+INDEX_RECORD = Struct('<IIHhH2s128s512s')
+INDEX_VERSION = 2
+
+Mzx0Checkpoint = namedtuple('Mzx0Checkpoint',
+                            ['out_pos', 'in_pos', 'ring_wpos', 'clear_count', 'last', 'ring', 'window'])
+
+
+class Mzx0Index:
+    """Decoder checkpoints taken about every `interval` output bytes."""
+
+    def __init__(self, inlen, exlen, xorff, interval, checkpoints, source_mtime_ns=0, source_hash=b''):
+        self.inlen = inlen
+        self.exlen = exlen
+        self.xorff = xorff
+        self.interval = interval
+        self.checkpoints = checkpoints
+        self.positions = [cp.out_pos for cp in checkpoints]
+        self.source_mtime_ns = source_mtime_ns
+        self.source_hash = source_hash
+
+    def matches(self, f, base, inlen, exlen, xorff):
+        """
+        Whether the index was built from the datablock at `base` in f: same sizes and key, and same mtime
+        or, when the file was touched or re-encoded to the same size, same datablock hash.
+        """
+        if (self.inlen, self.exlen, self.xorff) != (inlen, exlen, bool(xorff)):
+            return False
+        mtime_ns, digest = source_stamp(f, base, inlen, self.source_mtime_ns)
+        return mtime_ns == self.source_mtime_ns or digest == self.source_hash
+
+    def nearest(self, pos):
+        """Last checkpoint at or before output position `pos`."""
+        return self.checkpoints[max(bisect_right(self.positions, pos) - 1, 0)]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(b'MZXI', INDEX_VERSION, int(self.xorff), 0, self.interval,
+                                      self.inlen, self.exlen, len(self.checkpoints),
+                                      self.source_mtime_ns, self.source_hash))
+            for cp in self.checkpoints:
+                f.write(INDEX_RECORD.pack(cp.out_pos, cp.in_pos, cp.ring_wpos, cp.clear_count, len(cp.window),
+                                          cp.last, cp.ring, cp.window))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = f.read(INDEX_HEADER.size)
+            if len(header) < INDEX_HEADER.size or header[:4] != b'MZXI' or header[4] != INDEX_VERSION:
+                raise ValueError(f"{path} is not a version {INDEX_VERSION} MZX index")
+            magic, version, xorff, _, interval, inlen, exlen, count, source_mtime_ns, source_hash = \
+                INDEX_HEADER.unpack(header)
+            checkpoints = []
+            for fields in INDEX_RECORD.iter_unpack(f.read(INDEX_RECORD.size * count)):
+                out_pos, in_pos, ring_wpos, clear_count, window_len, last, ring, window = fields
+                checkpoints.append(Mzx0Checkpoint(out_pos, in_pos, ring_wpos, clear_count, last, ring,
+                                                  window[:window_len]))
+        return cls(inlen, exlen, bool(xorff), interval, checkpoints, source_mtime_ns, source_hash)
+
+
+def source_stamp(f, base, inlen, skip_hash_for=None):
+    """
+    (mtime_ns, blake2b digest) of the datablock at `base` in f, what an index records about its source.
+    The datablock is only hashed when the mtime differs from `skip_hash_for`. The position of f is kept.
+    """
+    try:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        mtime_ns = 0
+    if mtime_ns and mtime_ns == skip_hash_for:
+        return mtime_ns, None
+    pos = f.tell()
+    f.seek(base)
+    digest = hashlib.blake2b(digest_size=16)
+    remaining = inlen
+    while remaining > 0:
+        block = f.read(min(0x100000, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    f.seek(pos)
+    return mtime_ns, digest.digest()
+
+
+def _snapshot(decoder):
+    state = decoder.state
+    return Mzx0Checkpoint(decoder.out_pos, decoder.in_pos, state.ring_wpos, state.clear_count,
+                          state.last, bytes(state.ring_buf), bytes(decoder.window))
+
+
+def _resume(f, base, inlen, exlen, xorff, cp, chunk_size):
+    """Decoder continuing from checkpoint `cp`, for a datablock starting at `base` in f."""
+    f.seek(base + cp.in_pos)
+    decoder = Mzx0Decoder(f, inlen - cp.in_pos, exlen, xorff, chunk_size)
+    decoder.in_read = cp.in_pos
+    decoder.out_pos = cp.out_pos
+    decoder.window = bytearray(cp.window)
+    decoder.state.ring_buf[:] = cp.ring
+    decoder.state.ring_wpos = cp.ring_wpos
+    decoder.state.clear_count = cp.clear_count
+    decoder.state.last = cp.last
+    return decoder
+
+
+def build_mzx0_index(f, inlen, exlen, xorff=False, interval=DEFAULT_INTERVAL):
+    """Decode the datablock at the current position of f once, taking a checkpoint every `interval` bytes."""
+    source_mtime_ns, source_hash = source_stamp(f, f.tell(), inlen)
+    decoder = Mzx0Decoder(f, inlen, exlen, xorff, interval)
+    checkpoints = [_snapshot(decoder)]
+    while decoder.read_chunk():
+        # read_chunk() always stops on a command boundary
+        if not decoder.finished:
+            checkpoints.append(_snapshot(decoder))
+    return Mzx0Index(inlen, exlen, xorff, interval, checkpoints, source_mtime_ns, source_hash)
+
+
+def mzx_layout(f):
+    """Return (datablock offset, datablock size, decompressed size) of a .mzx file, LV prefix aware."""
+    file_size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    offset = 7 if f.read(7) == LV_PREFIX else 0
+    f.seek(offset)
+    magic, dec_size = unpack('<4sL', f.read(0x8))
+    assert magic == b'MZX0', f"This file might not be MZX file, magic: {magic}"
+    return offset + 8, file_size - offset - 8, dec_size
+
+
+def index_path_for(mzx_path):
+    return mzx_path.with_name(mzx_path.name + INDEX_SUFFIX)
+
+
+class SeekableMzxReader(io.RawIOBase):
+    """
+    Random access to decompressed MZX data.
+    A seek restarts decoding from the nearest checkpoint, so a read costs O(interval) instead of O(file).
+    """
+
+    def __init__(self, f, base, inlen, exlen, index: Mzx0Index):
+        super().__init__()
+        assert (index.inlen, index.exlen) == (inlen, exlen), "MZX index does not match this stream, rebuild it"
+        self.f = f
+        self.base = base
+        self.inlen = inlen
+        self.exlen = exlen
+        self.index = index
+        self.pos = 0
+        self.decoder = None
+        self.chunk_start = 0
+        self.chunk = b''
+
+    @classmethod
+    def open(cls, mzx_path, xorff=False, interval=DEFAULT_INTERVAL):
+        """Open a .mzx file, loading its sidecar index or building and saving it when missing or stale."""
+        f = open(mzx_path, 'rb')
+        base, inlen, exlen = mzx_layout(f)
+        idx_path = index_path_for(mzx_path)
+        index = None
+        if idx_path.exists():
+            try:
+                index = Mzx0Index.load(idx_path)
+            except ValueError:
+                pass  # older index version, rebuilt below
+        if index is None or not index.matches(f, base, inlen, exlen, xorff):
+            f.seek(base)
+            index = build_mzx0_index(f, inlen, exlen, xorff, interval)
+            index.save(idx_path)
+        return cls(f, base, inlen, exlen, index)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self.pos
+        elif whence == io.SEEK_END:
+            pos += self.exlen
+        if pos < 0:
+            raise ValueError("negative seek position {}".format(pos))
+        self.pos = pos
+        return pos
+
+    def _load(self, pos):
+        cp = self.index.nearest(pos)
+        # keep decoding forward unless the target is behind us or a closer checkpoint exists
+        if self.decoder is None or pos < self.chunk_start or cp.out_pos > self.chunk_start + len(self.chunk):
+            self.decoder = _resume(self.f, self.base, self.inlen, self.exlen, self.index.xorff, cp,
+                                   min(self.index.interval, MAX_DISTANCE * 0x20))
+            self.chunk_start, self.chunk = cp.out_pos, b''
+        while pos >= self.chunk_start + len(self.chunk):
+            self.chunk_start += len(self.chunk)
+            self.chunk = self.decoder.read_chunk()
+            if not self.chunk:
+                break
+
+    def readinto(self, b):
+        # fill the whole buffer across chunks, so read(n) returns n bytes until the end of data
+        done = 0
+        while done < len(b) and self.pos < self.exlen:
+            if not self.chunk_start <= self.pos < self.chunk_start + len(self.chunk):
+                self._load(self.pos)
+                if not self.chunk_start <= self.pos < self.chunk_start + len(self.chunk):
+                    break
+            start = self.pos - self.chunk_start
+            size = min(len(b) - done, len(self.chunk) - start)
+            b[done:done + size] = self.chunk[start:start + size]
+            self.pos += size
+            done += size
+        return done
+
+    def close(self):
+        if not self.closed:
+            self.f.close()
+        super().close()
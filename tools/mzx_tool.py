@@ -1,123 +1,278 @@
-#!/usr/bin/env python
-# -*- coding:utf-8 -*-
-#
-# Author: Hintay, root-none
-"""
-Decompress one or several MZX files
-or Compress one or several files as MZX
-
-mzx_tool comes with ABSOLUTELY NO WARRANTY.
-"""
-
-import os
-import sys
-import argparse
-import struct
-import shutil
-from pathlib import Path
-from mzx.decomp_mzx0 import mzx0_decompress
-from mzx.comp_mzx0 import mzx0_compress
-import filename_utils
-
-
-def decompress(args):
-    input_path = Path(args.input)
-    xor_flag = args.is_xor
-    folder_path = filename_utils.file_or_folder(input_path, '*.[Mm][Zz][Xx]')
-    output_path = None
-
-    for file_path in folder_path:
-        if file_path.is_dir(): continue
-        if not output_path:
-            output_path = file_path.parent
-            if str(output_path.absolute())==os.path.dirname(__file__):
-                output_path = output_path.joinpath("mzx_decompress")
-            else:
-                output_dir = f'{output_path.stem.replace("_compress","")}_decompress'
-                output_path = output_path.with_name(output_dir)
-            os.makedirs(output_path, exist_ok=True)
-        mzx_name = file_path.stem
-        with file_path.open('rb') as data:
-            head_part = data.read(7)
-            offset = 7 if(head_part == b'LV\x03\x00\x00\t\x00') else 0
-            if (head_part != b'LV\x03\x00\x00\t\x00'):
-                mzx_name += f'.{args.ext}'
-            data.seek(offset)
-            magic, dec_size = struct.unpack('<4sL', data.read(0x8))
-            assert magic==b"\x4D\x5A\x58\x30", f"This file might not be MZX file, magic: {magic}"
-            datablock_size = file_path.stat().st_size - offset - 8
-            status, dec_buf = mzx0_decompress(data, datablock_size, dec_size, xor_flag)
-            if status != "OK":
-                raise Exception("[{0}] {1}".format(file_path, status))
-            out_name = filename_utils.add_suffix(mzx_name,dec_buf.read())
-            dec_buf.seek(0)
-            with output_path.joinpath(out_name).open('wb') as dbf:
-                shutil.copyfileobj(dec_buf, dbf)
-        print(f"decompress {file_path.name} to {out_name}")
-    print(f"Output directory \'{output_path.absolute()}\'")
-
-
-def compress(args):
-    input_path = Path(args.input)
-    xor_flag = args.is_xor
-    folder_path = filename_utils.file_or_folder(input_path, '*')
-    output_path = None
-
-    for file_path in folder_path:
-        if file_path.is_dir(): continue
-        if not output_path:
-            output_path = file_path.parent
-            if str(output_path.absolute())==os.path.dirname(__file__):
-                output_path = output_path.joinpath("mzx_compress")
-            else:
-                output_dir = f'{output_path.stem.replace("_decompress","")}_compress'
-                output_path = output_path.with_name(output_dir)
-            os.makedirs(output_path, exist_ok=True)
-        out_name = file_path.stem + '.mzx'
-        with file_path.open('rb') as data:
-            com_buf = mzx0_compress(data, file_path.stat().st_size, xor_flag)
-            with output_path.joinpath(out_name).open('wb') as cbf:
-                # add special prefix data for atrac file
-                if com_buf[:4] == b"\x52\x49\x46\x46" and\
-                    com_buf[0x8:0x10] == b"\x57\x41\x56\x45\x66\x6D\x74\x20":
-                    cbf.write(b'LV\x03\x00\x00\t\x00')
-                cbf.write(com_buf)
-        print(f"compress {file_path.name} to {out_name}")
-    print(f"Output directory \'{output_path.absolute()}\'")
-
-
-def parse_args():
-    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
-    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
-
-    # decompress
-    parser_decompress = subparsers.add_parser('decompress', help='decompress mzx with/without xor')
-    parser_decompress.add_argument('-x', '--xor', required=True,
-                                   dest='is_xor', type=int,
-                                   help='Decompress with(1) or without(0) xorff')
-    parser_decompress.add_argument('-e', '--ext',
-                                   default='scr', type=str,
-                                   help="Output file extension. Default \'scr\'(for file in allscr).")
-    parser_decompress.add_argument('input', metavar='input_path', help='Input mzx file or folder.')
-
-    # compress
-    parser_compress = subparsers.add_parser('compress', help='compress file with/without xor')
-    parser_compress.add_argument('-x', '--xor', required=True,
-                                 dest='is_xor', type=int,
-                                 help='Compress with(1) or without(0) xorff')
-    parser_compress.add_argument('input', metavar='input_path', help='Input file or folder.')
-
-    return parser, parser.parse_args()
-
-
-if __name__ == "__main__":
-    os.chdir(os.path.dirname(__file__))
-    parser, args = parse_args()
-    if args.subcommand == "decompress":
-        decompress(args)
-    elif args.subcommand == "compress":
-        compress(args)
-    else:
-        parser.print_usage()
-        sys.exit(20)
-    sys.exit(0)
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+#
+# Author: Hintay, root-none
+"""
+Decompress one or several MZX files
+or Compress one or several files as MZX
+or Index one or several MZX files for random access
+or Verify MZX files in a folder or a .mrg/.mzp archive
+
+mzx_tool comes with ABSOLUTELY NO WARRANTY.
+"""
+
+import os
+import sys
+import argparse
+import struct
+from pathlib import Path
+from mzx.decomp_mzx0 import Mzx0Decoder, mzx0_verify, mzx0_detect_xorff, PROBE_SIZE
+from mzx.comp_mzx0 import mzx0_compress, mzx0_compress_parallel, COMPRESS_LEVELS, DEFAULT_LEVEL
+from mzx.index_mzx0 import build_mzx0_index, mzx_layout, index_path_for, DEFAULT_INTERVAL
+from lib.mrgd import MrgArchive
+from lib.batch import run_batch, BatchReport
+import filename_utils
+
+
+def xor_arg(value):
+    # -x 0, -x 1 or -x auto (None)
+    if value == 'auto':
+        return None
+    if value not in ('0', '1'):
+        raise argparse.ArgumentTypeError(f"expect 0, 1 or auto, got \'{value}\'")
+    return int(value)
+
+
+def resolve_xor(xor_flag, data, datablock_size, dec_size):
+    """Keep the -x key, or with auto guess it from the head of the datablock at the current position of data."""
+    if xor_flag is not None:
+        return xor_flag
+    pos = data.tell()
+    head_part = data.read(min(datablock_size, PROBE_SIZE * 2))
+    data.seek(pos)
+    return int(mzx0_detect_xorff(head_part, dec_size))
+
+
+def decompress_file(file_path, output_path, xor_flag, ext):
+    mzx_name = file_path.stem
+    with file_path.open('rb') as data:
+        head_part = data.read(7)
+        offset = 7 if(head_part == b'LV\x03\x00\x00\t\x00') else 0
+        if (head_part != b'LV\x03\x00\x00\t\x00'):
+            mzx_name += f'.{ext}'
+        data.seek(offset)
+        magic, dec_size = struct.unpack('<4sL', data.read(0x8))
+        assert magic==b"\x4D\x5A\x58\x30", f"This file might not be MZX file, magic: {magic}"
+        datablock_size = file_path.stat().st_size - offset - 8
+        xor_flag = resolve_xor(xor_flag, data, datablock_size, dec_size)
+        # stream output straight to disk, only the first chunk is kept for the suffix sniffing
+        decoder = Mzx0Decoder(data, datablock_size, dec_size, xor_flag)
+        first_chunk = decoder.read_chunk()
+        out_name = filename_utils.add_suffix(mzx_name, first_chunk)
+        with output_path.joinpath(out_name).open('wb') as dbf:
+            dbf.write(first_chunk)
+            for chunk in decoder:
+                dbf.write(chunk)
+    return out_name, xor_flag
+
+
+def decompress(args):
+    input_path = Path(args.input)
+    xor_flag = args.is_xor
+    folder_path = sorted(filename_utils.file_or_folder(input_path, '*.[Mm][Zz][Xx]'))
+    folder_path = [file_path for file_path in folder_path if not file_path.is_dir()]
+    if not folder_path: return
+    output_path = folder_path[0].parent
+    if str(output_path.absolute())==os.path.dirname(__file__):
+        output_path = output_path.joinpath("mzx_decompress")
+    else:
+        output_dir = f'{output_path.stem.replace("_compress","")}_decompress'
+        output_path = output_path.with_name(output_dir)
+    os.makedirs(output_path, exist_ok=True)
+
+    report = BatchReport()
+    for file_path, result, error in run_batch(decompress_file, folder_path, args.jobs,
+                                              (output_path, xor_flag, args.ext)):
+        if error:
+            print(f"decompress {file_path.name} failed: {error}", file=sys.stderr)
+        else:
+            out_name, used_xor = result
+            print(f"decompress {file_path.name} to {out_name}" + (f" (xorff {used_xor})" if xor_flag is None else ""))
+        report.add(file_path, error, file_path.stat().st_size)
+    print(f"Output directory \'{output_path.absolute()}\'")
+    print(report.summary('MZX'))
+    return report.failed
+
+
+def compress_file(file_path, output_path, xor_flag, level, chunk_jobs=None):
+    out_name = file_path.stem + '.mzx'
+    with file_path.open('rb') as data:
+        if chunk_jobs is None:
+            com_buf = mzx0_compress(data, file_path.stat().st_size, xor_flag, level)
+        else:
+            # large file split in chunks, compressed by chunk_jobs workers (0 for one per CPU)
+            com_buf = mzx0_compress_parallel(data.read(), xor_flag, level, chunk_jobs or None)
+        with output_path.joinpath(out_name).open('wb') as cbf:
+            # add special prefix data for atrac file
+            if com_buf[:4] == b"\x52\x49\x46\x46" and\
+                com_buf[0x8:0x10] == b"\x57\x41\x56\x45\x66\x6D\x74\x20":
+                cbf.write(b'LV\x03\x00\x00\t\x00')
+            cbf.write(com_buf)
+    return out_name
+
+
+def compress(args):
+    input_path = Path(args.input)
+    xor_flag = args.is_xor
+    folder_path = sorted(filename_utils.file_or_folder(input_path, '*'))
+    folder_path = [file_path for file_path in folder_path if not file_path.is_dir()]
+    if not folder_path: return
+    output_path = folder_path[0].parent
+    if str(output_path.absolute())==os.path.dirname(__file__):
+        output_path = output_path.joinpath("mzx_compress")
+    else:
+        output_dir = f'{output_path.stem.replace("_decompress","")}_compress'
+        output_path = output_path.with_name(output_dir)
+    os.makedirs(output_path, exist_ok=True)
+
+    report = BatchReport()
+    # with --split the workers share the chunks of one file instead of taking one file each
+    file_jobs, chunk_jobs = (1, args.jobs) if args.split else (args.jobs, None)
+    for file_path, out_name, error in run_batch(compress_file, folder_path, file_jobs,
+                                                (output_path, xor_flag, args.level, chunk_jobs)):
+        if error:
+            print(f"compress {file_path.name} failed: {error}", file=sys.stderr)
+        else:
+            print(f"compress {file_path.name} to {out_name}")
+        report.add(file_path, error, file_path.stat().st_size)
+    print(f"Output directory \'{output_path.absolute()}\'")
+    print(report.summary('files'))
+    return report.failed
+
+
+def index(args):
+    input_path = Path(args.input)
+    folder_path = filename_utils.file_or_folder(input_path, '*.[Mm][Zz][Xx]')
+
+    for file_path in folder_path:
+        if file_path.is_dir(): continue
+        with file_path.open('rb') as data:
+            base, datablock_size, dec_size = mzx_layout(data)
+            data.seek(base)
+            xor_flag = resolve_xor(args.is_xor, data, datablock_size, dec_size)
+            mzx_index = build_mzx0_index(data, datablock_size, dec_size, xor_flag, args.interval)
+        idx_path = index_path_for(file_path)
+        mzx_index.save(idx_path)
+        print(f"index {file_path.name} to {idx_path.name}, {len(mzx_index.checkpoints)} checkpoints")
+
+
+def archive_mzx_entries(mrg_path):
+    """Yield (name, offset, size) of the MZX entries of a .mrg (with or without .hed) or .mzp archive."""
+    with MrgArchive(mrg_path, nam_path=False) as mrg_archive:
+        for entry in mrg_archive.entries:
+            head_part = bytes(mrg_archive.view[entry.real_offset:entry.real_offset + 11])
+            offset = 7 if head_part[:7] == b'LV\x03\x00\x00\t\x00' else 0
+            if head_part[offset:offset + 4] == b'MZX0':
+                yield f'{mrg_path.name}[{entry.index}]', entry.real_offset + offset, entry.real_size - offset
+
+
+def verify(args):
+    input_path = Path(args.input)
+    if input_path.is_file() and input_path.suffix.lower() != '.mzx':
+        # .mrg/.mzp archive, verify each MZX entry in place
+        sources = [(input_path, name, offset, size) for name, offset, size in archive_mzx_entries(input_path)]
+    else:
+        sources = []
+        for file_path in filename_utils.file_or_folder(input_path, '*.[Mm][Zz][Xx]'):
+            if file_path.is_dir(): continue
+            with file_path.open('rb') as data:
+                offset = 7 if data.read(7) == b'LV\x03\x00\x00\t\x00' else 0
+            sources.append((file_path, file_path.name, offset, file_path.stat().st_size - offset))
+
+    failed = 0
+    for file_path, name, offset, size in sources:
+        with file_path.open('rb') as data:
+            data.seek(offset)
+            magic, dec_size = struct.unpack('<4sL', data.read(0x8))
+            if magic != b'MZX0':
+                print(f"[{name}] BAD MAGIC {magic}")
+                failed += 1
+                continue
+            try:
+                xor_flag = resolve_xor(args.is_xor, data, size - 8, dec_size)
+                check = mzx0_verify(data, size - 8, dec_size, xor_flag)
+            except Exception as exc:
+                # one broken stream does not stop the scan
+                print(f"[{name}] ERR [{type(exc).__name__}] {exc}")
+                failed += 1
+                continue
+        status = 'ERR' if check.exhausted else 'OK'
+        failed += check.exhausted
+        print(f"[{name}] {status} {check.produced}/{check.dec_size} bytes, "
+              f"input {'exhausted early' if check.exhausted else f'{check.in_consumed}/{size - 8} used'}, "
+              f"sha1 {check.digest}")
+    print(f"{len(sources)} MZX, {len(sources) - failed} OK, {failed} FAILURE")
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand')
+
+    # decompress
+    parser_decompress = subparsers.add_parser('decompress', help='decompress mzx with/without xor')
+    parser_decompress.add_argument('-x', '--xor', required=True,
+                                   dest='is_xor', type=xor_arg,
+                                   help='Decompress with(1) or without(0) xorff, or guess it per file(auto)')
+    parser_decompress.add_argument('-e', '--ext',
+                                   default='scr', type=str,
+                                   help="Output file extension. Default \'scr\'(for file in allscr).")
+    parser_decompress.add_argument('-j', '--jobs',
+                                   default=1, type=int,
+                                   help="Worker processes, 0 for one per CPU. Default \'1\'.")
+    parser_decompress.add_argument('input', metavar='input_path', help='Input mzx file or folder.')
+
+    # compress
+    parser_compress = subparsers.add_parser('compress', help='compress file with/without xor')
+    parser_compress.add_argument('-x', '--xor', required=True,
+                                 dest='is_xor', type=int,
+                                 help='Compress with(1) or without(0) xorff')
+    parser_compress.add_argument('-l', '--level',
+                                 default=DEFAULT_LEVEL, type=int, choices=sorted(COMPRESS_LEVELS),
+                                 help=f"Compress level, 0 only stores literals. Default \'{DEFAULT_LEVEL}\'.")
+    parser_compress.add_argument('-j', '--jobs',
+                                 default=1, type=int,
+                                 help="Worker processes, 0 for one per CPU. Default \'1\'.")
+    parser_compress.add_argument('-s', '--split', action='store_true',
+                                 help="Compress each file as independent chunks over the workers,\n"
+                                      "for large voice/tile files. Output is slightly bigger.")
+    parser_compress.add_argument('input', metavar='input_path', help='Input file or folder.')
+
+    # index
+    parser_index = subparsers.add_parser('index', help='build checkpoint index for random access to mzx')
+    parser_index.add_argument('-x', '--xor', required=True,
+                              dest='is_xor', type=xor_arg,
+                              help='Decompress with(1) or without(0) xorff, or guess it per file(auto)')
+    parser_index.add_argument('-k', '--interval',
+                              default=DEFAULT_INTERVAL, type=lambda x: int(x, 0),
+                              help=f"Decompressed bytes between two checkpoints. Default '{hex(DEFAULT_INTERVAL)}'.")
+    parser_index.add_argument('input', metavar='input_path', help='Input mzx file or folder.')
+
+    # verify
+    parser_verify = subparsers.add_parser('verify', help='check mzx length and hash without writing output')
+    parser_verify.add_argument('-x', '--xor', required=True,
+                               dest='is_xor', type=xor_arg,
+                               help='Decompress with(1) or without(0) xorff, or guess it per file(auto)')
+    parser_verify.add_argument('input', metavar='input_path', help='Input mzx file, folder or .mrg/.mzp archive.')
+
+    return parser, parser.parse_args()
+
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(__file__))
+    parser, args = parse_args()
+    if args.subcommand == "decompress":
+        if decompress(args):
+            sys.exit(1)
+    elif args.subcommand == "compress":
+        if compress(args):
+            sys.exit(1)
+    elif args.subcommand == "index":
+        index(args)
+    elif args.subcommand == "verify":
+        if verify(args):
+            sys.exit(1)
+    else:
+        parser.print_usage()
+        sys.exit(20)
+    sys.exit(0)
@@ -11,16 +11,19 @@ from struct import unpack
 import re
 import argparse
 from mzx.decomp_mzx0 import mzx0_decompress
+from lib.batch import run_batch
 
 
 raw_script_path = Path("10rawscript")
 decoded_script_path = Path("20decodedscript")
 
 
-def process_directory(source_dir_path: Path):
+def process_directory(source_dir_path: Path, jobs=1):
     successful = failed = 0
-    for filepath in source_dir_path.glob('*.[Mm][Zz][Xx]'):
-        if process_path(filepath) != "OK":
+    for filepath, status, error in run_batch(process_path, sorted(source_dir_path.glob('*.[Mm][Zz][Xx]')), jobs):
+        if error:
+            print("ERR: {0} - {1}".format(filepath, error), file=stderr)
+        if status != "OK":
             failed += 1
         else:
             successful += 1
@@ -74,6 +77,7 @@ debugging:
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('input', metavar='input_files', help='Input file or folder.')
+    parser.add_argument('-j', '--jobs', default=1, type=int, help='Worker processes, 0 for one per CPU.')
     args = parser.parse_args()
 
     raw_script_path.mkdir(exist_ok=True, parents=True)
@@ -82,7 +86,7 @@ if __name__ == '__main__':
     input_path = Path(args.input)
     successful = failed = 0
     if input_path.is_dir():
-        successful, failed = process_directory(input_path)
+        successful, failed = process_directory(input_path, args.jobs)
     elif str.lower(input_path.suffix) == '.mzx':
         if process_path(input_path) != "OK":
             failed = 1
@@ -12,8 +12,8 @@
 
 import argparse
 import sys
-import struct
 from pathlib import Path
+from lib.mrgd import MrgArchive
 
 INPUT_FILE_NAME = Path('allscr.mrg')
 MODE = 'fate'
@@ -30,17 +30,6 @@ def parse_args():
         return Path('.')
 
 
-class ArchiveEntry:
-    def __init__(self, sector_offset, offset, sector_size_upper_boundary, size, number_of_entries):
-        self.sector_offset = sector_offset
-        self.offset = offset
-        self.sector_size_upper_boundary = sector_size_upper_boundary
-        self.size = size
-        self.real_size = (sector_size_upper_boundary - 1) // 0x20 * 0x10000 + size
-        data_start_offset = 6 + 2 + number_of_entries * 8
-        self.real_offset = data_start_offset + self.sector_offset * 0x800 + self.offset
-
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('input', metavar='input_files', help='Input file or folder.', nargs='?')
@@ -55,24 +44,20 @@ if __name__ == '__main__':
 
     file_path = input_path.joinpath(INPUT_FILE_NAME)
     if file_path.is_file():
-        input_file = open(file_path, 'rb')
+        input_archive = MrgArchive(file_path, hed_path=False, nam_path=False)
     else:
         print("allscr.mrg not found. Please pass the path to the folder it is located in.")
         sys.exit(1)
 
-    header = input_file.read(6)
-    print('header: {0}'.format(header.decode('ASCII')))
+    print('header: {0}'.format(bytes(input_archive.view[:6]).decode('ASCII')))
 
-    number_of_entries, = struct.unpack('<H', input_file.read(2))
+    number_of_entries = input_archive.record_count
 
     print('found {0} entries'.format(number_of_entries))
-    entries_descriptors = []
-    for i in range(number_of_entries):
-        sector_offset, offset, sector_size_upper_boundary, size = struct.unpack('<HHHH', input_file.read(8))
-        entries_descriptors.append(
-            ArchiveEntry(sector_offset=sector_offset, offset=offset, sector_size_upper_boundary=sector_size_upper_boundary,
-                        size=size, number_of_entries=number_of_entries))
+    entries_descriptors = input_archive.entries
 
+    # script names are stored in the first entry, 32 bytes each
+    names_data = input_archive.read(entries_descriptors[0])
     file_names = ['allscr.nam', 'unknownX.mrg', 'unknownX2.mrg']
     for i in range(number_of_entries):
         file_name = ''
@@ -88,7 +73,7 @@ if __name__ == '__main__':
                 elif 604 <= i <= 705:
                     file_name = '凛ルート十'
 
-            file_name_bytes, = struct.unpack('<32s', input_file.read(32))
+            file_name_bytes = bytes(names_data[i * 32:i * 32 + 32])
             file_name_bytes = file_name_bytes.replace(b'\x01', b'')
             file_name = file_name + file_name_bytes[0:file_name_bytes.index(b'\x00')].decode('932', 'ignore')
         if not file_name:
@@ -100,12 +85,11 @@ if __name__ == '__main__':
         output_dir.mkdir()
 
     for index, entry in enumerate(entries_descriptors):
-        input_file.seek(entry.real_offset)
-        data = input_file.read(entry.real_size)
+        data = input_archive.read(entry)
         output_file_name = output_dir.joinpath(file_names[index])
         print(output_file_name.name, file=sys.stderr)
         output_file = open(output_file_name, 'wb')
         output_file.write(data)
         output_file.close()
 
-    input_file.close()
+    input_archive.close()